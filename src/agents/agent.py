@@ -5,6 +5,7 @@ from logging import Logger
 from abc import abstractmethod
 from models import AgentConfiguration
 from models import AgentResponse
+from models import Conversation
 
 class Agent():
     """Base class for agents"""
@@ -14,12 +15,12 @@ class Agent():
     ) -> None:
         self._logger: Logger = logger
         self._agent_configuration: AgentConfiguration = agent_configuration
-        self._conversation: list = [
+        self._conversation: Conversation = Conversation(preamble=[
                 { "role": "system", "content": self._agent_configuration.persona },
                 { "role": "assistant", "content": self._agent_configuration.initial_message }
             ] if self._agent_configuration.initial_message is not None else [
                 { "role": "system", "content": self._agent_configuration.persona }
-            ]
+            ])
 
     @abstractmethod
     def run(self, user_input: str | None, conversation=None, stream=False) -> AgentResponse:
@@ -1,3 +1,6 @@
 """The main module for agents."""
 from agent import Agent
+from image_pipeline import ImagePipeline, ImageVariant, PreparedImage
+from context_builder import ContextBuilder, PromptCompaction, TokenCounter
+from answer_cache import SemanticAnswerCache
 from smart_agent.smart_agent import Smart_Agent
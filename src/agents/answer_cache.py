@@ -0,0 +1,116 @@
+import threading
+import time
+from dataclasses import dataclass
+from logging import Logger
+from typing import Dict, List
+import numpy as np
+
+@dataclass
+class AnswerIndex:
+    """Cached questions of one agent configuration, as rows of a matrix of unit embeddings"""
+    version: str
+    embeddings: np.ndarray
+    expires_at: np.ndarray
+    questions: List[str | None]
+    answers: List[str | None]
+    # next row to write; rows are reused oldest first once the index is full
+    cursor: int = 0
+    size: int = 0
+    hits: int = 0
+    misses: int = 0
+
+class SemanticAnswerCache:
+    """In-memory cache of final answers, looked up by the similarity of the question.
+
+    Each agent configuration has its own index, a float32 matrix of normalized question embeddings
+    searched with a single matrix-vector product. An answer is returned when the cosine similarity of
+    the closest unexpired question reaches `threshold`. An index is dropped as soon as it is used with
+    another version of its configuration, so answers never outlive the prompt that produced them.
+    """
+
+    def __init__(
+            self,
+            threshold: float = 0.95,
+            ttl: float = 3600.0,
+            max_entries: int = 1024,
+            logger: Logger | None = None,
+        ) -> None:
+        self.__threshold: float = threshold
+        self.__ttl: float = ttl
+        self.__max_entries: int = max_entries
+        self.__logger: Logger = logger or Logger(name="answer_cache")
+        self.__lock: threading.Lock = threading.Lock()
+        self.__indexes: Dict[str, AnswerIndex] = {}
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            namespace: {"hits": index.hits, "misses": index.misses, "entries": index.size}
+            for namespace, index in self.__indexes.items()}
+
+    def lookup(self, namespace: str, version: str, embedding: List[float]) -> str | None:
+        """Return the answer cached for the question closest to `embedding`, or None"""
+        query: np.ndarray | None = self.__normalize(embedding=embedding)
+        with self.__lock:
+            index: AnswerIndex | None = self.__index(namespace=namespace, version=version, dimensions=None)
+            if index is None or query is None:
+                return None
+            row: int | None = self.__closest(index=index, query=query)
+            if row is None:
+                index.misses += 1
+                return None
+            index.hits += 1
+            return index.answers[row]
+
+    def store(self, namespace: str, version: str, question: str, embedding: List[float], answer: str) -> None:
+        """Cache the answer to `question`, replacing the answer to a question similar enough to match it"""
+        vector: np.ndarray | None = self.__normalize(embedding=embedding)
+        if vector is None:
+            return
+        with self.__lock:
+            index: AnswerIndex = self.__index(namespace=namespace, version=version, dimensions=len(vector))
+            row: int | None = self.__closest(index=index, query=vector)
+            if row is None:
+                row = index.cursor
+                index.cursor = (index.cursor + 1) % self.__max_entries
+                index.size = min(index.size + 1, self.__max_entries)
+            index.embeddings[row] = vector
+            index.expires_at[row] = time.monotonic() + self.__ttl
+            index.questions[row] = question
+            index.answers[row] = answer
+
+    def invalidate(self, namespace: str) -> None:
+        with self.__lock:
+            self.__indexes.pop(namespace, None)
+
+    def __index(self, namespace: str, version: str, dimensions: int | None) -> AnswerIndex | None:
+        index: AnswerIndex | None = self.__indexes.get(namespace)
+        if index is not None and (index.version != version or (
+                dimensions is not None and index.embeddings.shape[1] != dimensions)):
+            self.__logger.info(msg=f"Dropping the cached answers of {namespace}, its configuration changed")
+            del self.__indexes[namespace]
+            index = None
+        if index is None and dimensions is not None:
+            index = AnswerIndex(
+                version=version,
+                embeddings=np.zeros(shape=(self.__max_entries, dimensions), dtype=np.float32),
+                expires_at=np.zeros(shape=self.__max_entries, dtype=np.float64),
+                questions=[None] * self.__max_entries,
+                answers=[None] * self.__max_entries,
+            )
+            self.__indexes[namespace] = index
+        return index
+
+    def __closest(self, index: AnswerIndex, query: np.ndarray) -> int | None:
+        if index.size == 0 or index.embeddings.shape[1] != len(query):
+            return None
+        similarities: np.ndarray = index.embeddings[:index.size] @ query
+        similarities[index.expires_at[:index.size] < time.monotonic()] = -np.inf
+        row: int = int(np.argmax(similarities))
+        return row if similarities[row] >= self.__threshold else None
+
+    @staticmethod
+    def __normalize(embedding: List[float]) -> np.ndarray | None:
+        vector: np.ndarray = np.asarray(embedding, dtype=np.float32)
+        norm: float = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
@@ -0,0 +1,238 @@
+import json
+from dataclasses import dataclass
+from logging import Logger
+from typing import Any, Dict, List, Tuple
+from models import Conversation, message_content, message_role
+from image_pipeline import IMAGE_REF
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional, tokens are then estimated from the length of the text
+    tiktoken = None
+
+# tokens the chat API adds around every message and to prime the reply
+TOKENS_PER_MESSAGE: int = 3
+TOKENS_PER_REPLY: int = 3
+# cost of an image at the low detail level, and of a page at the high level (four 512px tiles)
+LOW_DETAIL_IMAGE_TOKENS: int = 85
+HIGH_DETAIL_IMAGE_TOKENS: int = 765
+CHARACTERS_PER_TOKEN: int = 4
+
+REMOVED_TOOL_OUTPUT: str = "The output of this tool call was removed to fit the context."
+REMOVED_IMAGE: str = "[image removed to fit the context]"
+DUPLICATE_IMAGE: str = "[this page is shown above]"
+# content parts that are sent as images
+IMAGE_PARTS: Tuple[str, ...] = ("image_url", IMAGE_REF)
+
+@dataclass
+class PromptCompaction:
+    """Image parts left out of a prompt by compaction and the bytes of their data URLs"""
+    image_parts: int = 0
+    image_bytes: int = 0
+
+class TokenCounter:
+    """Counts the prompt tokens of chat messages.
+
+    Text is counted with tiktoken when it is installed and estimated at four characters per token
+    otherwise. Images are counted at the fixed cost of their detail level, never by their data URL.
+    """
+
+    def __init__(self, model: str | None = None) -> None:
+        self.__encoding = None
+        if tiktoken is not None:
+            try:
+                self.__encoding = tiktoken.encoding_for_model(model_name=model or "")
+            except KeyError:
+                # deployment names rarely match a model name
+                self.__encoding = tiktoken.get_encoding(encoding_name="o200k_base")
+
+    def text(self, text: str | None) -> int:
+        if not text:
+            return 0
+        if self.__encoding is None:
+            return (len(text) + CHARACTERS_PER_TOKEN - 1) // CHARACTERS_PER_TOKEN
+        return len(self.__encoding.encode(text, disallowed_special=()))
+
+    def image(self, image_url: Dict[str, Any]) -> int:
+        return LOW_DETAIL_IMAGE_TOKENS if image_url.get("detail") == "low" else HIGH_DETAIL_IMAGE_TOKENS
+
+    def content(self, content: Any) -> int:
+        if content is None:
+            return 0
+        if not isinstance(content, list):
+            return self.text(text=str(content))
+        tokens: int = 0
+        for part in content:
+            if part.get("type") in IMAGE_PARTS:
+                # a reference costs what the image it stands for does
+                tokens += self.image(image_url=part.get(part["type"]) or {})
+            else:
+                tokens += self.text(text=part.get("text"))
+        return tokens
+
+    def message(self, message: Any) -> int:
+        tokens: int = TOKENS_PER_MESSAGE + self.content(content=message_content(message=message))
+        tool_calls: Any = message.get("tool_calls") if isinstance(message, dict) else getattr(message, "tool_calls", None)
+        for tool_call in tool_calls or []:
+            function: Any = tool_call["function"] if isinstance(tool_call, dict) else tool_call.function
+            name, arguments = (function["name"], function["arguments"]) if isinstance(function, dict) else (function.name, function.arguments)
+            tokens += TOKENS_PER_MESSAGE + self.text(text=name) + self.text(text=arguments)
+        return tokens
+
+    def messages(self, messages: List[Any]) -> int:
+        return sum(self.message(message=message) for message in messages) + TOKENS_PER_REPLY
+
+    def tools(self, tools: List[Any] | None) -> int:
+        return self.text(text=json.dumps(tools)) if tools else 0
+
+class ContextBuilder:
+    """Assembles the messages of a request within a prompt token budget.
+
+    Images are only sent for the last `max_turns_with_images` questions; earlier tool outputs keep
+    the file names and hints of their pages. A page returned again within a question is sent once.
+    When the conversation does not fit, the tool outputs of earlier questions are removed first,
+    then earlier questions are dropped whole, oldest first, and finally the images and then the
+    outputs of the earlier tool calls of the current question. Tool messages are replaced rather
+    than removed, since every tool call must keep its response. The conversation is not modified.
+    """
+
+    def __init__(
+            self,
+            max_prompt_tokens: int | None = None,
+            max_turns_with_images: int | None = 1,
+            deduplicate_images: bool = True,
+            token_counter: TokenCounter | None = None,
+            logger: Logger | None = None,
+        ) -> None:
+        self.__max_prompt_tokens: int | None = max_prompt_tokens
+        self.__max_turns_with_images: int | None = max_turns_with_images
+        self.__deduplicate_images: bool = deduplicate_images
+        self.__token_counter: TokenCounter = token_counter or TokenCounter()
+        self.__logger: Logger = logger or Logger(name="context_builder")
+
+    @property
+    def token_counter(self) -> TokenCounter:
+        return self.__token_counter
+
+    def build(
+            self,
+            conversation: Conversation,
+            reserved_tokens: int = 0,
+            compaction: PromptCompaction | None = None) -> Tuple[List[Any], int]:
+        """Return the messages to send and their token count; `reserved_tokens` are taken by the tools.
+
+        The images left out are added to `compaction` when it is given.
+        """
+        preamble: List[Any] = list(conversation.preamble)
+        turns: List[List[Any]] = [list(turn.messages) for turn in conversation.turns]
+        if self.__max_turns_with_images is not None or self.__deduplicate_images:
+            self.__compact(turns=turns, compaction=compaction if compaction is not None else PromptCompaction())
+        counts: List[List[int]] = [[self.__token_counter.message(message=message) for message in turn] for turn in turns]
+        tokens: int = (
+            sum(self.__token_counter.message(message=message) for message in preamble)
+            + sum(sum(turn_counts) for turn_counts in counts) + TOKENS_PER_REPLY + reserved_tokens)
+
+        if self.__max_prompt_tokens is not None and tokens > self.__max_prompt_tokens:
+            tokens = self.__fit(turns=turns, counts=counts, tokens=tokens)
+
+        return preamble + [message for turn in turns for message in turn], tokens - reserved_tokens
+
+    def __compact(self, turns: List[List[Any]], compaction: PromptCompaction) -> None:
+        """Leave out the images of earlier questions and the pages already sent for the same question"""
+        for turn_index, turn in enumerate(turns):
+            keep_images: bool = (
+                self.__max_turns_with_images is None or turn_index >= len(turns) - self.__max_turns_with_images)
+            sent: set[str] = set()
+            for index, message in enumerate(turn):
+                content: Any = message_content(message=message)
+                if message_role(message=message) != "tool" or not isinstance(content, list):
+                    continue
+                parts: List[Dict[str, Any]] = []
+                removed: int = compaction.image_parts
+                for part in content:
+                    if part.get("type") not in IMAGE_PARTS:
+                        parts.append(part)
+                        continue
+                    key: str = self.__image_key(part=part)
+                    if keep_images and not (self.__deduplicate_images and key in sent):
+                        sent.add(key)
+                        parts.append(part)
+                        continue
+                    compaction.image_parts += 1
+                    compaction.image_bytes += self.__image_size(part=part)
+                    if keep_images:
+                        parts.append({"type": "text", "text": DUPLICATE_IMAGE})
+                if compaction.image_parts > removed:
+                    turn[index] = {**message, "content": parts}
+
+    @staticmethod
+    def __image_key(part: Dict[str, Any]) -> str:
+        if part["type"] == IMAGE_REF:
+            return f"{part[IMAGE_REF]['path']}:{part[IMAGE_REF]['digest']}"
+        return part["image_url"]["url"]
+
+    @staticmethod
+    def __image_size(part: Dict[str, Any]) -> int:
+        if part["type"] == IMAGE_REF:
+            return part[IMAGE_REF].get("size", 0)
+        return len(part["image_url"]["url"])
+
+    def __fit(self, turns: List[List[Any]], counts: List[List[int]], tokens: int) -> int:
+        earlier_turns: range = range(len(turns) - 1)
+        # the tool outputs of earlier questions
+        for turn_index in earlier_turns:
+            tokens = self.__replace_tool_outputs(turn=turns[turn_index], counts=counts[turn_index], tokens=tokens, keep_last=False)
+            if tokens <= self.__max_prompt_tokens:
+                return tokens
+
+        # earlier questions, oldest first
+        while len(turns) > 1 and tokens > self.__max_prompt_tokens:
+            turns.pop(0)
+            tokens -= sum(counts.pop(0))
+        if tokens <= self.__max_prompt_tokens or len(turns) == 0:
+            return tokens
+
+        # the images, then the outputs, of the earlier tool calls of the current question
+        for strip_images in [True, False]:
+            tokens = self.__replace_tool_outputs(
+                turn=turns[-1], counts=counts[-1], tokens=tokens, keep_last=True, strip_images=strip_images)
+            if tokens <= self.__max_prompt_tokens:
+                return tokens
+
+        self.__logger.warning(msg=f"The prompt takes {tokens} tokens, over the budget of {self.__max_prompt_tokens}")
+        return tokens
+
+    def __replace_tool_outputs(
+            self,
+            turn: List[Any],
+            counts: List[int],
+            tokens: int,
+            keep_last: bool,
+            strip_images: bool = False) -> int:
+        """Replace the tool outputs of a turn, oldest first, until the prompt fits the budget"""
+        tool_indices: List[int] = [index for index, message in enumerate(turn) if message_role(message=message) == "tool"]
+        if keep_last:
+            # the outputs of the last tool iteration are what the model is about to read
+            last_request: int = max(
+                (index for index, message in enumerate(turn) if message_role(message=message) == "assistant"), default=-1)
+            tool_indices = [index for index in tool_indices if index < last_request]
+
+        for index in tool_indices:
+            if tokens <= self.__max_prompt_tokens:
+                break
+            message: Dict[str, Any] = dict(turn[index])
+            content: Any = message.get("content")
+            if strip_images:
+                if isinstance(content, str):
+                    continue
+                message["content"] = [
+                    {"type": "text", "text": REMOVED_IMAGE} if part.get("type") in IMAGE_PARTS else part for part in content]
+            elif content == REMOVED_TOOL_OUTPUT:
+                continue
+            else:
+                message["content"] = REMOVED_TOOL_OUTPUT
+
+            count: int = self.__token_counter.message(message=message)
+            tokens -= counts[index] - count
+            counts[index] = count
+            turn[index] = message
+        return tokens
@@ -0,0 +1,164 @@
+import base64
+import hashlib
+import io
+import mimetypes
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from logging import Logger
+from typing import Dict, Literal, Tuple
+try:
+    from PIL import Image
+except ImportError:  # pillow is optional, images are then sent as they were rendered
+    Image = None
+
+# largest image the model reads at the fixed cost of the `low` detail level
+LOW_DETAIL_MAX_DIMENSION: int = 512
+# content part that stands for a page image in stored messages, replaced by the image when sent
+IMAGE_REF: str = "image_ref"
+
+@dataclass(frozen=True)
+class ImageVariant:
+    """How a page image is prepared for the model.
+
+    `detail` is the vision detail level to request; `auto` picks `low` for images that fit in
+    512x512 after resizing and `high` for larger ones.
+    """
+    max_dimension: int = 1024
+    format: Literal["JPEG", "PNG", "WEBP"] = "JPEG"
+    quality: int = 85
+    detail: Literal["auto", "low", "high"] = "auto"
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """A page image ready to be sent as an `image_url` content part"""
+    digest: str
+    url: str
+    detail: str
+
+    def to_image_url(self) -> Dict[str, str]:
+        return {"url": self.url, "detail": self.detail}
+
+    def to_image_ref(self, path: str) -> Dict[str, str]:
+        """Reference to the page image at `path` under the image directory, a few dozen bytes instead of the data URL"""
+        return {"path": path, "digest": self.digest, "detail": self.detail, "size": len(self.url)}
+
+class ImagePipeline:
+    """Downsizes and recompresses page images and memoizes their data URLs.
+
+    Prepared images are kept in a bounded LRU keyed by path and variant. An entry is only reused
+    while the digest of the source bytes matches, so a page rendered again is prepared again.
+    """
+
+    def __init__(
+            self,
+            variant: ImageVariant | None = None,
+            max_entries: int = 256,
+            logger: Logger | None = None,
+        ) -> None:
+        self.__variant: ImageVariant = variant or ImageVariant()
+        self.__max_entries: int = max_entries
+        self.__logger: Logger = logger or Logger(name="image_pipeline")
+        self.__lock: threading.Lock = threading.Lock()
+        self.__entries: OrderedDict[Tuple[str, ImageVariant], PreparedImage] = OrderedDict()
+        self.__hits: int = 0
+        self.__misses: int = 0
+
+    @property
+    def variant(self) -> ImageVariant:
+        return self.__variant
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.__hits, "misses": self.__misses, "entries": len(self.__entries)}
+
+    def cached(self, path: str, digest: str, variant: ImageVariant | None = None) -> PreparedImage | None:
+        """Return the prepared image at `path` if it was prepared from the content with `digest`, or None"""
+        key: Tuple[str, ImageVariant] = (path, variant or self.__variant)
+        with self.__lock:
+            prepared: PreparedImage | None = self.__entries.get(key)
+            if prepared is None or prepared.digest != digest:
+                return None
+            self.__entries.move_to_end(key=key)
+            self.__hits += 1
+            return prepared
+
+    def prepare(self, path: str, data: bytes | memoryview, variant: ImageVariant | None = None) -> PreparedImage:
+        """Return the data URL and detail level of the image at `path` whose content is `data`"""
+        variant = variant or self.__variant
+        key: Tuple[str, ImageVariant] = (path, variant)
+        digest: str = hashlib.sha256(data).hexdigest()
+        with self.__lock:
+            prepared: PreparedImage | None = self.__entries.get(key)
+            if prepared is not None and prepared.digest == digest:
+                self.__entries.move_to_end(key=key)
+                self.__hits += 1
+                return prepared
+            self.__misses += 1
+
+        prepared = self.__prepare(path=path, data=data, digest=digest, variant=variant)
+        with self.__lock:
+            self.__entries[key] = prepared
+            self.__entries.move_to_end(key=key)
+            while len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)
+        return prepared
+
+    def __prepare(self, path: str, data: bytes | memoryview, digest: str, variant: ImageVariant) -> PreparedImage:
+        if Image is not None:
+            try:
+                encoded, mime_type, size = self.__encode(data=data, variant=variant)
+                return PreparedImage(
+                    digest=digest,
+                    url=self.__data_url(data=encoded, mime_type=mime_type),
+                    detail=self.__detail(size=size, variant=variant))
+            except Exception as e:
+                self.__logger.error(msg=f"Failed to prepare image {path}, sending it unchanged: {e}")
+
+        return PreparedImage(
+            digest=digest,
+            url=self.__data_url(data=data, mime_type=self.__mime_type(path=path, data=data)),
+            detail=variant.detail)
+
+    def __encode(self, data: bytes | memoryview, variant: ImageVariant) -> Tuple[bytes | memoryview, str, Tuple[int, int]]:
+        with Image.open(io.BytesIO(data)) as image:
+            source_format: str | None = image.format
+            resized: bool = max(image.size) > variant.max_dimension
+            if resized:
+                image.thumbnail(size=(variant.max_dimension, variant.max_dimension), resample=Image.Resampling.LANCZOS)
+            if variant.format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert(mode="RGB")
+            size: Tuple[int, int] = image.size
+
+            output = io.BytesIO()
+            if variant.format == "PNG":
+                image.save(output, format=variant.format, optimize=False)
+            else:
+                image.save(output, format=variant.format, quality=variant.quality)
+
+        # recompressing a small page can make it larger; keep the rendered file then
+        if not resized and source_format is not None and output.tell() >= len(data):
+            return data, Image.MIME.get(source_format, "image/png"), size
+        return output.getvalue(), Image.MIME[variant.format], size
+
+    @staticmethod
+    def __detail(size: Tuple[int, int], variant: ImageVariant) -> str:
+        if variant.detail != "auto":
+            return variant.detail
+        return "low" if max(size) <= LOW_DETAIL_MAX_DIMENSION else "high"
+
+    @staticmethod
+    def __mime_type(path: str, data: bytes | memoryview) -> str:
+        header: bytes = bytes(data[:8])
+        if header.startswith(b"\x89PNG"):
+            return "image/png"
+        if header.startswith(b"\xff\xd8"):
+            return "image/jpeg"
+        if header.startswith(b"RIFF"):
+            return "image/webp"
+        mime_type, _ = mimetypes.guess_type(url=path)
+        return mime_type or "image/png"
+
+    @staticmethod
+    def __data_url(data: bytes | memoryview, mime_type: str) -> str:
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode(encoding='utf-8')}"
@@ -1,21 +1,44 @@
-import base64
+import asyncio
 import inspect
 import json
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait
 from logging import Logger
 from types import MappingProxyType
-from typing import List
+from typing import Any, AsyncIterator, Dict, Iterator, List, Tuple
 import fsspec.implementations
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from openai.types.chat.chat_completion import ChatCompletion
+from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
 from openai.types.chat.chat_completion_message import ChatCompletionMessage
-from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
 from agent import Agent
-from models import AgentConfiguration, AgentResponse
-from functions import SearchVectorFunction
+from image_pipeline import IMAGE_REF, ImagePipeline, PreparedImage
+from context_builder import ContextBuilder, PromptCompaction
+from answer_cache import SemanticAnswerCache
+from models import AgentConfiguration, AgentResponse, Conversation
+from functions import SearchFunction, GraphSearchFunction
+from services import RateLimiter
 import os
 import fsspec
 from openai.types.chat.chat_completion_tool_param import ChatCompletionToolParam
 
+# shared by every agent that is not given an executor, created on first use so a process that
+# injects the executor of its ResourceRegistry never starts a second pool
+DEFAULT_TOOL_EXECUTOR: Executor | None = None
+DEFAULT_TOOL_EXECUTOR_LOCK: threading.Lock = threading.Lock()
+DEFAULT_IMAGE_PIPELINE: ImagePipeline = ImagePipeline()
+UNAVAILABLE_IMAGE: str = "[image unavailable]"
+
+def default_tool_executor() -> Executor:
+    """Bounded thread pool of the agents that are not given one"""
+    global DEFAULT_TOOL_EXECUTOR
+    with DEFAULT_TOOL_EXECUTOR_LOCK:
+        if DEFAULT_TOOL_EXECUTOR is None:
+            DEFAULT_TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="smart_agent_tool")
+        return DEFAULT_TOOL_EXECUTOR
+
 class Smart_Agent(Agent):
     """Smart agent that uses the pulls data from a vector database and uses the Azure OpenAI API to generate responses"""
 
@@ -24,119 +47,529 @@ class Smart_Agent(Agent):
             logger: Logger,
             agent_configuration: AgentConfiguration,
             client: AzureOpenAI,
-            search_vector_function: SearchVectorFunction,
+            search_vector_function: SearchFunction,
             init_history: List[dict],
             fs: fsspec.AbstractFileSystem,
             max_run_per_question: int = 10,
             max_question_to_keep: int = 3,
             max_question_with_detail_hist: int = 1,
             image_directory: str = "images",
+            functions_spec: List[ChatCompletionToolParam] | None = None,
+            async_client: AsyncAzureOpenAI | None = None,
+            tool_executor: Executor | None = None,
+            tool_timeout: float = 60.0,
+            batch_search: bool = True,
+            image_pipeline: ImagePipeline | None = None,
+            context_builder: ContextBuilder | None = None,
+            answer_cache: SemanticAnswerCache | None = None,
+            answer_cache_version: str = "",
+            answer_cache_namespace: str | None = None,
+            graph_search_function: GraphSearchFunction | None = None,
+            rate_limiter: RateLimiter | None = None,
     ) -> None:
         super().__init__(logger=logger, agent_configuration=agent_configuration)
 
         self.__client: AzureOpenAI = client
+        self.__async_client: AsyncAzureOpenAI | None = async_client
         self.__max_run_per_question: int = max_run_per_question
         self.__max_question_to_keep: int = max_question_to_keep
         self.__max_question_with_detail_hist: int = max_question_with_detail_hist
-        self.__functions_spec: List[ChatCompletionToolParam] = [
-            tool.to_openai_tool() for tool in self._agent_configuration.tools]
-        if len(init_history) >0: #initialize the conversation with the history
-            self._conversation = init_history
+        if len(init_history) >0: #continue the conversation after the persona and initial message
+            self._conversation.extend(init_history)
         self._functions_list = {
             "search": search_vector_function.search
         }
+        self._async_functions_list = {
+            "search": search_vector_function.asearch
+        }
+        if graph_search_function is not None:
+            self._functions_list["graph_search"] = graph_search_function.search
+            self._async_functions_list["graph_search"] = graph_search_function.asearch
+        # only offer the model the tools this agent can run
+        self.__functions_spec: List[ChatCompletionToolParam] = [
+            tool for tool in (functions_spec if functions_spec is not None else [
+                tool.to_openai_tool() for tool in self._agent_configuration.tools])
+            if tool["function"]["name"] in self._functions_list]
+        self.__search_vector_function: SearchFunction = search_vector_function
+        self.__batch_search: bool = batch_search
         self.__fs: fsspec.AbstractFileSystem = fs
         self.__image_directory: str = image_directory
+        self.__tool_executor: Executor = tool_executor if tool_executor is not None else default_tool_executor()
+        self.__tool_timeout: float = tool_timeout
+        self.__image_pipeline: ImagePipeline = image_pipeline or DEFAULT_IMAGE_PIPELINE
+        self.__question: dict | None = None
+        self.__context_builder: ContextBuilder = context_builder or ContextBuilder()
+        self.__tools_tokens: int = self.__context_builder.token_counter.tools(tools=self.__functions_spec)
+        self.__prompt_tokens: List[int] = []
+        self.__removed_image_parts: List[int] = []
+        self.__removed_image_bytes: List[int] = []
+        # answers to first questions are shared by every session of the same configuration version
+        self.__answer_cache: SemanticAnswerCache | None = answer_cache
+        self.__answer_cache_version: str = answer_cache_version
+        # the registered name of the configuration, as several configurations may share a yaml name
+        self.__answer_cache_namespace: str = (
+            answer_cache_namespace if answer_cache_namespace is not None else self._agent_configuration.name)
+        self.__question_embedding: List[float] | None = None
+        self.__rate_limiter: RateLimiter | None = rate_limiter
+
     def clean_up_history(self, max_q_with_detail_hist=1, max_q_to_keep=2) -> None:
         """Clean up the history"""
+        self._conversation.strip_detail(max_turns_with_detail=max_q_with_detail_hist)
+        # the questions to keep include the one being asked
+        self._conversation.trim(max_turns=max_q_to_keep - 1)
 
-        question_count=0
-        removal_indices=[]
+    def reset_history_to_last_question(self) -> None:
+        """Reset the history to the last question"""
+        self._conversation.reset_to_last_question()
 
-        for idx in range(len(self._conversation)-1, 0, -1):
-            message = dict(self._conversation[idx])
+    def run(self, user_input: str | None, conversation=None, stream=False) -> AgentResponse:
+        if user_input is None or len(user_input)==0:  # if no input return init message
+            return AgentResponse(conversation=self._conversation.messages(), response=self._conversation[1]["content"])
 
-            if message.get("role") == "user":
-                question_count +=1
+        self.__start_question(user_input=user_input, conversation=conversation)
+        cached_answer: str | None = self.__cached_answer(user_input=user_input)
+        if cached_answer is not None:
+            return self.__cached_response(answer=cached_answer, stream=stream)
+        run_count = 0
 
-            if question_count>= max_q_with_detail_hist and question_count < max_q_to_keep:
-                if message.get("role") != "user" \
-                    and message.get("role") != "assistant" \
-                        and len(message.get("content") or []) == 0:
-                    removal_indices.append(idx)
+        while True:
+            response_message: ChatCompletionMessage
 
-            if question_count >= max_q_to_keep:
-                removal_indices.append(idx)
-        # remove items with indices in removal_indices
-        for index in removal_indices:
-            del self._conversation[index]
+            if run_count >= self.__max_run_per_question:
+                response_message = self.__max_run_count_message(run_count=run_count)
+                break
 
+            response: ChatCompletion = self.__create_completion(**self.__completion_args())
 
-    def reset_history_to_last_question(self) -> None:
-        """Reset the history to the last question"""
+            run_count += 1
+            response_message = self.__response_message(response=response)
+            tool_calls: List[ChatCompletionMessageToolCall] | None = response_message.tool_calls
 
-        
-        for i in range(len(self._conversation)-1, -1, -1):
-            message = dict(self._conversation[i])   
-            
-            if message.get("role") == "user":
+            if tool_calls:
+                self._conversation.append(response_message)
+                self.__verify_openai_tools(tool_calls=tool_calls)
+                continue
+            else:
+                self.__cache_answer(answer=response_message.content)
                 break
-            
-            self._conversation.pop()
 
+        self.__append_answer(content=response_message.content)
+        return AgentResponse(
+            streaming=stream,
+            conversation=self._conversation.messages(),
+            response=response_message.content,
+            prompt_tokens=list(self.__prompt_tokens),
+            removed_image_parts=list(self.__removed_image_parts),
+            removed_image_bytes=list(self.__removed_image_bytes),
+        )
 
-    def run(self, user_input: str | None, conversation=None, stream=False) -> AgentResponse:
-        if user_input is None or len(user_input)==0:  # if no input return init message
-            return AgentResponse(conversation=self._conversation, response=self._conversation[1]["content"])
+    async def arun(self, user_input: str | None, conversation=None, stream=False) -> AgentResponse:
+        """Asynchronous counterpart of run that never blocks the event loop on I/O"""
+        if self.__async_client is None:
+            return await asyncio.to_thread(self.run, user_input=user_input, conversation=conversation, stream=stream)
 
-        if conversation is not None and len(conversation) > 0:
-            self._conversation = conversation
+        if user_input is None or len(user_input)==0:  # if no input return init message
+            return AgentResponse(conversation=self._conversation.messages(), response=self._conversation[1]["content"])
 
+        self.__start_question(user_input=user_input, conversation=conversation)
+        cached_answer: str | None = await self.__acached_answer(user_input=user_input)
+        if cached_answer is not None:
+            return self.__cached_response(answer=cached_answer, stream=stream)
         run_count = 0
 
-        self._conversation.append({"role": "user", "content": user_input})
-        self.clean_up_history(
-            max_q_with_detail_hist=self.__max_question_with_detail_hist, max_q_to_keep=self.__max_question_to_keep)
-
         while True:
             response_message: ChatCompletionMessage
 
             if run_count >= self.__max_run_per_question:
-                self._logger.debug(
-                    msg=f"Need to move on from this question due to max run count reached ({run_count} runs)")
-                response_message = ChatCompletionMessage(
-                    role="assistant",
-                    content="I am unable to answer this question at the moment, please ask another question."
-                )
+                response_message = self.__max_run_count_message(run_count=run_count)
                 break
 
-            response: ChatCompletion = self.__client.chat.completions.create(
-                model=self._agent_configuration.model,
-                messages=self._conversation,
-                tools=self.__functions_spec,
-                tool_choice='auto',
-                temperature=0.2,
-            )
+            response: ChatCompletion = await self.__acreate_completion(**await self.__acompletion_args())
 
             run_count += 1
-            response_message = response.choices[0].message
-
-            if response_message.content is None:
-                response_message.content = ""
-
+            response_message = self.__response_message(response=response)
             tool_calls: List[ChatCompletionMessageToolCall] | None = response_message.tool_calls
 
             if tool_calls:
                 self._conversation.append(response_message)
-                self.__verify_openai_tools(tool_calls=tool_calls)
+                await self.__averify_openai_tools(tool_calls=tool_calls)
                 continue
             else:
+                self.__cache_answer(answer=response_message.content)
                 break
 
+        self.__append_answer(content=response_message.content)
         return AgentResponse(
             streaming=stream,
-            conversation=self._conversation,
-            response=response_message.content
+            conversation=self._conversation.messages(),
+            response=response_message.content,
+            prompt_tokens=list(self.__prompt_tokens),
+            removed_image_parts=list(self.__removed_image_parts),
+            removed_image_bytes=list(self.__removed_image_bytes),
+        )
+
+    def stream(self, user_input: str | None, conversation=None) -> Iterator[Dict[str, Any]]:
+        """Run the agent and stream its progress.
+
+        Yields a `progress` event for every tool iteration and the final answer as `token` events,
+        as the completion produces them.
+        """
+        if user_input is None or len(user_input)==0:  # if no input return init message
+            yield self.__token_event(content=self._conversation[1]["content"])
+            return
+
+        self.__start_question(user_input=user_input, conversation=conversation)
+        cached_answer: str | None = self.__cached_answer(user_input=user_input)
+        if cached_answer is not None:
+            self.__append_answer(content=cached_answer)
+            yield self.__token_event(content=cached_answer)
+            return
+        run_count = 0
+
+        while True:
+            if run_count >= self.__max_run_per_question:
+                answer: str = self.__max_run_count_message(run_count=run_count).content
+                self.__append_answer(content=answer)
+                yield self.__token_event(content=answer)
+                return
+
+            content: List[str] = []
+            tool_calls: Dict[int, Dict[str, str]] = {}
+            pending: List[str] = []
+            for chunk in self.__create_completion(**self.__completion_args(), stream=True):
+                for token in self.__accumulate_chunk(chunk=chunk, content=content, tool_calls=tool_calls, pending=pending):
+                    yield self.__token_event(content=token)
+            for token in self.__release(pending=pending):
+                yield self.__token_event(content=token)
+
+            run_count += 1
+            response_message: ChatCompletionMessage = self.__streamed_message(content=content, tool_calls=tool_calls)
+            if not response_message.tool_calls:
+                self.__cache_answer(answer=response_message.content)
+                self.__append_answer(content=response_message.content)
+                return
+
+            yield self.__progress_event(iteration=run_count, tool_calls=response_message.tool_calls)
+            self._conversation.append(response_message)
+            self.__verify_openai_tools(tool_calls=response_message.tool_calls)
+
+    async def astream(self, user_input: str | None, conversation=None) -> AsyncIterator[Dict[str, Any]]:
+        """Asynchronous counterpart of stream that never blocks the event loop on I/O"""
+        if self.__async_client is None:
+            events: Iterator[Dict[str, Any]] = self.stream(user_input=user_input, conversation=conversation)
+            while (event := await asyncio.to_thread(next, events, None)) is not None:
+                yield event
+            return
+
+        if user_input is None or len(user_input)==0:  # if no input return init message
+            yield self.__token_event(content=self._conversation[1]["content"])
+            return
+
+        self.__start_question(user_input=user_input, conversation=conversation)
+        cached_answer: str | None = await self.__acached_answer(user_input=user_input)
+        if cached_answer is not None:
+            self.__append_answer(content=cached_answer)
+            yield self.__token_event(content=cached_answer)
+            return
+        run_count = 0
+
+        while True:
+            if run_count >= self.__max_run_per_question:
+                answer: str = self.__max_run_count_message(run_count=run_count).content
+                self.__append_answer(content=answer)
+                yield self.__token_event(content=answer)
+                return
+
+            content: List[str] = []
+            tool_calls: Dict[int, Dict[str, str]] = {}
+            pending: List[str] = []
+            async for chunk in await self.__acreate_completion(**await self.__acompletion_args(), stream=True):
+                for token in self.__accumulate_chunk(chunk=chunk, content=content, tool_calls=tool_calls, pending=pending):
+                    yield self.__token_event(content=token)
+            for token in self.__release(pending=pending):
+                yield self.__token_event(content=token)
+
+            run_count += 1
+            response_message: ChatCompletionMessage = self.__streamed_message(content=content, tool_calls=tool_calls)
+            if not response_message.tool_calls:
+                self.__cache_answer(answer=response_message.content)
+                self.__append_answer(content=response_message.content)
+                return
+
+            yield self.__progress_event(iteration=run_count, tool_calls=response_message.tool_calls)
+            self._conversation.append(response_message)
+            await self.__averify_openai_tools(tool_calls=response_message.tool_calls)
+
+    def __accumulate_chunk(
+            self,
+            chunk: ChatCompletionChunk,
+            content: List[str],
+            tool_calls: Dict[int, Dict[str, str]],
+            pending: List[str]) -> List[str]:
+        """Add a streamed chunk to the message being received and return the answer tokens it releases"""
+        if len(chunk.choices) == 0:
+            return []
+
+        choice = chunk.choices[0]
+        delta = choice.delta
+        for tool_call in delta.tool_calls or []:
+            accumulated: Dict[str, str] = tool_calls.setdefault(tool_call.index, {"id": "", "name": "", "arguments": ""})
+            accumulated["id"] += tool_call.id or ""
+            if tool_call.function is not None:
+                accumulated["name"] += tool_call.function.name or ""
+                accumulated["arguments"] += tool_call.function.arguments or ""
+
+        if delta.content:
+            content.append(delta.content)
+            pending.append(delta.content)
+        if len(tool_calls) > 0:
+            # text that comes with tool calls, before or after them, is not part of the answer
+            pending.clear()
+            return []
+        # while tools are offered, text is held back until the model finishes without calling one
+        if len(self.__functions_spec) > 0 and choice.finish_reason is None:
+            return []
+        return self.__release(pending=pending)
+
+    @staticmethod
+    def __release(pending: List[str]) -> List[str]:
+        tokens: List[str] = list(pending)
+        pending.clear()
+        return tokens
+
+    def __streamed_message(self, content: List[str], tool_calls: Dict[int, Dict[str, str]]) -> ChatCompletionMessage:
+        return ChatCompletionMessage(
+            role="assistant",
+            content="".join(content),
+            tool_calls=[
+                ChatCompletionMessageToolCall(
+                    id=tool_call["id"],
+                    type="function",
+                    function=Function(name=tool_call["name"], arguments=tool_call["arguments"]))
+                for _, tool_call in sorted(tool_calls.items())] or None,
+        )
+
+    @staticmethod
+    def __token_event(content: str) -> Dict[str, Any]:
+        return {"type": "token", "content": content}
+
+    @staticmethod
+    def __progress_event(iteration: int, tool_calls: List[ChatCompletionMessageToolCall]) -> Dict[str, Any]:
+        return {
+            "type": "progress",
+            "iteration": iteration,
+            "tool_calls": [
+                {"name": tool_call.function.name, "arguments": tool_call.function.arguments} for tool_call in tool_calls],
+        }
+
+    def current_turn(self) -> list:
+        """Messages of the question asked to this agent, starting with the question"""
+        last_turn: list = self._conversation.last_turn
+        if self.__question is None or len(last_turn) == 0 or last_turn[0] is not self.__question:
+            return []
+        return list(last_turn)
+
+    def __cached_answer(self, user_input: str) -> str | None:
+        """Return the cached answer to a first question, or None"""
+        if not self.__asks_first_question():
+            return None
+        try:
+            self.__question_embedding = self.__search_vector_function.embed(text=user_input)
+        except Exception as e:
+            self._logger.error(msg=f"Failed to embed the question for the answer cache: {e}")
+            return None
+        return self.__answer_cache.lookup(
+            namespace=self.__answer_cache_namespace, version=self.__answer_cache_version, embedding=self.__question_embedding)
+
+    async def __acached_answer(self, user_input: str) -> str | None:
+        """Return the cached answer to a first question, or None, without blocking the event loop"""
+        if not self.__asks_first_question():
+            return None
+        try:
+            self.__question_embedding = await self.__search_vector_function.aembed(text=user_input)
+        except Exception as e:
+            self._logger.error(msg=f"Failed to embed the question for the answer cache: {e}")
+            return None
+        return self.__answer_cache.lookup(
+            namespace=self.__answer_cache_namespace, version=self.__answer_cache_version, embedding=self.__question_embedding)
+
+    def __asks_first_question(self) -> bool:
+        # later answers depend on the earlier questions of the session
+        return self.__answer_cache is not None and len(self._conversation.turns) == 1
+
+    def __cache_answer(self, answer: str | None) -> None:
+        if self.__question_embedding is None or not answer:
+            return
+        self.__answer_cache.store(
+            namespace=self.__answer_cache_namespace,
+            version=self.__answer_cache_version,
+            question=self.__question["content"],
+            embedding=self.__question_embedding,
+            answer=answer)
+
+    def __cached_response(self, answer: str, stream: bool) -> AgentResponse:
+        self.__append_answer(content=answer)
+        return AgentResponse(streaming=stream, conversation=self._conversation.messages(), response=answer)
+
+    def __append_answer(self, content: str | None) -> None:
+        self._conversation.append({"role": "assistant", "content": content})
+
+    def __start_question(self, user_input: str, conversation) -> None:
+        if conversation is not None and len(conversation) > 0:
+            self._conversation = conversation if isinstance(
+                conversation, Conversation) else Conversation.from_messages(messages=conversation)
+
+        self.__prompt_tokens = []
+        self.__removed_image_parts = []
+        self.__removed_image_bytes = []
+        self.__question_embedding = None
+        self.__question = {"role": "user", "content": user_input}
+        self._conversation.append(self.__question)
+        self.clean_up_history(
+            max_q_with_detail_hist=self.__max_question_with_detail_hist, max_q_to_keep=self.__max_question_to_keep)
+
+    def __completion_args(self) -> dict:
+        messages: List[Any] = self.__prompt_messages()
+        images: Dict[str, PreparedImage | None] = self.__cached_images(messages=messages)
+        missing: List[str] = [path for path, image in images.items() if image is None]
+        if len(missing) > 0:
+            images.update(self.__prepare_images(images=self.__load_page_images(page_image_names=missing)))
+        return self.__request_args(messages=self.__rehydrate(messages=messages, images=images))
+
+    async def __acompletion_args(self) -> dict:
+        messages: List[Any] = self.__prompt_messages()
+        images: Dict[str, PreparedImage | None] = self.__cached_images(messages=messages)
+        missing: List[str] = [path for path, image in images.items() if image is None]
+        if len(missing) > 0:
+            page_images: Dict[str, bytes | None] = await self.__aload_page_images(page_image_names=missing)
+            images.update(await asyncio.to_thread(self.__prepare_images, images=page_images))
+        return self.__request_args(messages=self.__rehydrate(messages=messages, images=images))
+
+    def __prompt_messages(self) -> List[Any]:
+        compaction = PromptCompaction()
+        messages, prompt_tokens = self.__context_builder.build(
+            conversation=self._conversation, reserved_tokens=self.__tools_tokens, compaction=compaction)
+        self.__prompt_tokens.append(prompt_tokens + self.__tools_tokens)
+        self.__removed_image_parts.append(compaction.image_parts)
+        self.__removed_image_bytes.append(compaction.image_bytes)
+        if compaction.image_parts > 0:
+            self._logger.debug(
+                msg=f"Left {compaction.image_parts} images ({compaction.image_bytes} bytes) out of the prompt")
+        return messages
+
+    def __cached_images(self, messages: List[Any]) -> Dict[str, PreparedImage | None]:
+        """Prepared images of the image references left in the messages to send, None for those to load"""
+        images: Dict[str, PreparedImage | None] = {}
+        for message in messages:
+            for image_ref in self.__image_refs(message=message):
+                if image_ref["path"] not in images:
+                    images[image_ref["path"]] = self.__image_pipeline.cached(
+                        path=os.path.join(self.__image_directory, image_ref["path"]), digest=image_ref["digest"])
+        return images
+
+    def __load_page_images(self, page_image_names: List[str]) -> Dict[str, bytes | None]:
+        """Read the page images from the image directory and download those that are not there"""
+        page_images: Dict[str, bytes | None] = {
+            page_image_name: self.__read_page_image(page_image_name=page_image_name) for page_image_name in page_image_names}
+        missing: List[str] = [page_image_name for page_image_name, data in page_images.items() if data is None]
+        if len(missing) > 0:
+            page_images.update(self.__search_vector_function.page_images(page_image_names=missing))
+        return page_images
+
+    async def __aload_page_images(self, page_image_names: List[str]) -> Dict[str, bytes | None]:
+        page_images: Dict[str, bytes | None] = dict(zip(page_image_names, await asyncio.gather(*[
+            asyncio.to_thread(self.__read_page_image, page_image_name=page_image_name)
+            for page_image_name in page_image_names])))
+        missing: List[str] = [page_image_name for page_image_name, data in page_images.items() if data is None]
+        if len(missing) > 0:
+            page_images.update(await self.__search_vector_function.apage_images(page_image_names=missing))
+        return page_images
+
+    def __read_page_image(self, page_image_name: str) -> bytes | None:
+        try:
+            image_file: str | bytes = self.__fs.read_bytes(path=os.path.join(self.__image_directory, page_image_name))
+        except OSError:
+            return None
+        return image_file.encode(encoding='utf-8') if isinstance(image_file, str) else image_file
+
+    def __prepare_images(self, images: Dict[str, bytes | None]) -> Dict[str, PreparedImage | None]:
+        prepared: Dict[str, PreparedImage | None] = {}
+        for page_image_name, data in images.items():
+            if data is None:
+                self._logger.error(msg=f"Page image {page_image_name} of the history could not be loaded")
+                prepared[page_image_name] = None
+            else:
+                prepared[page_image_name] = self.__image_pipeline.prepare(
+                    path=os.path.join(self.__image_directory, page_image_name), data=data)
+        return prepared
+
+    def __rehydrate(self, messages: List[Any], images: Dict[str, PreparedImage | None]) -> List[Any]:
+        """Replace the image references of the messages to send with the images they stand for"""
+        if len(images) == 0:
+            return messages
+        rehydrated: List[Any] = []
+        for message in messages:
+            if len(self.__image_refs(message=message)) == 0:
+                rehydrated.append(message)
+                continue
+            content: List[Dict[str, Any]] = []
+            for part in message["content"]:
+                if part.get("type") != IMAGE_REF:
+                    content.append(part)
+                elif (image := images.get(part[IMAGE_REF]["path"])) is not None:
+                    content.append({"type": "image_url", "image_url": image.to_image_url()})
+                else:
+                    content.append({"type": "text", "text": UNAVAILABLE_IMAGE})
+            rehydrated.append({**message, "content": content})
+        return rehydrated
+
+    @staticmethod
+    def __image_refs(message: Any) -> List[Dict[str, str]]:
+        content: Any = message.get("content") if isinstance(message, dict) else None
+        if not isinstance(content, list):
+            return []
+        return [part[IMAGE_REF] for part in content if isinstance(part, dict) and part.get("type") == IMAGE_REF]
+
+    def __request_args(self, messages: List[Any]) -> dict:
+        return dict(
+            model=self._agent_configuration.model,
+            messages=messages,
+            tools=self.__functions_spec,
+            tool_choice='auto',
+            temperature=0.2,
+        )
+
+    def __create_completion(self, **kwargs: Any) -> Any:
+        if self.__rate_limiter is None:
+            return self.__client.chat.completions.create(**kwargs)
+        # a stream holds its concurrency slot only until the response starts
+        return self.__rate_limiter.call(
+            deployment=kwargs["model"],
+            request=lambda: self.__client.chat.completions.create(**kwargs),
+            tokens=self.__prompt_tokens[-1])
+
+    async def __acreate_completion(self, **kwargs: Any) -> Any:
+        if self.__rate_limiter is None:
+            return await self.__async_client.chat.completions.create(**kwargs)
+        return await self.__rate_limiter.acall(
+            deployment=kwargs["model"],
+            request=lambda: self.__async_client.chat.completions.create(**kwargs),
+            tokens=self.__prompt_tokens[-1])
+
+    def __response_message(self, response: ChatCompletion) -> ChatCompletionMessage:
+        response_message: ChatCompletionMessage = response.choices[0].message
+
+        if response_message.content is None:
+            response_message.content = ""
+
+        return response_message
+
+    def __max_run_count_message(self, run_count: int) -> ChatCompletionMessage:
+        self._logger.debug(
+            msg=f"Need to move on from this question due to max run count reached ({run_count} runs)")
+        return ChatCompletionMessage(
+            role="assistant",
+            content="I am unable to answer this question at the moment, please ask another question."
         )
 
     def __check_args(self, function, args) -> bool:
@@ -155,45 +588,193 @@ class Smart_Agent(Agent):
         return True
 
     def __verify_openai_tools(self, tool_calls: List[ChatCompletionMessageToolCall]) -> None:
-        for tool_call in tool_calls:
-            function_name: str = tool_call.function.name
-            self._logger.debug(
-                msg=f"Recommended Function call: {function_name}")
+        """Run the tool calls concurrently and append their results in the order they were requested"""
+        calls: List[Tuple[ChatCompletionMessageToolCall, dict]] | None = self.__parse_tool_calls(
+            tool_calls=tool_calls, functions_list=self._functions_list)
+        if calls is None:
+            self._conversation.pop()
+            return
 
-            # verify function exists
-            if function_name not in self._functions_list:
-                self._logger.debug(
-                    msg=f"Function {function_name} does not exist, retrying")
-                self._conversation.pop()
-                break
+        function_responses: Dict[int, Any] = self.__run_tool_batches(
+            calls=calls, batches=self.__tool_batches(calls=calls), timeout=self.__tool_timeout)
 
-            function_to_call = self._functions_list[function_name]
+        for index, (tool_call, _) in enumerate(calls):
+            self.__append_tool_message(tool_call=tool_call, function_response=function_responses[index])
 
-            try:
-                function_args = json.loads(s=tool_call.function.arguments)
-            except json.JSONDecodeError as e:
-                self._logger.error(msg=e)
-                self._conversation.pop()
-                break
+    async def __averify_openai_tools(self, tool_calls: List[ChatCompletionMessageToolCall]) -> None:
+        """Run the tool calls concurrently and append their results in the order they were requested"""
+        calls: List[Tuple[ChatCompletionMessageToolCall, dict]] | None = self.__parse_tool_calls(
+            tool_calls=tool_calls, functions_list=self._async_functions_list)
+        if calls is None:
+            self._conversation.pop()
+            return
 
-            if self.__check_args(function=function_to_call, args=function_args) is False:
-                self._conversation.pop()
-                break
-            else:
-                function_response = function_to_call(**function_args)
+        batches: List[List[int]] = self.__tool_batches(calls=calls)
+        batch_responses: List[List[Any]] = await asyncio.gather(*[
+            self.__acall_tools(calls=[calls[index] for index in indices], timeout=self.__tool_timeout)
+            for indices in batches])
+
+        function_responses: Dict[int, Any] = {
+            index: function_response
+            for indices, responses in zip(batches, batch_responses)
+            for index, function_response in zip(indices, responses)}
+
+        for index, (tool_call, _) in enumerate(calls):
+            self.__append_tool_message(tool_call=tool_call, function_response=function_responses[index])
 
+    def __tool_batches(self, calls: List[Tuple[ChatCompletionMessageToolCall, dict]]) -> List[List[int]]:
+        """Group the tool calls that can be served by one request; every other call runs on its own"""
+        search_indices: List[int] = [
+            index for index, (tool_call, _) in enumerate(calls) if tool_call.function.name == "search"]
+        if not self.__batch_search or len(search_indices) < 2:
+            return [[index] for index in range(len(calls))]
+
+        return [search_indices] + [[index] for index in range(len(calls)) if index not in search_indices]
+
+    @staticmethod
+    def __is_search_batch(calls: List[Tuple[ChatCompletionMessageToolCall, dict]]) -> bool:
+        return len(calls) > 1 and all(tool_call.function.name == "search" for tool_call, _ in calls)
+
+    def __run_tool_batches(
+            self,
+            calls: List[Tuple[ChatCompletionMessageToolCall, dict]],
+            batches: List[List[int]],
+            timeout: float) -> Dict[int, Any]:
+        """Run the batches of tool calls concurrently and return the result of every call by its index"""
+        started_at: float = time.monotonic()
+        futures: List[Future] = [
+            self.__tool_executor.submit(self.__call_tools, calls=[calls[index] for index in indices])
+            for indices in batches]
+        wait(fs=futures, timeout=timeout)
+
+        function_responses: Dict[int, Any] = {}
+        failed: List[int] = []
+        for indices, future in zip(batches, futures):
+            if future.done() and future.exception() is not None and len(indices) > 1:
+                # one bad query must not fail the others, so the calls of a failed batch run on their own
+                self._logger.warning(msg=f"Batched search failed, running its calls one by one: {future.exception()!r}")
+                failed.extend(indices)
+                continue
+            for position, index in enumerate(indices):
+                tool_call: ChatCompletionMessageToolCall = calls[index][0]
+                if not future.done():
+                    # a running tool cannot be interrupted: it keeps its executor slot until it returns,
+                    # only its result is no longer waited for
+                    function_responses[index] = self.__tool_error(tool_call=tool_call, error=TimeoutError(
+                        f"no result after {timeout}s, still running in the background"))
+                elif future.exception() is not None:
+                    function_responses[index] = self.__tool_error(tool_call=tool_call, error=future.exception())
+                else:
+                    function_responses[index] = future.result()[position]
+
+        if len(failed) > 0:
+            function_responses.update(self.__run_tool_batches(
+                calls=calls,
+                batches=[[index] for index in failed],
+                timeout=max(timeout - (time.monotonic() - started_at), 0.0)))
+        return function_responses
+
+    def __call_tools(self, calls: List[Tuple[ChatCompletionMessageToolCall, dict]]) -> List[Any]:
+        if self.__is_search_batch(calls=calls):
+            return [
+                self.__generate_search_function_response(function_response=function_response)
+                for function_response in self.__search_vector_function.search_many(
+                    queries=[function_args["search_query"] for _, function_args in calls])]
+
+        function_responses: List[Any] = []
+        for tool_call, function_args in calls:
+            function_name: str = tool_call.function.name
+            function_response = self._functions_list[function_name](**function_args)
             if function_name == "search":
                 function_response = self.__generate_search_function_response(
                     function_response=function_response)
-
-            self._conversation.append(
-                {
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": function_name,
-                    "content": function_response,
-                }
-            )
+            function_responses.append(function_response)
+        return function_responses
+
+    async def __acall_tools(self, calls: List[Tuple[ChatCompletionMessageToolCall, dict]], timeout: float) -> List[Any]:
+        async def call() -> List[Any]:
+            if self.__is_search_batch(calls=calls):
+                function_responses: List[list] = await self.__search_vector_function.asearch_many(
+                    queries=[function_args["search_query"] for _, function_args in calls])
+                return await asyncio.to_thread(
+                    lambda: [
+                        self.__generate_search_function_response(function_response=function_response)
+                        for function_response in function_responses])
+
+            function_responses = []
+            for tool_call, function_args in calls:
+                function_name: str = tool_call.function.name
+                function_response = await self._async_functions_list[function_name](**function_args)
+                if function_name == "search":
+                    function_response = await asyncio.to_thread(
+                        self.__generate_search_function_response, function_response=function_response)
+                function_responses.append(function_response)
+            return function_responses
+
+        started_at: float = time.monotonic()
+        try:
+            return await asyncio.wait_for(call(), timeout=timeout)
+        except Exception as e:
+            if isinstance(e, TimeoutError) or not self.__is_search_batch(calls=calls):
+                return [self.__tool_error(tool_call=tool_call, error=e) for tool_call, _ in calls]
+            # one bad query must not fail the others, so the calls of a failed batch run on their own
+            self._logger.warning(msg=f"Batched search failed, running its calls one by one: {e!r}")
+
+        remaining: float = max(timeout - (time.monotonic() - started_at), 0.0)
+        function_responses: List[List[Any]] = await asyncio.gather(
+            *[self.__acall_tools(calls=[calls[index]], timeout=remaining) for index in range(len(calls))])
+        return [function_response for responses in function_responses for function_response in responses]
+
+    def __tool_error(self, tool_call: ChatCompletionMessageToolCall, error: BaseException) -> str:
+        """Report a failed tool call to the model instead of discarding the other results"""
+        self._logger.error(msg=f"Function {tool_call.function.name} failed: {error!r}")
+        return f"The {tool_call.function.name} function failed and returned no results."
+
+    def __parse_tool_calls(
+            self,
+            tool_calls: List[ChatCompletionMessageToolCall],
+            functions_list: dict) -> List[Tuple[ChatCompletionMessageToolCall, dict]] | None:
+        """Return the arguments of every tool call, or None if any of them cannot be made"""
+        calls: List[Tuple[ChatCompletionMessageToolCall, dict]] = []
+        for tool_call in tool_calls:
+            function_args = self.__parse_tool_call(tool_call=tool_call, functions_list=functions_list)
+            if function_args is None:
+                return None
+            calls.append((tool_call, function_args))
+        return calls
+
+    def __parse_tool_call(self, tool_call: ChatCompletionMessageToolCall, functions_list: dict) -> dict | None:
+        """Return the arguments of a tool call, or None if the call cannot be made"""
+        function_name: str = tool_call.function.name
+        self._logger.debug(
+            msg=f"Recommended Function call: {function_name}")
+
+        # verify function exists
+        if function_name not in functions_list:
+            self._logger.debug(
+                msg=f"Function {function_name} does not exist, retrying")
+            return None
+
+        try:
+            function_args = json.loads(s=tool_call.function.arguments)
+        except json.JSONDecodeError as e:
+            self._logger.error(msg=e)
+            return None
+
+        if self.__check_args(function=functions_list[function_name], args=function_args) is False:
+            return None
+
+        return function_args
+
+    def __append_tool_message(self, tool_call: ChatCompletionMessageToolCall, function_response) -> None:
+        self._conversation.append(
+            {
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": tool_call.function.name,
+                "content": function_response,
+            }
+        )
 
     def __generate_search_function_response(self, function_response):
         search_function_response = []
@@ -202,19 +783,19 @@ class Smart_Agent(Agent):
             image_path = os.path.join(self.__image_directory, item['image_path'])   
             related_content = item['related_content']
 
-            image_file: str | bytes = self.__fs.read_bytes(path=image_path)
-            image_bytes: bytes | None = image_file if isinstance(
-                image_file, bytes) else None
-            image_bytes = image_file.encode(
-                encoding='utf-8') if isinstance(image_file, str) else image_file
-            base64_image: str = base64.b64encode(
-                s=image_bytes).decode(encoding='utf-8')
-            self._logger.debug("image_path: ", image_path)
+            # the search hands over the downloaded bytes when it returns them, sparing the disk read
+            image_bytes: bytes | memoryview | None = item.get('image_bytes')
+            if image_bytes is None:
+                image_file: str | bytes = self.__fs.read_bytes(path=image_path)
+                image_bytes = image_file.encode(
+                    encoding='utf-8') if isinstance(image_file, str) else image_file
+            image: PreparedImage = self.__image_pipeline.prepare(path=image_path, data=image_bytes)
+            self._logger.debug(msg=f"image_path: {image_path}")
 
             search_function_response.append(
                 {"type": "text", "text": f"file_name: {image_path}"})
-            search_function_response.append({"type": "image_url", "image_url": {
-                                            "url":  f"data:image/jpeg;base64,{base64_image}"}})
+            # the conversation keeps a reference that is replaced by the image when it is sent
+            search_function_response.append({"type": IMAGE_REF, IMAGE_REF: image.to_image_ref(path=item['image_path'])})
             search_function_response.append(
                 {"type": "text", "text": f"HINT: The following kind of content might be related to this topic\n: {related_content}"})
 
@@ -1,35 +1,91 @@
 """The main server file for the LangChain server."""
-from typing import Any
+from typing import Any, AsyncIterator, Dict, Iterator, List
 import uuid
 import fsspec
-from openai import AzureOpenAI
 from fsspec.utils import get_protocol
 from fastapi import FastAPI
 from langserve import add_routes
-from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
 from models import Settings, AgentResponse
-from utils import SmartAgentFactory
+from utils import SmartAgentFactory, ResourceRegistry, DEFAULT_AGENT_NAME
 from agents import Smart_Agent
 from functions import SearchVectorFunction
 from logging import Logger
 import ast
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
 settings: Settings = Settings(_env_file=".env")  # type: ignore
+resources: ResourceRegistry = ResourceRegistry.get_instance(settings=settings)
 
 def deep_rag_search(input) -> Any | str | None:
     question = input['question']
     session_id = input['session_id']
+    agent_name = input.get('agent_name', DEFAULT_AGENT_NAME)
     protocol: str = get_protocol(url=settings.smart_agent_prompt_location)
     fs: fsspec.AbstractFileSystem = fsspec.filesystem(protocol=protocol)
     agent: Smart_Agent = SmartAgentFactory.create_smart_agent(
-        fs=fs, settings=settings, session_id=session_id)
+        fs=fs, settings=settings, session_id=session_id, resources=resources, agent_name=agent_name)
     agent_response: AgentResponse = agent.run(
         user_input=question, conversation=[], stream=False)
-    SmartAgentFactory.persist_history(smart_agent=agent, session_id=session_id,settings=settings)
-    
+    SmartAgentFactory.persist_history(
+        smart_agent=agent, session_id=session_id, settings=settings, resources=resources)
+
+    return agent_response.response
+
+async def adeep_rag_search(input) -> Any | str | None:
+    question = input['question']
+    session_id = input['session_id']
+    agent_name = input.get('agent_name', DEFAULT_AGENT_NAME)
+    protocol: str = get_protocol(url=settings.smart_agent_prompt_location)
+    fs: fsspec.AbstractFileSystem = fsspec.filesystem(protocol=protocol)
+    agent: Smart_Agent = await SmartAgentFactory.acreate_smart_agent(
+        fs=fs, settings=settings, session_id=session_id, resources=resources, agent_name=agent_name)
+    agent_response: AgentResponse = await agent.arun(
+        user_input=question, conversation=[], stream=False)
+    await SmartAgentFactory.apersist_history(
+        smart_agent=agent, session_id=session_id, settings=settings, resources=resources)
+
     return agent_response.response
 
+def stream_deep_rag_search(input) -> Iterator[Dict[str, Any]]:
+    question = input['question']
+    session_id = input['session_id']
+    agent_name = input.get('agent_name', DEFAULT_AGENT_NAME)
+    protocol: str = get_protocol(url=settings.smart_agent_prompt_location)
+    fs: fsspec.AbstractFileSystem = fsspec.filesystem(protocol=protocol)
+    agent: Smart_Agent = SmartAgentFactory.create_smart_agent(
+        fs=fs, settings=settings, session_id=session_id, resources=resources, agent_name=agent_name)
+    yield from agent.stream(user_input=question, conversation=[])
+    SmartAgentFactory.persist_history(
+        smart_agent=agent, session_id=session_id, settings=settings, resources=resources)
+
+async def astream_deep_rag_search(input) -> AsyncIterator[Dict[str, Any]]:
+    question = input['question']
+    session_id = input['session_id']
+    agent_name = input.get('agent_name', DEFAULT_AGENT_NAME)
+    protocol: str = get_protocol(url=settings.smart_agent_prompt_location)
+    fs: fsspec.AbstractFileSystem = fsspec.filesystem(protocol=protocol)
+    agent: Smart_Agent = await SmartAgentFactory.acreate_smart_agent(
+        fs=fs, settings=settings, session_id=session_id, resources=resources, agent_name=agent_name)
+    async for event in agent.astream(user_input=question, conversation=[]):
+        yield event
+    await SmartAgentFactory.apersist_history(
+        smart_agent=agent, session_id=session_id, settings=settings, resources=resources)
+
+class DeepRagRunnable(Runnable[Dict[str, Any], Any]):
+    """Runs the smart agent; invoke returns its answer, stream yields its progress and answer tokens"""
+
+    def invoke(self, input: Dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        return deep_rag_search(input)
+
+    async def ainvoke(self, input: Dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any) -> Any:
+        return await adeep_rag_search(input)
+
+    def stream(self, input: Dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any) -> Iterator[Any]:
+        yield from stream_deep_rag_search(input)
+
+    async def astream(self, input: Dict[str, Any], config: RunnableConfig | None = None, **kwargs: Any) -> AsyncIterator[Any]:
+        async for event in astream_deep_rag_search(input):
+            yield event
+
 class Server:
     def __init__(self, app: FastAPI, searchVectorFunction: SearchVectorFunction) -> None:
         self.app = app
@@ -37,19 +93,31 @@ class Server:
         add_routes(
             app=app,
             runnable= RunnableLambda(
-                func=lambda input: self.vector_rag_search(input=input)),
+                func=lambda input: self.vector_rag_search(question=input),
+                afunc=self.avector_rag_search),
             path="/vectorRAG",
         )
         add_routes(
             app=app,
-            runnable=RunnablePassthrough() | RunnableLambda(
-                func=lambda input: deep_rag_search(input=input)),
+            runnable=DeepRagRunnable(),
             path="/deepRAG",
         )
+        app.add_api_route(path="/health", endpoint=self.health, methods=["GET"])
+        app.router.add_event_handler(event_type="shutdown", func=ResourceRegistry.aclose_instance)
 
-    def vector_rag_search(self, question: str) -> Any | str | None:
+    def vector_rag_search(self, question: str | List[str]) -> Any | str | None:
+        if isinstance(question, list):
+            return self.searchVectorFunction.search_many(queries=question)
         return self.searchVectorFunction.search(search_query=question)
 
+    async def avector_rag_search(self, question: str | List[str]) -> Any | str | None:
+        if isinstance(question, list):
+            return await self.searchVectorFunction.asearch_many(queries=question)
+        return await self.searchVectorFunction.asearch(search_query=question)
+
+    def health(self) -> dict[str, bool]:
+        return resources.health()
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -59,31 +127,25 @@ if __name__ == "__main__":
         description="A simple api server using Langchain's Runnable interfaces",
     )
 
-    settings: Settings = Settings(_env_file=".env")  # type: ignore
-
-    openai_client = AzureOpenAI(
-        azure_endpoint=settings.openai_endpoint,
-        api_key=settings.openai_key,
-        api_version=settings.openai_api_version
-    )
-
-    search_client = SearchClient(
-        endpoint=settings.azure_search_endpoint,
-        index_name=settings.azure_search_index_name,
-        credential=AzureKeyCredential(key=settings.azure_search_key)
-    )
-
     search_vector_function = SearchVectorFunction(
         logger=Logger(name="search_vector_function"),
-        search_client=search_client,
-        client=openai_client,
+        search_client=resources.search_client(),
+        client=resources.openai_client(),
         model=settings.openai_embedding_deployment,
         image_directory=settings.smart_agent_image_path,
-        storage_account_key=settings.azure_storage_account_key,  
-        storage_account_name=settings.azure_storage_account_name,  
-        container_name=settings.azure_container_name  
-
+        container_client=resources.container_client(),
+        async_search_client=resources.async_search_client(),
+        async_client=resources.async_openai_client(),
+        async_container_client=resources.async_container_client(),
+        embedding_cache=resources.embedding_cache(),
+        search_executor=resources.search_executor(),
+        page_image_cache=resources.page_image_cache(),
+        download_executor=resources.download_executor(),
+        download_semaphore=resources.async_download_semaphore(),
+        search_result_cache=resources.search_result_cache() if settings.search_result_cache_ttl > 0 else None,
+        retriever=resources.retriever(),
+        rate_limiter=resources.rate_limiter() if settings.openai_rate_limiter_enabled else None,
     )
 
     server = Server(app=app, searchVectorFunction=search_vector_function)
-    uvicorn.run(app=server.app, host=settings.api_host, port=settings.api_port)
\ No newline at end of file
+    uvicorn.run(app=server.app, host=settings.api_host, port=settings.api_port)
@@ -3,9 +3,7 @@ from fastapi import FastAPI
 from models import Settings
 from functions import SearchVectorFunction
 from logging import Logger
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
-from openai import AzureOpenAI
+from utils import ResourceRegistry
 from api import Server
 
 app = FastAPI(
@@ -15,29 +13,26 @@ app = FastAPI(
 )
 
 settings: Settings = Settings(_env_file=".env")  # type: ignore
-
-openai_client = AzureOpenAI(
-    azure_endpoint=settings.openai_endpoint,
-    api_key=settings.openai_key,
-    api_version=settings.openai_api_version
-)
-
-search_client = SearchClient(
-    endpoint=settings.azure_search_endpoint,
-    index_name=settings.azure_search_index_name,
-    credential=AzureKeyCredential(key=settings.azure_search_key)
-)
+resources: ResourceRegistry = ResourceRegistry.get_instance(settings=settings)
 
 search_vector_function = SearchVectorFunction(
     logger=Logger(name="search_vector_function"),
-    search_client=search_client,
-    client=openai_client,
+    search_client=resources.search_client(),
+    client=resources.openai_client(),
     model=settings.openai_embedding_deployment,
     image_directory=settings.smart_agent_image_path,
-    storage_account_key=settings.azure_storage_account_key,  
-    storage_account_name=settings.azure_storage_account_name,  
-    container_name=settings.azure_container_name  
-
+    container_client=resources.container_client(),
+    async_search_client=resources.async_search_client(),
+    async_client=resources.async_openai_client(),
+    async_container_client=resources.async_container_client(),
+    embedding_cache=resources.embedding_cache(),
+    search_executor=resources.search_executor(),
+    page_image_cache=resources.page_image_cache(),
+    download_executor=resources.download_executor(),
+    download_semaphore=resources.async_download_semaphore(),
+    search_result_cache=resources.search_result_cache() if settings.search_result_cache_ttl > 0 else None,
+    retriever=resources.retriever(),
+    rate_limiter=resources.rate_limiter() if settings.openai_rate_limiter_enabled else None,
 )
 
 server = Server(app=app, searchVectorFunction=search_vector_function)
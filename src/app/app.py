@@ -123,13 +123,24 @@ if user_input:
         st.markdown(body=user_input)
 
     history.append({"role": "user", "content": user_input})
-    try:
-        agent_response:str = remoteAgent.invoke(input={"question":user_input, "session_id":session_id})                
-    except Exception as e:
-        agent_response = None
-        logger.error("error in running agent, error is "+ str(e))
 
     with st.chat_message(name="assistant"):
+        # render the answer as it is streamed, after a note for every tool iteration
+        answer_placeholder = st.empty()
+        agent_response: str | None = ""
+        try:
+            for event in remoteAgent.stream(input={"question":user_input, "session_id":session_id}):
+                if event.get("type") == "progress":
+                    tool_calls: str = ", ".join(
+                        f"{tool_call['name']}({tool_call['arguments']})" for tool_call in event["tool_calls"])
+                    answer_placeholder.markdown(body=f"_Step {event['iteration']}: {tool_calls}_")
+                elif event.get("type") == "token":
+                    agent_response += event["content"]
+                    answer_placeholder.markdown(body=agent_response)
+        except Exception as e:
+            agent_response = None
+            logger.error("error in running agent, error is "+ str(e))
+
         history.append({"role": "assistant", "content": agent_response})
         json_response = None
         if agent_response:
@@ -137,11 +148,11 @@ if user_input:
                 try:
                     agent_response = agent_response.strip("```json")
                     json_response = json.loads(s=agent_response)
-                    st.markdown(body=json_response.get("overall_explanation"))
+                    answer_placeholder.markdown(body=json_response.get("overall_explanation"))
                 except Exception as e:
                     logger.error("exception json load "+str(e))
-                    logger.debug((agent_respose))
-                    st.markdown(body=agent_response)
+                    logger.debug((agent_response))
+                    answer_placeholder.markdown(body=agent_response)
             if json_response:
                 for item in json_response:
                     if item != "overall_explanation":
@@ -1,5 +1,5 @@
 from abc import abstractmethod
-from typing import Protocol, TypeVar, Union
+from typing import Any, Protocol, TypeVar, Union
 
 KeyT = TypeVar("KeyT", contravariant=True)
 ResponseT = TypeVar("ResponseT", covariant=True)
@@ -31,3 +31,60 @@ class CacheProtocol(Protocol[KeyT, ResponseT, EncodableT, ExpiryT, AbsExpiryT]):
     @abstractmethod
     def delete(self, *names: KeyT) -> ResponseT:
         pass
+
+class AsyncCacheProtocol(Protocol[KeyT, ResponseT, EncodableT, ExpiryT, AbsExpiryT]):
+    @abstractmethod
+    async def get(self, name: KeyT) -> ResponseT:
+        pass
+
+    @abstractmethod
+    async def set(
+        self,
+        name: KeyT,
+        value: EncodableT,
+        ex: Union[ExpiryT, None] = None,
+        px: Union[ExpiryT, None] = None,
+        nx: bool = False,
+        xx: bool = False,
+        keepttl: bool = False,
+        get: bool = False,
+        exat: Union[AbsExpiryT, None] = None,
+        pxat: Union[AbsExpiryT, None] = None,
+    ) -> ResponseT:
+        pass
+
+    @abstractmethod
+    async def delete(self, *names: KeyT) -> ResponseT:
+        pass
+
+class ListCacheProtocol(CacheProtocol[KeyT, ResponseT, EncodableT, ExpiryT, AbsExpiryT], Protocol):
+    """A cache that also stores lists and batches commands in pipelines"""
+
+    @abstractmethod
+    def lrange(self, name: KeyT, start: int, end: int) -> ResponseT:
+        pass
+
+    @abstractmethod
+    def pipeline(self, transaction: bool = True) -> Any:
+        pass
+
+class AsyncListCacheProtocol(AsyncCacheProtocol[KeyT, ResponseT, EncodableT, ExpiryT, AbsExpiryT], Protocol):
+    @abstractmethod
+    async def lrange(self, name: KeyT, start: int, end: int) -> ResponseT:
+        pass
+
+    @abstractmethod
+    def pipeline(self, transaction: bool = True) -> Any:
+        pass
+
+class ScriptCacheProtocol(CacheProtocol[KeyT, ResponseT, EncodableT, ExpiryT, AbsExpiryT], Protocol):
+    """A cache that also runs Lua scripts"""
+
+    @abstractmethod
+    def register_script(self, script: str) -> Any:
+        pass
+
+class AsyncScriptCacheProtocol(AsyncCacheProtocol[KeyT, ResponseT, EncodableT, ExpiryT, AbsExpiryT], Protocol):
+    @abstractmethod
+    def register_script(self, script: str) -> Any:
+        pass
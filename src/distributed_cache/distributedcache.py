@@ -1,4 +1,13 @@
 """The main module for services."""
-from cache import CacheProtocol
+from cache import (
+    CacheProtocol, AsyncCacheProtocol, ListCacheProtocol, AsyncListCacheProtocol, ScriptCacheProtocol,
+    AsyncScriptCacheProtocol)
+from local_cache import LocalCache
+from redis_cache import RedisCache
+from shared_memory_cache import SharedMemoryCache
+from tiered_cache import TieredCache
 
-__all__: list[str] = ["CacheProtocol"]
+__all__: list[str] = [
+    "CacheProtocol", "AsyncCacheProtocol", "ListCacheProtocol", "AsyncListCacheProtocol",
+    "ScriptCacheProtocol", "AsyncScriptCacheProtocol",
+    "LocalCache", "RedisCache", "SharedMemoryCache", "TieredCache"]
@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Tuple
+
+class LocalCache:
+    """Bounded in-process cache with least recently used eviction and per-entry expiry.
+
+    Follows the key-value part of the Redis client API, so it can stand in for Redis where a
+    `CacheProtocol` is expected. `ttl` is the default and the longest lifetime of an entry; values
+    are stored as given, not copied.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float | None = None) -> None:
+        self.__max_entries: int = max_entries
+        self.__ttl: float | None = ttl
+        self.__lock: threading.Lock = threading.Lock()
+        self.__entries: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, name: str) -> Any | None:
+        with self.__lock:
+            return self.__get(name=name, now=time.monotonic())
+
+    def get_many(self, names: Iterable[str]) -> List[Any | None]:
+        with self.__lock:
+            now: float = time.monotonic()
+            return [self.__get(name=name, now=now) for name in names]
+
+    def set(
+            self,
+            name: str,
+            value: Any,
+            ex: float | timedelta | None = None,
+            px: float | timedelta | None = None,
+            nx: bool = False,
+            xx: bool = False) -> bool | None:
+        """Store `value`; with `nx` only if `name` is absent and with `xx` only if it is present"""
+        with self.__lock:
+            now: float = time.monotonic()
+            if (nx or xx) and (self.__get(name=name, now=now) is not None) != xx:
+                return None
+            self.__set(name=name, value=value, expires_at=now + self.__lifetime(ex=ex, px=px))
+            return True
+
+    def set_many(self, mapping: Dict[str, Any], ex: float | timedelta | None = None) -> None:
+        with self.__lock:
+            expires_at: float = time.monotonic() + self.__lifetime(ex=ex, px=None)
+            for name, value in mapping.items():
+                self.__set(name=name, value=value, expires_at=expires_at)
+
+    def delete(self, *names: str) -> int:
+        with self.__lock:
+            return sum(self.__entries.pop(name, None) is not None for name in names)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+
+    def __get(self, name: str, now: float) -> Any | None:
+        entry: Tuple[float, Any] | None = self.__entries.get(name)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= now:
+            del self.__entries[name]
+            return None
+        self.__entries.move_to_end(key=name)
+        return value
+
+    def __set(self, name: str, value: Any, expires_at: float) -> None:
+        self.__entries[name] = (expires_at, value)
+        self.__entries.move_to_end(key=name)
+        while len(self.__entries) > self.__max_entries:
+            self.__entries.popitem(last=False)
+
+    def __lifetime(self, ex: float | timedelta | None, px: float | timedelta | None) -> float:
+        lifetime: float = float("inf")
+        if ex is not None:
+            lifetime = ex.total_seconds() if isinstance(ex, timedelta) else float(ex)
+        elif px is not None:
+            lifetime = px.total_seconds() if isinstance(px, timedelta) else px / 1000.0
+        return min(lifetime, self.__ttl) if self.__ttl is not None else lifetime
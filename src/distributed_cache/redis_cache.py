@@ -0,0 +1,77 @@
+from typing import Any, Dict, Iterable, List
+from cache import ListCacheProtocol, AsyncListCacheProtocol
+
+class RedisCache:
+    """Key-value cache on Redis clients, with batched reads and writes.
+
+    `get_many` and `set_many` send their commands in one non-transactional pipeline, so a batch
+    costs a single round trip. Either client may be omitted when only the other API is used.
+    """
+
+    def __init__(self, client: ListCacheProtocol | None = None, async_client: AsyncListCacheProtocol | None = None) -> None:
+        self.__client: ListCacheProtocol | None = client
+        self.__async_client: AsyncListCacheProtocol | None = async_client
+
+    @property
+    def synchronous(self) -> bool:
+        return self.__client is not None
+
+    @property
+    def asynchronous(self) -> bool:
+        return self.__async_client is not None
+
+    def get(self, name: str) -> Any | None:
+        return self.__client.get(name=name)
+
+    async def aget(self, name: str) -> Any | None:
+        return await self.__async_client.get(name=name)
+
+    def get_many(self, names: Iterable[str]) -> List[Any | None]:
+        names = list(names)
+        if len(names) < 2:
+            return [self.get(name=name) for name in names]
+        pipeline = self.__client.pipeline(transaction=False)
+        for name in names:
+            pipeline.get(name)
+        return pipeline.execute()
+
+    async def aget_many(self, names: Iterable[str]) -> List[Any | None]:
+        names = list(names)
+        if len(names) < 2:
+            return [await self.aget(name=name) for name in names]
+        pipeline = self.__async_client.pipeline(transaction=False)
+        for name in names:
+            pipeline.get(name)
+        return await pipeline.execute()
+
+    def set(self, name: str, value: Any, ex: int | None = None) -> Any:
+        return self.__client.set(name=name, value=value, ex=ex)
+
+    async def aset(self, name: str, value: Any, ex: int | None = None) -> Any:
+        return await self.__async_client.set(name=name, value=value, ex=ex)
+
+    def set_many(self, mapping: Dict[str, Any], ex: int | None = None) -> None:
+        if len(mapping) < 2:
+            for name, value in mapping.items():
+                self.set(name=name, value=value, ex=ex)
+            return
+        pipeline = self.__client.pipeline(transaction=False)
+        for name, value in mapping.items():
+            pipeline.set(name, value, ex=ex)
+        pipeline.execute()
+
+    async def aset_many(self, mapping: Dict[str, Any], ex: int | None = None) -> None:
+        if len(mapping) < 2:
+            for name, value in mapping.items():
+                await self.aset(name=name, value=value, ex=ex)
+            return
+        pipeline = self.__async_client.pipeline(transaction=False)
+        for name, value in mapping.items():
+            pipeline.set(name, value, ex=ex)
+        await pipeline.execute()
+
+    def delete(self, *names: str) -> int:
+        return self.__client.delete(*names)
+
+    async def adelete(self, *names: str) -> int:
+        return await self.__async_client.delete(*names)
@@ -0,0 +1,210 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from logging import Logger
+from typing import Dict, Iterable, Iterator, List, Tuple
+try:
+    import fcntl
+except ImportError:  # fcntl is POSIX only, the cache is then unavailable
+    fcntl = None
+
+MAGIC: bytes = b"SMC1"
+# magic, number of buckets, size of the data region, logical write position
+HEADER: struct.Struct = struct.Struct("<4sIQQ")
+HEADER_SIZE: int = 64
+# key hash and logical position of the record plus one, zero for an empty bucket
+BUCKET: struct.Struct = struct.Struct("<QQ")
+# key length, value length and expiry as a Unix time, zero for none
+RECORD: struct.Struct = struct.Struct("<HId")
+# buckets probed for a key before the first one is reused
+PROBES: int = 8
+
+class SharedMemoryCache:
+    """Byte cache shared by the worker processes of a host through a memory-mapped file.
+
+    The file holds a hash table of buckets and a data region written as a ring: every value is
+    appended after the previous one and, once the region is full, overwrites the oldest, so the
+    cache evicts in insertion order without any bookkeeping. A bucket points at the logical
+    position of its record, and a record that has been overwritten since is recognized from that
+    position and ignored. Records also hold their key, so a hash collision is never served.
+
+    Processes serialize writes with an exclusive `flock` on the file and reads with a shared one.
+    Values are copied out of the mapping, as a record may be overwritten as soon as the lock is
+    released. The file is `<path>.<size>.<max_entries>`, so a worker configured with another layout
+    maps a file of its own; a file in use is never truncated, which would crash the processes that
+    have it mapped.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            size: int = 256 << 20,
+            max_entries: int = 65536,
+            logger: Logger | None = None,
+        ) -> None:
+        if fcntl is None:
+            raise RuntimeError("The shared memory cache needs fcntl, which is not available on this platform")
+        self.__logger: Logger = logger or Logger(name="shared_memory_cache")
+        self.__lock: threading.Lock = threading.Lock()
+        self.__path: str = f"{path}.{size}.{max_entries}"
+        os.makedirs(os.path.dirname(os.path.abspath(self.__path)), exist_ok=True)
+        self.__fd: int = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            with self.__file_lock(exclusive=True):
+                self.__buckets, self.__data_size = self.__open(size=size, max_entries=max_entries)
+        except BaseException:
+            os.close(self.__fd)
+            raise
+        self.__data_offset: int = HEADER_SIZE + self.__buckets * BUCKET.size
+        self.__hits: int = 0
+        self.__misses: int = 0
+        self.__writes: int = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.__hits, "misses": self.__misses, "writes": self.__writes, "bytes": self.__data_size}
+
+    def get(self, name: str) -> bytes | None:
+        """Return a copy of the value of `name`, or None"""
+        with self.__lock, self.__file_lock(exclusive=False):
+            location: Tuple[int, int] | None = self.__find(key=name.encode(encoding="utf-8"))
+            return bytes(self.__mmap[location[0]:location[0] + location[1]]) if location is not None else None
+
+    def get_many(self, names: Iterable[str]) -> List[bytes | None]:
+        values: List[bytes | None] = []
+        with self.__lock, self.__file_lock(exclusive=False):
+            for name in names:
+                location: Tuple[int, int] | None = self.__find(key=name.encode(encoding="utf-8"))
+                values.append(bytes(self.__mmap[location[0]:location[0] + location[1]]) if location is not None else None)
+        return values
+
+    def set(self, name: str, value: bytes | memoryview | str, ex: float | timedelta | None = None) -> bool:
+        """Store `value`; values larger than the data region are not stored"""
+        return self.set_many(mapping={name: value}, ex=ex) == 1
+
+    def set_many(self, mapping: Dict[str, bytes | memoryview | str], ex: float | timedelta | None = None) -> int:
+        """Store the values and return how many were stored"""
+        expires_at: float = 0.0
+        if ex is not None:
+            expires_at = time.time() + (ex.total_seconds() if isinstance(ex, timedelta) else float(ex))
+        stored: int = 0
+        with self.__lock, self.__file_lock(exclusive=True):
+            for name, value in mapping.items():
+                stored += self.__write(
+                    key=name.encode(encoding="utf-8"),
+                    value=value.encode(encoding="utf-8") if isinstance(value, str) else value,
+                    expires_at=expires_at)
+        return stored
+
+    def delete(self, *names: str) -> int:
+        deleted: int = 0
+        with self.__lock, self.__file_lock(exclusive=True):
+            for name in names:
+                slot: int | None = self.__slot(key=name.encode(encoding="utf-8"))
+                if slot is not None:
+                    BUCKET.pack_into(self.__mmap, HEADER_SIZE + slot * BUCKET.size, 0, 0)
+                    deleted += 1
+        return deleted
+
+    def close(self) -> None:
+        self.__mmap.close()
+        os.close(self.__fd)
+
+    def __open(self, size: int, max_entries: int) -> Tuple[int, int]:
+        """Map the file, initializing it unless another process already did; the exclusive lock must be held"""
+        buckets: int = 1 << max(max_entries - 1, 1).bit_length()
+        data_size: int = size - HEADER_SIZE - buckets * BUCKET.size
+        if data_size <= 0:
+            raise ValueError(f"A shared memory cache of {size} bytes cannot hold {buckets} buckets")
+        file_size: int = os.fstat(self.__fd).st_size
+        if file_size == 0:
+            os.ftruncate(self.__fd, size)
+        elif file_size != size:
+            raise ValueError(f"{self.__path} is not a shared memory cache of {size} bytes")
+
+        self.__mmap: mmap.mmap = mmap.mmap(self.__fd, size)
+        header: Tuple[bytes, int, int, int] = HEADER.unpack_from(self.__mmap, 0)
+        if header[0] == bytes(len(MAGIC)):
+            # a new file, or one whose initialization was interrupted before anything was stored
+            HEADER.pack_into(self.__mmap, 0, MAGIC, buckets, data_size, 0)
+        elif header[:3] != (MAGIC, buckets, data_size):
+            self.__mmap.close()
+            raise ValueError(f"{self.__path} is not a shared memory cache of {max_entries} entries")
+        return buckets, data_size
+
+    @contextmanager
+    def __file_lock(self, exclusive: bool) -> Iterator[None]:
+        fcntl.flock(self.__fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.__fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def __hash(key: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), byteorder="little") or 1
+
+    def __write_position(self) -> int:
+        return HEADER.unpack_from(self.__mmap, 0)[3]
+
+    def __slot(self, key: bytes) -> int | None:
+        """Bucket of the live record of `key`, or None"""
+        key_hash: int = self.__hash(key=key)
+        write_position: int = self.__write_position()
+        for probe in range(PROBES):
+            slot: int = (key_hash + probe) & (self.__buckets - 1)
+            bucket_hash, position = BUCKET.unpack_from(self.__mmap, HEADER_SIZE + slot * BUCKET.size)
+            if bucket_hash != key_hash or position == 0 or position - 1 + self.__data_size < write_position:
+                continue
+            offset: int = self.__data_offset + (position - 1) % self.__data_size
+            key_length, _, _ = RECORD.unpack_from(self.__mmap, offset)
+            if self.__mmap[offset + RECORD.size:offset + RECORD.size + key_length] == key:
+                return slot
+        return None
+
+    def __find(self, key: bytes) -> Tuple[int, int] | None:
+        """Offset and length of the live value of `key`, or None"""
+        slot: int | None = self.__slot(key=key)
+        if slot is not None:
+            _, position = BUCKET.unpack_from(self.__mmap, HEADER_SIZE + slot * BUCKET.size)
+            offset: int = self.__data_offset + (position - 1) % self.__data_size
+            key_length, value_length, expires_at = RECORD.unpack_from(self.__mmap, offset)
+            if expires_at == 0 or expires_at > time.time():
+                self.__hits += 1
+                return offset + RECORD.size + key_length, value_length
+        self.__misses += 1
+        return None
+
+    def __write(self, key: bytes, value: bytes | memoryview, expires_at: float) -> int:
+        length: int = RECORD.size + len(key) + len(value)
+        if length > self.__data_size:
+            return 0
+        magic, buckets, data_size, position = HEADER.unpack_from(self.__mmap, 0)
+        # records never wrap around the end of the region
+        if position % data_size + length > data_size:
+            position += data_size - position % data_size
+        offset: int = self.__data_offset + position % data_size
+        RECORD.pack_into(self.__mmap, offset, len(key), len(value), expires_at)
+        self.__mmap[offset + RECORD.size:offset + RECORD.size + len(key)] = key
+        self.__mmap[offset + RECORD.size + len(key):offset + length] = value
+        HEADER.pack_into(self.__mmap, 0, magic, buckets, data_size, position + length)
+
+        key_hash: int = self.__hash(key=key)
+        slot: int | None = self.__slot(key=key)
+        if slot is None:
+            # the first bucket that is empty or points at an overwritten record, else the first probed
+            slot = key_hash & (self.__buckets - 1)
+            for probe in range(PROBES):
+                candidate: int = (key_hash + probe) & (self.__buckets - 1)
+                _, candidate_position = BUCKET.unpack_from(self.__mmap, HEADER_SIZE + candidate * BUCKET.size)
+                if candidate_position == 0 or candidate_position - 1 + data_size < position + length:
+                    slot = candidate
+                    break
+        BUCKET.pack_into(self.__mmap, HEADER_SIZE + slot * BUCKET.size, key_hash, position + 1)
+        self.__writes += 1
+        return 1
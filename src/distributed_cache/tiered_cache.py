@@ -0,0 +1,282 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from logging import Logger
+from typing import Any, Awaitable, Callable, Dict, Iterable, List
+from local_cache import LocalCache
+from redis_cache import RedisCache
+from shared_memory_cache import SharedMemoryCache
+
+# stands in the in-process tier for a value the loader did not find
+MISSING: object = object()
+
+STATS: List[str] = ["local_hits", "host_hits", "shared_hits", "negative_hits", "misses", "loads", "shared_loads", "errors"]
+
+class TieredCache:
+    """Three-tier cache: a bounded in-process `LocalCache`, an optional `SharedMemoryCache` for the
+    worker processes of a host and a shared `RedisCache`, read in that order.
+
+    Reads try the in-process tier first and fill each tier from the ones behind it; writes go to all
+    of them. The host tier serves a value one worker process fetched to the other workers of the
+    host without a round trip; it takes file locks, so the asynchronous methods reach it from a
+    worker thread rather than blocking the event loop. A key
+    that `get_or_load` could not load is remembered in the in-process tier for `negative_ttl`
+    seconds, so repeated lookups of a missing key reach neither Redis nor the loader, and concurrent
+    loads of the same key in a worker wait for the first of them. Errors of the shared tier are
+    logged and count as misses. Statistics are kept per namespace, the part of a key before its
+    first colon.
+    """
+
+    def __init__(
+            self,
+            local: LocalCache | None = None,
+            shared: RedisCache | None = None,
+            host: SharedMemoryCache | None = None,
+            ttl: int | None = None,
+            negative_ttl: float = 30.0,
+            logger: Logger | None = None,
+        ) -> None:
+        self.__local: LocalCache = local if local is not None else LocalCache()
+        self.__shared: RedisCache | None = shared
+        self.__host: SharedMemoryCache | None = host
+        self.__ttl: int | None = ttl
+        self.__negative_ttl: float = negative_ttl
+        self.__logger: Logger = logger or Logger(name="tiered_cache")
+        self.__lock: threading.Lock = threading.Lock()
+        self.__loads: Dict[str, Future] = {}
+        self.__async_loads: Dict[str, asyncio.Future] = {}
+        self.__stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def namespace(name: str) -> str:
+        return name.split(":", 1)[0]
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self.__lock:
+            return {namespace: dict(counters) for namespace, counters in self.__stats.items()}
+
+    @property
+    def entries(self) -> int:
+        """Entries of the in-process tier"""
+        return len(self.__local)
+
+    def get(self, name: str) -> Any | None:
+        """Return the value of `name`, or None"""
+        return self.get_many(names=[name])[0]
+
+    async def aget(self, name: str) -> Any | None:
+        return (await self.aget_many(names=[name]))[0]
+
+    def get_many(self, names: Iterable[str]) -> List[Any | None]:
+        """Return the values of `names`, reading those the in-process tier misses in one round trip"""
+        return [None if value is MISSING else value for value in self.__get_many(names=list(names))]
+
+    async def aget_many(self, names: Iterable[str]) -> List[Any | None]:
+        return [None if value is MISSING else value for value in await self.__aget_many(names=list(names))]
+
+    def set(self, name: str, value: Any, ex: int | None = None) -> None:
+        self.set_many(mapping={name: value}, ex=ex)
+
+    async def aset(self, name: str, value: Any, ex: int | None = None) -> None:
+        await self.aset_many(mapping={name: value}, ex=ex)
+
+    def set_many(self, mapping: Dict[str, Any], ex: int | None = None) -> None:
+        """Store the values in both tiers, writing the shared tier in one round trip"""
+        ex = ex if ex is not None else self.__ttl
+        self.__local.set_many(mapping=mapping, ex=ex)
+        if self.__host is not None:
+            self.__host.set_many(mapping=mapping, ex=ex)
+        if self.__shared is not None and self.__shared.synchronous:
+            try:
+                self.__shared.set_many(mapping=mapping, ex=ex)
+            except Exception as e:
+                self.__error(names=list(mapping), action="write to", error=e)
+
+    async def aset_many(self, mapping: Dict[str, Any], ex: int | None = None) -> None:
+        ex = ex if ex is not None else self.__ttl
+        self.__local.set_many(mapping=mapping, ex=ex)
+        if self.__host is not None:
+            await asyncio.to_thread(self.__host.set_many, mapping=mapping, ex=ex)
+        if self.__shared is not None and self.__shared.asynchronous:
+            try:
+                await self.__shared.aset_many(mapping=mapping, ex=ex)
+            except Exception as e:
+                self.__error(names=list(mapping), action="write to", error=e)
+
+    def delete(self, *names: str) -> None:
+        self.__local.delete(*names)
+        if self.__host is not None:
+            self.__host.delete(*names)
+        if self.__shared is not None and self.__shared.synchronous:
+            try:
+                self.__shared.delete(*names)
+            except Exception as e:
+                self.__error(names=list(names), action="delete from", error=e)
+
+    async def adelete(self, *names: str) -> None:
+        self.__local.delete(*names)
+        if self.__host is not None:
+            await asyncio.to_thread(self.__host.delete, *names)
+        if self.__shared is not None and self.__shared.asynchronous:
+            try:
+                await self.__shared.adelete(*names)
+            except Exception as e:
+                self.__error(names=list(names), action="delete from", error=e)
+
+    def get_or_load(self, name: str, load: Callable[[], Any | None], ex: int | None = None) -> Any | None:
+        """Return the value of `name`, running `load` once for concurrent misses and storing what it returns"""
+        value: Any | None = self.__get_many(names=[name])[0]
+        if value is not None:
+            return None if value is MISSING else value
+        return self.load_once(name=name, load=load, ex=ex)
+
+    def load_once(self, name: str, load: Callable[[], Any | None], ex: int | None = None) -> Any | None:
+        """Run `load` for a key the caller already missed, once for concurrent callers, and store what it returns"""
+        with self.__lock:
+            load_future: Future | None = self.__loads.get(name)
+            leader: bool = load_future is None
+            if leader:
+                load_future = self.__loads[name] = Future()
+            self.__counters(name=name)["shared_loads" if not leader else "loads"] += 1
+        if not leader:
+            return load_future.result()
+
+        try:
+            value: Any | None = load()
+            load_future.set_result(value)
+        except BaseException as e:
+            load_future.set_exception(e)
+            raise
+        finally:
+            with self.__lock:
+                del self.__loads[name]
+        self.__store(name=name, value=value, ex=ex)
+        return value
+
+    async def aget_or_load(
+            self, name: str, load: Callable[[], Awaitable[Any | None]], ex: int | None = None) -> Any | None:
+        """Asynchronous counterpart of get_or_load"""
+        value: Any | None = (await self.__aget_many(names=[name]))[0]
+        if value is not None:
+            return None if value is MISSING else value
+        return await self.aload_once(name=name, load=load, ex=ex)
+
+    async def aload_once(
+            self, name: str, load: Callable[[], Awaitable[Any | None]], ex: int | None = None) -> Any | None:
+        """Asynchronous counterpart of load_once"""
+        load_future: asyncio.Future | None = self.__async_loads.get(name)
+        if load_future is not None:
+            self.__count(name=name, counter="shared_loads")
+            return await asyncio.shield(load_future)
+
+        self.__count(name=name, counter="loads")
+        load_future = self.__async_loads[name] = asyncio.get_running_loop().create_future()
+        try:
+            value: Any | None = await load()
+            load_future.set_result(value)
+        except BaseException as e:
+            load_future.set_exception(e)
+            # retrieve the exception so a future nobody waits for does not log it
+            load_future.exception()
+            raise
+        finally:
+            del self.__async_loads[name]
+        if value is None:
+            self.__local.set(name=name, value=MISSING, ex=self.__negative_ttl)
+        else:
+            await self.aset(name=name, value=value, ex=ex)
+        return value
+
+    def __get_many(self, names: List[str]) -> List[Any]:
+        """Values of `names`, MISSING for the keys known to be missing and None for the unknown ones"""
+        values: List[Any] = self.__get_local(names=names)
+        if self.__host is not None and any(value is None for value in values):
+            self.__get_host(names=names, values=values)
+        missing: List[int] = [index for index, value in enumerate(values) if value is None]
+        if len(missing) > 0 and self.__shared is not None and self.__shared.synchronous:
+            try:
+                shared_values: List[Any | None] = self.__shared.get_many(names=[names[index] for index in missing])
+            except Exception as e:
+                shared_values = [None] * len(missing)
+                self.__error(names=names, action="read from", error=e)
+            found: Dict[str, Any] = self.__fill(names=names, values=values, missing=missing, shared_values=shared_values)
+            if self.__host is not None and len(found) > 0:
+                self.__host.set_many(mapping=found, ex=self.__ttl)
+        else:
+            self.__count_misses(names=[names[index] for index in missing])
+        return values
+
+    async def __aget_many(self, names: List[str]) -> List[Any]:
+        values: List[Any] = self.__get_local(names=names)
+        if self.__host is not None and any(value is None for value in values):
+            await asyncio.to_thread(self.__get_host, names=names, values=values)
+        missing: List[int] = [index for index, value in enumerate(values) if value is None]
+        if len(missing) > 0 and self.__shared is not None and self.__shared.asynchronous:
+            try:
+                shared_values: List[Any | None] = await self.__shared.aget_many(names=[names[index] for index in missing])
+            except Exception as e:
+                shared_values = [None] * len(missing)
+                self.__error(names=names, action="read from", error=e)
+            found: Dict[str, Any] = self.__fill(names=names, values=values, missing=missing, shared_values=shared_values)
+            if self.__host is not None and len(found) > 0:
+                await asyncio.to_thread(self.__host.set_many, mapping=found, ex=self.__ttl)
+        else:
+            self.__count_misses(names=[names[index] for index in missing])
+        return values
+
+    def __store(self, name: str, value: Any | None, ex: int | None) -> None:
+        if value is None:
+            self.__local.set(name=name, value=MISSING, ex=self.__negative_ttl)
+        else:
+            self.set(name=name, value=value, ex=ex)
+
+    def __get_local(self, names: List[str]) -> List[Any | None]:
+        """Values of the in-process tier"""
+        values: List[Any | None] = self.__local.get_many(names=names)
+        for name, value in zip(names, values):
+            if value is not None:
+                self.__count(name=name, counter="negative_hits" if value is MISSING else "local_hits")
+        return values
+
+    def __get_host(self, names: List[str], values: List[Any | None]) -> None:
+        """Complete `values` from the host tier, copying what it finds to the in-process tier"""
+        missing: List[int] = [index for index, value in enumerate(values) if value is None]
+        found: Dict[str, Any] = {}
+        for index, value in zip(missing, self.__host.get_many(names=[names[index] for index in missing])):
+            if value is not None:
+                values[index] = found[names[index]] = value
+                self.__count(name=names[index], counter="host_hits")
+        if len(found) > 0:
+            self.__local.set_many(mapping=found, ex=self.__ttl)
+
+    def __fill(
+            self, names: List[str], values: List[Any | None], missing: List[int], shared_values: List[Any | None]
+        ) -> Dict[str, Any]:
+        """Put the values found in the shared tier in `values` and in the in-process tier, and return them"""
+        found: Dict[str, Any] = {}
+        for index, value in zip(missing, shared_values):
+            values[index] = value
+            if value is not None:
+                found[names[index]] = value
+            self.__count(name=names[index], counter="shared_hits" if value is not None else "misses")
+        if len(found) > 0:
+            self.__local.set_many(mapping=found, ex=self.__ttl)
+        return found
+
+    def __count_misses(self, names: List[str]) -> None:
+        for name in names:
+            self.__count(name=name, counter="misses")
+
+    def __error(self, names: List[str], action: str, error: Exception) -> None:
+        self.__logger.error(msg=f"Failed to {action} the shared cache: {error}")
+        for namespace in {self.namespace(name=name) for name in names}:
+            self.__count(name=namespace, counter="errors")
+
+    def __count(self, name: str, counter: str) -> None:
+        with self.__lock:
+            self.__counters(name=name)[counter] += 1
+
+    def __counters(self, name: str) -> Dict[str, int]:
+        """Counters of the namespace of `name`; the lock must be held"""
+        return self.__stats.setdefault(self.namespace(name=name), dict.fromkeys(STATS, 0))
@@ -0,0 +1,92 @@
+import hashlib
+from array import array
+from logging import Logger
+from typing import Dict, List
+from distributedcache import CacheProtocol, AsyncCacheProtocol, LocalCache, RedisCache, SharedMemoryCache, TieredCache
+
+class EmbeddingCache:
+    """Two-tier cache for query embeddings.
+
+    Embeddings are keyed by model and normalized text and stored as packed float32 values in a
+    `TieredCache`: a bounded in-process LRU, the `SharedMemoryCache` of the host when one is given,
+    so the other worker processes reuse them without a round trip, and, when a shared cache is
+    given, Redis so other hosts can reuse them. Batches are read and written in one round trip.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = 10000,
+            ttl: int = 604800,
+            cache: CacheProtocol | None = None,
+            async_cache: AsyncCacheProtocol | None = None,
+            key_prefix: str = "embedding",
+            host_cache: SharedMemoryCache | None = None,
+            logger: Logger | None = None,
+        ) -> None:
+        self.__key_prefix: str = key_prefix
+        self.__cache: TieredCache = TieredCache(
+            local=LocalCache(max_entries=max_entries, ttl=ttl),
+            shared=RedisCache(client=cache, async_client=async_cache) if cache is not None or async_cache is not None else None,
+            host=host_cache,
+            ttl=ttl,
+            logger=logger or Logger(name="embedding_cache"))
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Collapse whitespace and case so trivially different queries share an entry"""
+        return " ".join(text.split()).casefold()
+
+    def key(self, model: str, text: str) -> str:
+        digest: str = hashlib.sha256(self.normalize(text=text).encode(encoding="utf-8")).hexdigest()
+        return f"{self.__key_prefix}:{model}:{digest}"
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        counters: Dict[str, int] = self.__cache.stats.get(self.__key_prefix, {})
+        return {
+            "hits": counters.get("local_hits", 0),
+            "host_hits": counters.get("host_hits", 0),
+            "shared_hits": counters.get("shared_hits", 0),
+            "misses": counters.get("misses", 0),
+            "entries": self.__cache.entries,
+        }
+
+    def get(self, model: str, text: str) -> List[float] | None:
+        """Return the cached embedding of `text`, or None"""
+        return self.get_many(model=model, texts=[text])[0]
+
+    async def aget(self, model: str, text: str) -> List[float] | None:
+        """Return the cached embedding of `text`, or None, without blocking the event loop"""
+        return (await self.aget_many(model=model, texts=[text]))[0]
+
+    def get_many(self, model: str, texts: List[str]) -> List[List[float] | None]:
+        """Return the cached embeddings of `texts`, None for those that are not cached"""
+        return [self.__unpack(packed=packed) for packed in self.__cache.get_many(
+            names=[self.key(model=model, text=text) for text in texts])]
+
+    async def aget_many(self, model: str, texts: List[str]) -> List[List[float] | None]:
+        return [self.__unpack(packed=packed) for packed in await self.__cache.aget_many(
+            names=[self.key(model=model, text=text) for text in texts])]
+
+    def set(self, model: str, text: str, embedding: List[float]) -> None:
+        self.set_many(model=model, embeddings={text: embedding})
+
+    async def aset(self, model: str, text: str, embedding: List[float]) -> None:
+        await self.aset_many(model=model, embeddings={text: embedding})
+
+    def set_many(self, model: str, embeddings: Dict[str, List[float]]) -> None:
+        """Store the embedding of every text"""
+        self.__cache.set_many(mapping={
+            self.key(model=model, text=text): array("f", embedding).tobytes() for text, embedding in embeddings.items()})
+
+    async def aset_many(self, model: str, embeddings: Dict[str, List[float]]) -> None:
+        await self.__cache.aset_many(mapping={
+            self.key(model=model, text=text): array("f", embedding).tobytes() for text, embedding in embeddings.items()})
+
+    @staticmethod
+    def __unpack(packed: bytes | None) -> List[float] | None:
+        if packed is None:
+            return None
+        embedding: array = array("f")
+        embedding.frombytes(packed)
+        return embedding.tolist()
@@ -1,2 +1,11 @@
 """The main module for functions."""
+from search_function import SearchFunction
 from search_vector_function import SearchVectorFunction
+from embedding_cache import EmbeddingCache
+from page_image_cache import PageImageCache, PageImageEntry
+from search_result_cache import SearchResultCache
+from retriever import Retriever, AzureSearchRetriever
+from vector_index import VectorIndex
+from graph_index import GraphIndex
+from graph_search_function import GraphSearchFunction
+from retrieval_orchestrator import RetrievalOrchestrator, reciprocal_rank_fusion
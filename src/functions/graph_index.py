@@ -0,0 +1,205 @@
+import json
+import re
+from typing import Any, Dict, Iterable, List, Tuple
+import numpy as np
+
+# type of the nodes that stand for indexed pages, whose ids are the page image names
+PAGE_TYPE: str = "Page"
+
+class GraphIndex:
+    """In-memory graph of the ontology entities and the pages that mention them.
+
+    Adjacency is stored in compressed sparse row form: the edges of node `i` are the positions
+    `indptr[i]:indptr[i + 1]` of `indices` (their targets) and `edge_relations` (their relation ids),
+    so expanding a neighborhood is a handful of array operations. Edges are traversable in both
+    directions unless the graph is built as directed; `edge_inverse` flags the mirrored copies, so
+    an edge walked backwards is reported with its relation pointing the right way.
+
+    The file read by `load` is the local stand-in for the graph database: a JSON object with
+    `nodes` ({"id", "type", "name"}) and `edges` ({"source", "target", "relation"}) as exported
+    from Cosmos DB.
+    """
+
+    def __init__(
+            self,
+            node_ids: List[str],
+            node_types: np.ndarray,
+            node_names: List[str],
+            types: List[str],
+            relations: List[str],
+            indptr: np.ndarray,
+            indices: np.ndarray,
+            edge_relations: np.ndarray,
+            edge_inverse: np.ndarray | None = None,
+        ) -> None:
+        self.__node_ids: List[str] = node_ids
+        self.__node_types: np.ndarray = node_types
+        self.__node_names: List[str] = node_names
+        self.__types: List[str] = types
+        self.__relations: List[str] = relations
+        self.__indptr: np.ndarray = indptr
+        self.__indices: np.ndarray = indices
+        self.__edge_relations: np.ndarray = edge_relations
+        self.__edge_inverse: np.ndarray = edge_inverse if edge_inverse is not None else np.zeros(
+            len(edge_relations), dtype=bool)
+        self.__lookup: Dict[str, int] = {}
+        for node, (node_id, name) in enumerate(zip(node_ids, node_names)):
+            self.__lookup.setdefault(self.normalize(text=name), node)
+            self.__lookup[self.normalize(text=node_id)] = node
+        # entity names as word sequences, to find the entities a question mentions
+        self.__mentions: Dict[Tuple[str, ...], int] = {}
+        for node, name in enumerate(node_names):
+            if types[node_types[node]] != PAGE_TYPE:
+                self.__mentions.setdefault(self.words(text=name), node)
+        self.__max_mention_words: int = max((len(words) for words in self.__mentions), default=0)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split()).casefold()
+
+    @staticmethod
+    def words(text: str) -> Tuple[str, ...]:
+        return tuple(re.findall(r"\w+", text.casefold()))
+
+    @classmethod
+    def from_graph(cls, nodes: Iterable[Dict[str, Any]], edges: Iterable[Dict[str, Any]], directed: bool = False) -> "GraphIndex":
+        """Build the index from node and edge records"""
+        nodes = list(nodes)
+        positions: Dict[str, int] = {node["id"]: position for position, node in enumerate(nodes)}
+        types: List[str] = sorted({node.get("type", PAGE_TYPE) for node in nodes})
+        type_ids: Dict[str, int] = {node_type: type_id for type_id, node_type in enumerate(types)}
+
+        sources: List[int] = []
+        targets: List[int] = []
+        relation_names: List[str] = []
+        for edge in edges:
+            if edge["source"] not in positions or edge["target"] not in positions:
+                raise ValueError(f"Edge {edge['source']} -> {edge['target']} references an unknown node")
+            sources.append(positions[edge["source"]])
+            targets.append(positions[edge["target"]])
+            relation_names.append(edge["relation"])
+        relations: List[str] = sorted(set(relation_names))
+        relation_positions: Dict[str, int] = {relation: position for position, relation in enumerate(relations)}
+        relation_ids: np.ndarray = np.array(
+            [relation_positions[relation] for relation in relation_names], dtype=np.int32)
+
+        source_array: np.ndarray = np.array(sources, dtype=np.int64)
+        target_array: np.ndarray = np.array(targets, dtype=np.int64)
+        inverse: np.ndarray = np.zeros(len(relation_ids), dtype=bool)
+        if not directed:
+            source_array, target_array = (
+                np.concatenate([source_array, target_array]), np.concatenate([target_array, source_array]))
+            relation_ids = np.concatenate([relation_ids, relation_ids])
+            inverse = np.concatenate([inverse, np.ones(len(inverse), dtype=bool)])
+
+        order: np.ndarray = np.argsort(source_array, kind="stable")
+        indptr: np.ndarray = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source_array, minlength=len(nodes)), out=indptr[1:])
+        return cls(
+            node_ids=[node["id"] for node in nodes],
+            node_types=np.array([type_ids[node.get("type", PAGE_TYPE)] for node in nodes], dtype=np.int32),
+            node_names=[node.get("name", node["id"]) for node in nodes],
+            types=types,
+            relations=relations,
+            indptr=indptr,
+            indices=target_array[order].astype(np.int32),
+            edge_relations=relation_ids[order],
+            edge_inverse=inverse[order],
+        )
+
+    @classmethod
+    def load(cls, path: str, directed: bool = False) -> "GraphIndex":
+        with open(path, mode="r", encoding="utf-8") as file:
+            graph: Dict[str, Any] = json.load(file)
+        return cls.from_graph(nodes=graph["nodes"], edges=graph["edges"], directed=directed)
+
+    def __len__(self) -> int:
+        return len(self.__node_ids)
+
+    @property
+    def relations(self) -> List[str]:
+        return list(self.__relations)
+
+    def find(self, name: str) -> int | None:
+        """Node named or identified by `name`; a page may be given by its path under the image directory"""
+        key: str = self.normalize(text=name)
+        while True:
+            node: int | None = self.__lookup.get(key)
+            if node is not None or "/" not in key:
+                return node
+            key = key.split("/", 1)[1]
+
+    def mentions(self, text: str) -> List[str]:
+        """Ids of the entities named in `text`, in the order they appear, longest names first"""
+        words: Tuple[str, ...] = self.words(text=text)
+        found: List[str] = []
+        start: int = 0
+        while start < len(words):
+            for length in range(min(self.__max_mention_words, len(words) - start), 0, -1):
+                node: int | None = self.__mentions.get(words[start:start + length])
+                if node is not None:
+                    if self.__node_ids[node] not in found:
+                        found.append(self.__node_ids[node])
+                    start += length
+                    break
+            else:
+                start += 1
+        return found
+
+    def node(self, node: int) -> Dict[str, str]:
+        return {
+            "id": self.__node_ids[node],
+            "type": self.__types[self.__node_types[node]],
+            "name": self.__node_names[node],
+        }
+
+    def expand(self, names: List[str], hops: int = 1, relation: str | None = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Nodes reachable from the named nodes within `hops` edges, closest first, with the edge that reached them.
+
+        `inverse` tells that the edge was walked backwards, from its target to its source.
+        """
+        seeds: List[int] = [node for node in (self.find(name=name) for name in names) if node is not None]
+        if len(seeds) == 0:
+            return []
+        relation_id: int | None = None
+        if relation is not None:
+            if relation not in self.__relations:
+                return []
+            relation_id = self.__relations.index(relation)
+
+        visited: np.ndarray = np.zeros(len(self.__node_ids), dtype=bool)
+        frontier: np.ndarray = np.unique(np.array(seeds, dtype=np.int64))
+        visited[frontier] = True
+        expanded: List[Dict[str, Any]] = []
+        for hop in range(1, hops + 1):
+            if len(frontier) == 0 or len(expanded) >= limit:
+                break
+            sources, targets, relation_ids, inverse = self.__edges(nodes=frontier)
+            keep: np.ndarray = ~visited[targets]
+            if relation_id is not None:
+                keep &= relation_ids == relation_id
+            sources, targets, relation_ids, inverse = sources[keep], targets[keep], relation_ids[keep], inverse[keep]
+            # the first edge to reach each node
+            _, first = np.unique(targets, return_index=True)
+            first = np.sort(first)[:limit - len(expanded)]
+            for position in first:
+                expanded.append({
+                    **self.node(node=int(targets[position])),
+                    "relation": self.__relations[relation_ids[position]],
+                    "source": self.__node_names[sources[position]],
+                    "inverse": bool(inverse[position]),
+                    "hops": hop,
+                })
+            frontier = targets[first]
+            visited[frontier] = True
+        return expanded
+
+    def __edges(self, nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Sources, targets, relation ids and inverse flags of every edge leaving `nodes`"""
+        starts: np.ndarray = self.__indptr[nodes]
+        lengths: np.ndarray = self.__indptr[nodes + 1] - starts
+        # positions starts[i]..starts[i] + lengths[i] - 1 of every node, without a Python loop
+        positions: np.ndarray = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return (
+            np.repeat(nodes, lengths), self.__indices[positions], self.__edge_relations[positions],
+            self.__edge_inverse[positions])
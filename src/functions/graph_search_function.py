@@ -0,0 +1,36 @@
+from logging import Logger
+from typing import Any, Dict, List
+from graph_index import GraphIndex, PAGE_TYPE
+
+class GraphSearchFunction:
+    """Graph function that finds the entities and pages related to an entity or a page"""
+
+    def __init__(self, logger: Logger, graph_index: GraphIndex, max_hops: int = 1, max_results: int = 25) -> None:
+        self.__logger: Logger = logger
+        self.__graph_index: GraphIndex = graph_index
+        self.__max_hops: int = max_hops
+        self.__max_results: int = max_results
+
+    def search(self, entity: str, relation: str | None = None) -> str:
+        """Describe the neighborhood of an entity, or of a page given by its file name"""
+        self.__logger.debug(msg=f"graph search: {entity} {relation or ''}")
+        related: List[Dict[str, Any]] = self.__graph_index.expand(
+            names=[entity], hops=self.__max_hops, relation=relation, limit=self.__max_results)
+        if len(related) == 0:
+            if self.__graph_index.find(name=entity) is None:
+                return f"No entity or page named {entity} was found in the graph."
+            return f"{entity} has no related entities" + (f" through {relation}." if relation else ".")
+
+        lines: List[str] = []
+        for node in related:
+            target: str = f"file_name: {node['id']}" if node["type"] == PAGE_TYPE else f"{node['name']} ({node['type']})"
+            # an edge walked backwards still points from the subject of its relation to the object
+            if node["inverse"]:
+                lines.append(f"{node['source']} <--{node['relation']}-- {target}")
+            else:
+                lines.append(f"{node['source']} --{node['relation']}--> {target}")
+        return "\n".join(lines)
+
+    async def asearch(self, entity: str, relation: str | None = None) -> str:
+        # the graph is in memory and expanding it takes microseconds
+        return self.search(entity=entity, relation=relation)
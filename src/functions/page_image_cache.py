@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from logging import Logger
+from typing import Dict, Set
+from distributedcache import SharedMemoryCache
+
+@dataclass
+class PageImageEntry:
+    """A page image known to the cache"""
+    blob_name: str
+    digest: str
+    etag: str | None
+    size: int
+    validated_at: float
+
+class PageImageCache:
+    """Content-addressed on-disk cache of the page images downloaded from Blob Storage.
+
+    Page images are stored once per content digest under `<directory>/.cache/objects` and linked
+    to `<directory>/<blob name>`, the path the agent and the app read, unless no local path is given. Every file is written to a
+    temporary name and renamed into place, so concurrent workers never see a partial image.
+    Entries younger than `max_age` seconds are served without a request; older ones are
+    revalidated with their ETag. The least recently used images are evicted once the cache holds
+    more than `max_bytes`. When a `memory_cache` is given, the images read back are also kept in
+    that memory-mapped cache shared by the worker processes of the host, so a page one worker
+    read is not read from disk again by the others.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            max_bytes: int = 1 << 30,
+            max_age: float = 300.0,
+            memory_cache: SharedMemoryCache | None = None,
+            logger: Logger | None = None,
+        ) -> None:
+        self.__directory: str = directory
+        self.__objects_directory: str = os.path.join(directory, ".cache", "objects")
+        self.__refs_directory: str = os.path.join(directory, ".cache", "refs")
+        self.__max_bytes: int = max_bytes
+        self.__max_age: float = max_age
+        self.__memory_cache: SharedMemoryCache | None = memory_cache
+        self.__logger: Logger = logger or Logger(name="page_image_cache")
+        self.__lock: threading.Lock = threading.Lock()
+        self.__refs: Dict[str, PageImageEntry] = {}
+        self.__blob_names: Dict[str, Set[str]] = {}
+        self.__objects: OrderedDict[str, int] = OrderedDict()
+        self.__size: int = 0
+        self.__hits: int = 0
+        self.__revalidations: int = 0
+        self.__misses: int = 0
+        self.__evictions: int = 0
+        self.__bytes_saved: int = 0
+
+        os.makedirs(self.__objects_directory, exist_ok=True)
+        os.makedirs(self.__refs_directory, exist_ok=True)
+        self.__load()
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        requests: int = self.__hits + self.__revalidations + self.__misses
+        return {
+            "hits": self.__hits,
+            "revalidations": self.__revalidations,
+            "misses": self.__misses,
+            "evictions": self.__evictions,
+            "hit_ratio": (self.__hits + self.__revalidations) / requests if requests > 0 else 0.0,
+            "bytes_saved": self.__bytes_saved,
+            "bytes": self.__size,
+        }
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.__objects_directory, digest[:2], digest)
+
+    def read(self, entry: PageImageEntry) -> bytes | None:
+        """Return the cached image of `entry`, or None if it has been evicted"""
+        if self.__memory_cache is not None:
+            data: bytes | None = self.__memory_cache.get(name=self.__memory_key(digest=entry.digest))
+            if data is not None:
+                return data
+        try:
+            with open(self.object_path(digest=entry.digest), "rb") as object_file:
+                data = object_file.read()
+        except FileNotFoundError:
+            return None
+        if self.__memory_cache is not None:
+            self.__memory_cache.set(name=self.__memory_key(digest=entry.digest), value=data)
+        return data
+
+    def lookup(self, blob_name: str, local_path: str | None) -> PageImageEntry | None:
+        """Return the cached image of `blob_name` if it can be served without a request"""
+        entry: PageImageEntry | None = self.__ref(blob_name=blob_name)
+        if entry is None or time.time() - entry.validated_at > self.__max_age:
+            return None
+        if not self.__materialize(entry=entry, local_path=local_path):
+            return None
+
+        with self.__lock:
+            self.__hits += 1
+            self.__bytes_saved += entry.size
+        return entry
+
+    def etag(self, blob_name: str) -> str | None:
+        """ETag to revalidate a stale entry with, or None if the image must be downloaded"""
+        entry: PageImageEntry | None = self.__ref(blob_name=blob_name)
+        if entry is None or not os.path.exists(self.object_path(digest=entry.digest)):
+            return None
+        return entry.etag
+
+    def revalidate(self, blob_name: str, local_path: str | None) -> PageImageEntry | None:
+        """Record that Blob Storage reported the cached image as not modified"""
+        entry: PageImageEntry | None = self.__ref(blob_name=blob_name)
+        if entry is None:
+            return None
+        entry = PageImageEntry(
+            blob_name=blob_name, digest=entry.digest, etag=entry.etag, size=entry.size, validated_at=time.time())
+        self.__write_ref(entry=entry)
+        if not self.__materialize(entry=entry, local_path=local_path):
+            return None
+
+        with self.__lock:
+            self.__revalidations += 1
+            self.__bytes_saved += entry.size
+        return entry
+
+    def store(self, blob_name: str, local_path: str | None, data: bytes, etag: str | None) -> PageImageEntry:
+        """Add a freshly downloaded image to the cache and link it to `local_path`, if given"""
+        digest: str = hashlib.sha256(data).hexdigest()
+        object_path: str = self.object_path(digest=digest)
+        if not os.path.exists(object_path):
+            self.__write_atomic(path=object_path, data=data)
+        if self.__memory_cache is not None:
+            self.__memory_cache.set(name=self.__memory_key(digest=digest), value=data)
+
+        entry = PageImageEntry(blob_name=blob_name, digest=digest, etag=etag, size=len(data), validated_at=time.time())
+        self.__write_ref(entry=entry)
+        with self.__lock:
+            self.__misses += 1
+            if digest not in self.__objects:
+                self.__size += len(data)
+            self.__objects[digest] = len(data)
+            self.__objects.move_to_end(key=digest)
+        self.__materialize(entry=entry, local_path=local_path)
+        self.__evict()
+        return entry
+
+    @staticmethod
+    def __memory_key(digest: str) -> str:
+        return f"page:{digest}"
+
+    def __ref(self, blob_name: str) -> PageImageEntry | None:
+        entry: PageImageEntry | None = self.__refs.get(blob_name)
+        ref_path: str = self.__ref_path(blob_name=blob_name)
+        # another worker may have downloaded or revalidated the image since
+        if entry is None or time.time() - entry.validated_at > self.__max_age:
+            try:
+                with open(ref_path, "r", encoding="utf-8") as ref_file:
+                    entry = PageImageEntry(**json.load(ref_file))
+                self.__remember(entry=entry)
+            except FileNotFoundError:
+                return entry
+            except (ValueError, TypeError) as e:
+                self.__logger.error(msg=f"Ignoring corrupt page image cache entry {ref_path}: {e}")
+        return entry
+
+    def __remember(self, entry: PageImageEntry) -> None:
+        with self.__lock:
+            previous: PageImageEntry | None = self.__refs.get(entry.blob_name)
+            if previous is not None and previous.digest != entry.digest:
+                self.__blob_names.get(previous.digest, set()).discard(entry.blob_name)
+            self.__refs[entry.blob_name] = entry
+            self.__blob_names.setdefault(entry.digest, set()).add(entry.blob_name)
+
+    def __write_ref(self, entry: PageImageEntry) -> None:
+        self.__write_atomic(
+            path=self.__ref_path(blob_name=entry.blob_name),
+            data=json.dumps(asdict(entry)).encode(encoding="utf-8"))
+        self.__remember(entry=entry)
+
+    def __ref_path(self, blob_name: str) -> str:
+        return os.path.join(self.__refs_directory, hashlib.sha1(blob_name.encode(encoding="utf-8")).hexdigest() + ".json")
+
+    def __materialize(self, entry: PageImageEntry, local_path: str | None) -> bool:
+        """Atomically point `local_path` at the cached object; False if the object is gone"""
+        object_path: str = self.object_path(digest=entry.digest)
+        if local_path is None:
+            if not os.path.exists(object_path):
+                return False
+            self.__touch(digest=entry.digest)
+            return True
+        try:
+            if os.path.exists(local_path) and os.path.samefile(local_path, object_path):
+                self.__touch(digest=entry.digest)
+                return True
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            temporary_path: str = self.__temporary_path(path=local_path)
+            try:
+                os.link(object_path, temporary_path)
+            except OSError:
+                with open(object_path, "rb") as object_file:
+                    data: bytes = object_file.read()
+                with open(temporary_path, "wb") as temporary_file:
+                    temporary_file.write(data)
+            os.replace(temporary_path, local_path)
+        except FileNotFoundError:
+            return False
+
+        self.__touch(digest=entry.digest)
+        return True
+
+    def __touch(self, digest: str) -> None:
+        with self.__lock:
+            if digest in self.__objects:
+                self.__objects.move_to_end(key=digest)
+
+    def __evict(self) -> None:
+        while True:
+            with self.__lock:
+                if self.__size <= self.__max_bytes or len(self.__objects) <= 1:
+                    return
+                digest, size = self.__objects.popitem(last=False)
+                self.__size -= size
+                self.__evictions += 1
+                blob_names: Set[str] = self.__blob_names.pop(digest, set())
+                for blob_name in blob_names:
+                    self.__refs.pop(blob_name, None)
+
+            for path in [self.object_path(digest=digest)] + [
+                    path for blob_name in blob_names
+                    for path in [os.path.join(self.__directory, blob_name), self.__ref_path(blob_name=blob_name)]]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def __load(self) -> None:
+        """Rebuild the index from the files left by this and other workers"""
+        objects: list[tuple[float, str, int]] = []
+        for root, _, files in os.walk(self.__objects_directory):
+            for name in files:
+                if name.startswith("."):
+                    continue
+                stat: os.stat_result = os.stat(os.path.join(root, name))
+                objects.append((stat.st_atime, name, stat.st_size))
+        for _, digest, size in sorted(objects):
+            self.__objects[digest] = size
+            self.__size += size
+
+        for name in os.listdir(self.__refs_directory):
+            if name.startswith("."):
+                continue
+            try:
+                with open(os.path.join(self.__refs_directory, name), "r", encoding="utf-8") as ref_file:
+                    self.__remember(entry=PageImageEntry(**json.load(ref_file)))
+            except (OSError, ValueError, TypeError):
+                continue
+
+    @staticmethod
+    def __temporary_path(path: str) -> str:
+        directory, name = os.path.split(path)
+        file_descriptor, temporary_path = tempfile.mkstemp(prefix=f".{name}.", dir=directory)
+        os.close(file_descriptor)
+        os.remove(temporary_path)
+        return temporary_path
+
+    def __write_atomic(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        directory, name = os.path.split(path)
+        file_descriptor, temporary_path = tempfile.mkstemp(prefix=f".{name}.", dir=directory)
+        try:
+            with os.fdopen(file_descriptor, "wb") as temporary_file:
+                temporary_file.write(data)
+            os.replace(temporary_path, path)
+        except BaseException:
+            try:
+                os.remove(temporary_path)
+            except FileNotFoundError:
+                pass
+            raise
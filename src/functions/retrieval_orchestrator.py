@@ -0,0 +1,148 @@
+import asyncio
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from logging import Logger
+from typing import Any, Dict, List
+from graph_index import GraphIndex, PAGE_TYPE
+from search_vector_function import SearchVectorFunction
+
+# runs the graph leg of the searches that are not given an executor
+DEFAULT_GRAPH_EXECUTOR: Executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="graph_retrieval")
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merge rankings of the same items; an item scores the sum of 1 / (k + rank) over the rankings it is in"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    # sorted is stable, so ties keep the order of the first ranking they appear in
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
+
+class RetrievalOrchestrator:
+    """Search function that retrieves pages from the vector index and the graph at the same time.
+
+    The graph leg finds the entities a query names, expands their neighborhood to the pages that
+    mention them and downloads those pages while the vector search runs, so a search takes as long
+    as the slower leg. Both rankings are merged with reciprocal rank fusion and a page found by both
+    is returned once. Results have the shape of `SearchVectorFunction.search`, with `image_bytes`.
+    """
+
+    def __init__(
+            self,
+            logger: Logger,
+            search_vector_function: SearchVectorFunction,
+            graph_index: GraphIndex,
+            max_hops: int = 2,
+            max_graph_pages: int = 3,
+            max_results: int = 5,
+            rank_fusion_k: int = 60,
+            executor: Executor | None = None,
+        ) -> None:
+        self.__logger: Logger = logger
+        self.__search_vector_function: SearchVectorFunction = search_vector_function
+        self.__graph_index: GraphIndex = graph_index
+        self.__max_hops: int = max_hops
+        self.__max_graph_pages: int = max_graph_pages
+        self.__max_results: int = max_results
+        self.__rank_fusion_k: int = rank_fusion_k
+        self.__executor: Executor = executor or DEFAULT_GRAPH_EXECUTOR
+
+    def search(self, search_query: str) -> list:
+        """Search for related content in the vector index and the graph"""
+        graph_search: Future = self.__executor.submit(self.__graph_search, search_query=search_query)
+        vector_output: list = self.__search_vector_function.search(search_query=search_query)
+        return self.__fuse(vector_output=vector_output, graph_output=graph_search.result())
+
+    async def asearch(self, search_query: str) -> list:
+        """Search for related content in the vector index and the graph without blocking the event loop"""
+        vector_output, graph_output = await asyncio.gather(
+            self.__search_vector_function.asearch(search_query=search_query),
+            self.__agraph_search(search_query=search_query))
+        return self.__fuse(vector_output=vector_output, graph_output=graph_output)
+
+    def search_many(self, queries: List[str]) -> List[list]:
+        """Search for several queries at once; a page is only returned for the first query that finds it"""
+        graph_searches: List[Future] = [
+            self.__executor.submit(self.__graph_search, search_query=query) for query in queries]
+        vector_outputs: List[list] = self.__search_vector_function.search_many(queries=queries)
+        return self.__deduplicate(outputs=[
+            self.__fuse(vector_output=vector_output, graph_output=graph_search.result())
+            for vector_output, graph_search in zip(vector_outputs, graph_searches)])
+
+    async def asearch_many(self, queries: List[str]) -> List[list]:
+        vector_outputs, *graph_outputs = await asyncio.gather(
+            self.__search_vector_function.asearch_many(queries=queries),
+            *[self.__agraph_search(search_query=query) for query in queries])
+        return self.__deduplicate(outputs=[
+            self.__fuse(vector_output=vector_output, graph_output=graph_output)
+            for vector_output, graph_output in zip(vector_outputs, graph_outputs)])
+
+    def embed(self, text: str) -> List[float]:
+        return self.__search_vector_function.embed(text=text)
+
+    async def aembed(self, text: str) -> List[float]:
+        return await self.__search_vector_function.aembed(text=text)
+
+    def page_images(self, page_image_names: List[str]) -> Dict[str, bytes | None]:
+        return self.__search_vector_function.page_images(page_image_names=page_image_names)
+
+    async def apage_images(self, page_image_names: List[str]) -> Dict[str, bytes | None]:
+        return await self.__search_vector_function.apage_images(page_image_names=page_image_names)
+
+    def __graph_search(self, search_query: str) -> list:
+        pages: List[Dict[str, Any]] = self.__graph_pages(search_query=search_query)
+        if len(pages) == 0:
+            return []
+        return self.__graph_output(
+            pages=pages,
+            images=self.__search_vector_function.page_images(page_image_names=[page["id"] for page in pages]))
+
+    async def __agraph_search(self, search_query: str) -> list:
+        pages: List[Dict[str, Any]] = self.__graph_pages(search_query=search_query)
+        if len(pages) == 0:
+            return []
+        return self.__graph_output(
+            pages=pages,
+            images=await self.__search_vector_function.apage_images(page_image_names=[page["id"] for page in pages]))
+
+    def __graph_pages(self, search_query: str) -> List[Dict[str, Any]]:
+        """Pages that mention the entities named in the query, closest first"""
+        entities: List[str] = self.__graph_index.mentions(text=search_query)
+        self.__logger.debug(msg=f"graph entities: {entities}")
+        if len(entities) == 0 or self.__max_graph_pages <= 0:
+            return []
+        pages: List[Dict[str, Any]] = [
+            node for node in self.__graph_index.expand(names=entities, hops=self.__max_hops, limit=10 * self.__max_graph_pages)
+            if node["type"] == PAGE_TYPE]
+        return pages[:self.__max_graph_pages]
+
+    @staticmethod
+    def __graph_output(pages: List[Dict[str, Any]], images: Dict[str, bytes | None]) -> list:
+        # a page that cannot be downloaded cannot be shown to the model
+        return [
+            {
+                'id': None,
+                'image_path': page["id"],
+                'related_content': f"{page['source']} ({page['relation']})",
+                'image_bytes': memoryview(images[page["id"]]),
+            }
+            for page in pages if images.get(page["id"]) is not None]
+
+    def __fuse(self, vector_output: list, graph_output: list) -> list:
+        items: Dict[str, Dict[str, Any]] = {}
+        for item in graph_output + vector_output:
+            # the vector result describes the page better than the edge that reached it
+            items[item['image_path']] = {
+                **items.get(item['image_path'], {}), **{key: value for key, value in item.items() if value is not None}}
+        ranking: List[str] = reciprocal_rank_fusion(
+            rankings=[[item['image_path'] for item in vector_output], [item['image_path'] for item in graph_output]],
+            k=self.__rank_fusion_k)
+        return [items[image_path] for image_path in ranking[:self.__max_results]]
+
+    @staticmethod
+    def __deduplicate(outputs: List[list]) -> List[list]:
+        seen: set[str] = set()
+        deduplicated: List[list] = []
+        for output in outputs:
+            deduplicated.append([item for item in output if item['image_path'] not in seen])
+            seen.update(item['image_path'] for item in output)
+        return deduplicated
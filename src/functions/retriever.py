@@ -0,0 +1,81 @@
+from abc import abstractmethod
+from typing import Any, AsyncIterator, Dict, Iterable, List, Protocol
+from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+from azure.search.documents.models import (
+    QueryAnswerType,
+    QueryCaptionType,
+    QueryType,
+    VectorizedQuery,
+)
+
+# the fields every retriever returns for a result
+SEARCH_FIELDS: List[str] = ["topic", "file_name", "page_number", "related_content"]
+
+class Retriever(Protocol):
+    """Finds the pages closest to a query embedding; results are dicts holding the search fields"""
+
+    @property
+    @abstractmethod
+    def index_name(self) -> str:
+        pass
+
+    @property
+    @abstractmethod
+    def asynchronous(self) -> bool:
+        """Whether asearch runs without blocking the event loop"""
+        pass
+
+    @abstractmethod
+    def search(self, vector: List[float], k: int) -> Iterable[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def asearch(self, vector: List[float], k: int) -> AsyncIterator[Dict[str, Any]]:
+        pass
+
+class AzureSearchRetriever:
+    """Hybrid semantic and vector search on an Azure AI Search index"""
+
+    def __init__(
+            self,
+            search_client: SearchClient,
+            async_search_client: AsyncSearchClient | None = None,
+            index_name: str = "default",
+        ) -> None:
+        self.__search_client: SearchClient = search_client
+        self.__async_search_client: AsyncSearchClient | None = async_search_client
+        self.__index_name: str = index_name
+
+    @property
+    def index_name(self) -> str:
+        return self.__index_name
+
+    @property
+    def asynchronous(self) -> bool:
+        return self.__async_search_client is not None
+
+    def search(self, vector: List[float], k: int) -> Iterable[Dict[str, Any]]:
+        """Results in relevance order, as the service returns them"""
+        return self.__search_client.search(**self.__search_args(vector=vector, k=k))
+
+    async def asearch(self, vector: List[float], k: int) -> AsyncIterator[Dict[str, Any]]:
+        async for result in await self.__async_search_client.search(**self.__search_args(vector=vector, k=k)):
+            yield result
+
+    @staticmethod
+    def __search_args(vector: List[float], k: int) -> Dict[str, Any]:
+        vector_query = VectorizedQuery(
+            vector=vector,
+            k_nearest_neighbors=k,
+            fields="contentVector"
+        )
+        return dict(
+            query_type=QueryType.SEMANTIC,
+            semantic_configuration_name='my-semantic-config',
+            query_caption=QueryCaptionType.EXTRACTIVE,
+            query_answer=QueryAnswerType.EXTRACTIVE,
+            vector_queries=[vector_query],
+            select=SEARCH_FIELDS,
+            top=k
+        )
@@ -0,0 +1,41 @@
+from abc import abstractmethod
+from typing import Dict, List, Protocol
+
+class SearchFunction(Protocol):
+    """The search function an agent is given: `SearchVectorFunction` or `RetrievalOrchestrator`.
+
+    Lists every method the agent calls, so a search function that wraps another one has to delegate
+    all of them, and not only the searches, to be accepted.
+    """
+
+    @abstractmethod
+    def search(self, search_query: str) -> list:
+        pass
+
+    @abstractmethod
+    async def asearch(self, search_query: str) -> list:
+        pass
+
+    @abstractmethod
+    def search_many(self, queries: List[str]) -> List[list]:
+        pass
+
+    @abstractmethod
+    async def asearch_many(self, queries: List[str]) -> List[list]:
+        pass
+
+    @abstractmethod
+    def embed(self, text: str) -> List[float]:
+        pass
+
+    @abstractmethod
+    async def aembed(self, text: str) -> List[float]:
+        pass
+
+    @abstractmethod
+    def page_images(self, page_image_names: List[str]) -> Dict[str, bytes | None]:
+        pass
+
+    @abstractmethod
+    async def apage_images(self, page_image_names: List[str]) -> Dict[str, bytes | None]:
+        pass
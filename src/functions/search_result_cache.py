@@ -0,0 +1,156 @@
+import hashlib
+import json
+import time
+from logging import Logger
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from distributedcache import CacheProtocol, AsyncCacheProtocol, LocalCache, RedisCache, TieredCache
+from retriever import SEARCH_FIELDS
+
+class SearchResultCache:
+    """Shared cache of search results keyed by index, normalized query and number of results.
+
+    Only the selected fields of each result are stored, as JSON, in a `TieredCache`, so every worker
+    can reuse a search run by another one within `ttl` seconds and repeated queries in a worker do
+    not reach Redis. Concurrent misses for the same key in a worker wait for the first of them
+    instead of searching again. `invalidate` moves an index to a new generation, which every worker
+    picks up within `generation_refresh_interval` seconds, so results found before re-indexing are
+    no longer returned.
+    """
+
+    def __init__(
+            self,
+            cache: CacheProtocol | None = None,
+            async_cache: AsyncCacheProtocol | None = None,
+            ttl: int = 300,
+            generation_refresh_interval: float = 5.0,
+            max_entries: int = 1024,
+            key_prefix: str = "search",
+            logger: Logger | None = None,
+        ) -> None:
+        self.__shared: RedisCache | None = RedisCache(
+            client=cache, async_client=async_cache) if cache is not None or async_cache is not None else None
+        self.__ttl: int = ttl
+        self.__generation_refresh_interval: float = generation_refresh_interval
+        self.__key_prefix: str = key_prefix
+        self.__logger: Logger = logger or Logger(name="search_result_cache")
+        self.__results: TieredCache = TieredCache(
+            local=LocalCache(max_entries=max_entries, ttl=ttl), shared=self.__shared, ttl=ttl, logger=self.__logger)
+        self.__generations: Dict[str, Tuple[float, str]] = {}
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Collapse whitespace and case so trivially different queries share an entry"""
+        return " ".join(query.split()).casefold()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        counters: Dict[str, int] = self.__results.stats.get(self.__key_prefix, {})
+        return {
+            "hits": counters.get("local_hits", 0) + counters.get("shared_hits", 0),
+            "misses": counters.get("misses", 0),
+            "shared_searches": counters.get("shared_loads", 0),
+        }
+
+    def key(self, index_name: str, query: str, k: int, generation: str) -> str:
+        digest: str = hashlib.sha256(self.normalize(query=query).encode(encoding="utf-8")).hexdigest()
+        return f"{self.__key_prefix}:{index_name}:{generation}:{k}:{digest}"
+
+    def get(self, index_name: str, query: str, k: int) -> List[Dict[str, Any]] | None:
+        """Return the cached results of `query`, or None"""
+        return self.__decode(payload=self.__results.get(
+            name=self.key(index_name=index_name, query=query, k=k, generation=self.__generation(index_name=index_name))))
+
+    async def aget(self, index_name: str, query: str, k: int) -> List[Dict[str, Any]] | None:
+        return self.__decode(payload=await self.__results.aget(
+            name=self.key(index_name=index_name, query=query, k=k, generation=await self.__ageneration(index_name=index_name))))
+
+    def get_or_search(self, index_name: str, query: str, k: int, search: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Return the cached results of `query`, running `search` once for concurrent misses"""
+        key: str = self.key(index_name=index_name, query=query, k=k, generation=self.__generation(index_name=index_name))
+        return self.__decode(payload=self.__results.get_or_load(name=key, load=lambda: self.__encode_search(search=search)))
+
+    async def aget_or_search(
+            self, index_name: str, query: str, k: int,
+            search: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        """Asynchronous counterpart of get_or_search"""
+        key: str = self.key(
+            index_name=index_name, query=query, k=k, generation=await self.__ageneration(index_name=index_name))
+        return self.__decode(payload=await self.__results.aget_or_load(
+            name=key, load=lambda: self.__aencode_search(search=search)))
+
+    def search(self, index_name: str, query: str, k: int, search: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Run `search` for a query `get` already missed, once for concurrent misses, and cache its results"""
+        key: str = self.key(index_name=index_name, query=query, k=k, generation=self.__generation(index_name=index_name))
+        return self.__decode(payload=self.__results.load_once(name=key, load=lambda: self.__encode_search(search=search)))
+
+    async def asearch(
+            self, index_name: str, query: str, k: int,
+            search: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        """Asynchronous counterpart of search"""
+        key: str = self.key(
+            index_name=index_name, query=query, k=k, generation=await self.__ageneration(index_name=index_name))
+        return self.__decode(payload=await self.__results.aload_once(
+            name=key, load=lambda: self.__aencode_search(search=search)))
+
+    def invalidate(self, index_name: str) -> None:
+        """Stop returning the results cached for `index_name`, e.g. after re-indexing"""
+        generation: str = str(time.time_ns())
+        if self.__shared is not None and self.__shared.synchronous:
+            self.__shared.set(name=self.__generation_key(index_name=index_name), value=generation)
+        self.__generations[index_name] = (time.monotonic() + self.__generation_refresh_interval, generation)
+
+    async def ainvalidate(self, index_name: str) -> None:
+        generation: str = str(time.time_ns())
+        if self.__shared is not None and self.__shared.asynchronous:
+            await self.__shared.aset(name=self.__generation_key(index_name=index_name), value=generation)
+        self.__generations[index_name] = (time.monotonic() + self.__generation_refresh_interval, generation)
+
+    def __generation_key(self, index_name: str) -> str:
+        return f"{self.__key_prefix}:{index_name}:generation"
+
+    def __generation(self, index_name: str) -> str:
+        refresh_at, generation = self.__generations.get(index_name, (0.0, "0"))
+        if refresh_at > time.monotonic() or self.__shared is None or not self.__shared.synchronous:
+            return generation
+        try:
+            generation = self.__decode_generation(value=self.__shared.get(name=self.__generation_key(index_name=index_name)))
+        except Exception as e:
+            self.__logger.error(msg=f"Failed to read the search generation from the shared cache: {e}")
+        self.__generations[index_name] = (time.monotonic() + self.__generation_refresh_interval, generation)
+        return generation
+
+    async def __ageneration(self, index_name: str) -> str:
+        refresh_at, generation = self.__generations.get(index_name, (0.0, "0"))
+        if refresh_at > time.monotonic() or self.__shared is None or not self.__shared.asynchronous:
+            return generation
+        try:
+            generation = self.__decode_generation(
+                value=await self.__shared.aget(name=self.__generation_key(index_name=index_name)))
+        except Exception as e:
+            self.__logger.error(msg=f"Failed to read the search generation from the shared cache: {e}")
+        self.__generations[index_name] = (time.monotonic() + self.__generation_refresh_interval, generation)
+        return generation
+
+    @staticmethod
+    def __decode_generation(value: bytes | str | None) -> str:
+        if value is None:
+            return "0"
+        return value.decode(encoding="utf-8") if isinstance(value, bytes) else str(value)
+
+    def __encode_search(self, search: Callable[[], List[Dict[str, Any]]]) -> bytes:
+        return self.__encode(results=[self.__selected_fields(result=result) for result in search()])
+
+    async def __aencode_search(self, search: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> bytes:
+        return self.__encode(results=[self.__selected_fields(result=result) for result in await search()])
+
+    @staticmethod
+    def __decode(payload: bytes | None) -> List[Dict[str, Any]] | None:
+        return json.loads(payload) if payload is not None else None
+
+    @staticmethod
+    def __encode(results: List[Dict[str, Any]]) -> bytes:
+        return json.dumps(results, separators=(",", ":"), ensure_ascii=False).encode(encoding="utf-8")
+
+    @staticmethod
+    def __selected_fields(result: Dict[str, Any]) -> Dict[str, Any]:
+        return {field: result.get(field) for field in SEARCH_FIELDS}
@@ -1,15 +1,27 @@
 import os  
+import asyncio
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from logging import Logger  
-from typing import Any, List, Dict  
-from openai import AzureOpenAI  
-from azure.search.documents import SearchItemPaged, SearchClient  
-from azure.search.documents.models import (  
-    QueryAnswerType,  
-    QueryCaptionType,  
-    QueryType,  
-    VectorizedQuery,  
-)  
+from typing import Any, Callable, List, Dict, Tuple
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from azure.search.documents import SearchClient  
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotModifiedError
 from azure.storage.blob import BlobServiceClient, ContainerClient  
+from azure.storage.blob.aio import ContainerClient as AsyncContainerClient
+from embedding_cache import EmbeddingCache
+from page_image_cache import PageImageCache, PageImageEntry
+from search_result_cache import SearchResultCache
+from retriever import Retriever, AzureSearchRetriever
+from services import RateLimiter, estimate_tokens
+
+# shared by every search that is not given an executor, so concurrent requests stay bounded
+DEFAULT_SEARCH_EXECUTOR: Executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search_vector_function")
+DEFAULT_DOWNLOAD_EXECUTOR: Executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="blob_download")
+# number of results returned for every query
+TOP_K: int = 3
   
 class SearchVectorFunction:  
     """Search function that uses a vector database to search for related content"""  
@@ -17,73 +29,489 @@ class SearchVectorFunction:
     def __init__(  
             self,  
             logger: Logger,  
-            search_client: SearchClient,  
+            search_client: SearchClient | None,  
             client: AzureOpenAI,  
             model: str,  
             image_directory: str,  
-            storage_account_key: str,  
-            storage_account_name: str,  
-            container_name: str  
+            storage_account_key: str | None = None,  
+            storage_account_name: str | None = None,  
+            container_name: str | None = None,  
+            container_client: ContainerClient | None = None,
+            async_search_client: AsyncSearchClient | None = None,
+            async_client: AsyncAzureOpenAI | None = None,
+            async_container_client: AsyncContainerClient | None = None,
+            embedding_cache: EmbeddingCache | None = None,
+            search_executor: Executor | None = None,
+            page_image_cache: PageImageCache | None = None,
+            download_executor: Executor | None = None,
+            download_semaphore: asyncio.Semaphore | None = None,
+            return_image_bytes: bool = False,
+            persist_images: bool = True,
+            search_result_cache: SearchResultCache | None = None,
+            index_name: str | None = None,
+            retriever: Retriever | None = None,
+            rate_limiter: RateLimiter | None = None
         ) -> None:  
         self.__logger: Logger = logger  
-        self.__search_client: SearchClient = search_client  
         self.__client: AzureOpenAI = client  
         self.__model: str = model  
         self.__image_directory: str = image_directory  
-        self.__blob_service_client = BlobServiceClient(  
-            account_url=f"https://{storage_account_name}.blob.core.windows.net",  
-            credential=storage_account_key  
-        )  
-        self.__container_client: ContainerClient = self.__blob_service_client.get_container_client(container_name)  
+        if container_client is None:  
+            blob_service_client = BlobServiceClient(  
+                account_url=f"https://{storage_account_name}.blob.core.windows.net",  
+                credential=storage_account_key  
+            )  
+            container_client = blob_service_client.get_container_client(container_name)  
+        self.__container_client: ContainerClient = container_client  
+        # Azure AI Search unless another retriever, such as a local VectorIndex, is given
+        self.__retriever: Retriever = retriever or AzureSearchRetriever(
+            search_client=search_client, async_search_client=async_search_client, index_name=index_name or "default")
+        self.__async_client: AsyncAzureOpenAI | None = async_client
+        self.__async_container_client: AsyncContainerClient | None = async_container_client
+        self.__embedding_cache: EmbeddingCache | None = embedding_cache
+        self.__search_executor: Executor = search_executor or DEFAULT_SEARCH_EXECUTOR
+        self.__page_image_cache: PageImageCache | None = page_image_cache
+        self.__download_executor: Executor = download_executor or DEFAULT_DOWNLOAD_EXECUTOR
+        self.__download_semaphore: asyncio.Semaphore = download_semaphore or asyncio.Semaphore(value=16)
+        # return the downloaded page images as `image_bytes` so callers do not read them back from disk
+        self.__return_image_bytes: bool = return_image_bytes
+        self.__persist_images: bool = persist_images
+        self.__search_result_cache: SearchResultCache | None = search_result_cache
+        self.__rate_limiter: RateLimiter | None = rate_limiter
+        self.__index_name: str = index_name or self.__retriever.index_name
   
     def search(self, search_query) -> list:  
         """Search for related content based on a search query"""  
-        self.__logger.debug("search query: ", search_query)  
+        self.__logger.debug(msg=f"search query: {search_query}")  
         output = []  
-        vector_query = VectorizedQuery(  
-            vector=self.__get_text_embedding(text=search_query),  
-            k_nearest_neighbors=3,  
-            fields="contentVector"  
-        )  
-        results: SearchItemPaged[Dict] = self.__search_client.search(  
-            query_type=QueryType.SEMANTIC,  
-            semantic_configuration_name='my-semantic-config',  
-            query_caption=QueryCaptionType.EXTRACTIVE,  
-            query_answer=QueryAnswerType.EXTRACTIVE,  
-            vector_queries=[vector_query],  
-            select=["topic", "file_name", "page_number", "related_content"],  
-            top=3  
-        )  
-        for result in results:  
-            self.__logger.debug(msg=f"topic: {result['topic']}")  
-            self.__logger.debug("related_content: ", result['related_content'])  
-            page_image_name = f"{result['file_name']}/page_{result['page_number']}.png"  
-            page_image_local_path = os.path.join(self.__image_directory, page_image_name)  
-            print("page_image_name ", page_image_name)
-            # Ensure the local directory exists  
-            os.makedirs(os.path.dirname(page_image_local_path), exist_ok=True)  
-  
-            # Download the image from Azure Blob Storage to local directory  
-            self.__download_image_from_blob(page_image_name, page_image_local_path)  
-            output.append({  
-                'id': result['id'] if 'id' in result.keys() else None,  
-                'image_path': page_image_name,  
-                'related_content': result['related_content']  
-            })  
-        return output  
+        downloads: Dict[str, Future] = {}
+
+        def start_download(result: Dict) -> None:
+            page_image_name, page_image_local_path = self.__page_image_paths(result=result)
+            # Download the image from Azure Blob Storage to local directory while the next results arrive
+            self.__start_download(
+                page_image_name=page_image_name, page_image_local_path=page_image_local_path, downloads=downloads)
+
+        for result in self.__results(
+                search_query=search_query,
+                vector=lambda: self.__get_text_embedding(text=search_query),
+                on_result=start_download):
+            page_image_name, _ = self.__page_image_paths(result=result)
+            output.append(self.__search_output(result=result, page_image_name=page_image_name))
+        return self.__attach_images(output=output, images=self.__wait_for_downloads(downloads=downloads))
+
+    async def asearch(self, search_query) -> list:
+        """Search for related content based on a search query without blocking the event loop"""
+        if not self.__retriever.asynchronous or self.__async_client is None or self.__async_container_client is None:
+            return await asyncio.to_thread(self.search, search_query=search_query)
+
+        self.__logger.debug(msg=f"search query: {search_query}")
+        output = []
+        downloads: Dict[str, asyncio.Task] = {}
+
+        def start_download(result: Dict) -> None:
+            page_image_name, page_image_local_path = self.__page_image_paths(result=result)
+            self.__astart_download(
+                page_image_name=page_image_name, page_image_local_path=page_image_local_path, downloads=downloads)
+
+        async def vector() -> List[float]:
+            return await self.__aget_text_embedding(text=search_query)
+
+        for result in await self.__aresults(search_query=search_query, vector=vector, on_result=start_download):
+            page_image_name, _ = self.__page_image_paths(result=result)
+            output.append(self.__search_output(result=result, page_image_name=page_image_name))
+        return self.__attach_images(output=output, images=await self.__await_downloads(downloads=downloads))
+
+    def search_many(self, queries: List[str]) -> List[list]:
+        """Search for several queries at once.
+
+        All queries are embedded in one request and searched concurrently. A page found by several
+        queries is only returned, and downloaded, for the first of them.
+        """
+        self.__logger.debug(msg=f"search queries: {queries}")
+        downloads: Dict[str, Future] = {}
+        downloads_lock: threading.Lock = threading.Lock()
+
+        def start_download(result: Dict) -> None:
+            page_image_name, page_image_local_path = self.__page_image_paths(result=result)
+            with downloads_lock:
+                self.__start_download(
+                    page_image_name=page_image_name, page_image_local_path=page_image_local_path, downloads=downloads)
+
+        # embed, in one request, only the queries whose results are not cached
+        cached: Dict[str, List[Dict] | None] = {query: self.__cached_results(search_query=query) for query in queries}
+        missing: List[str] = [query for query, results in cached.items() if results is None]
+        vectors: Dict[str, List[float]] = dict(zip(missing, self.__get_text_embeddings(texts=missing))) if missing else {}
+
+        def search(query: str) -> List[Dict]:
+            return self.__results(
+                search_query=query,
+                vector=lambda: vectors.get(query) or self.__get_text_embedding(text=query),
+                on_result=start_download,
+                cached=cached[query],
+                cache_read=True)
+
+        result_sets: List[List[Dict]] = list(self.__search_executor.map(search, queries))
+        images: Dict[str, bytes | None] = self.__wait_for_downloads(downloads=downloads)
+        return [
+            self.__attach_images(output=output, images=images)
+            for output in self.__deduplicate(result_sets=result_sets)]
+
+    async def asearch_many(self, queries: List[str]) -> List[list]:
+        """Search for several queries at once without blocking the event loop"""
+        if not self.__retriever.asynchronous or self.__async_client is None or self.__async_container_client is None:
+            return await asyncio.to_thread(self.search_many, queries=queries)
+
+        self.__logger.debug(msg=f"search queries: {queries}")
+        downloads: Dict[str, asyncio.Task] = {}
+
+        def start_download(result: Dict) -> None:
+            page_image_name, page_image_local_path = self.__page_image_paths(result=result)
+            self.__astart_download(
+                page_image_name=page_image_name, page_image_local_path=page_image_local_path, downloads=downloads)
+
+        cached: Dict[str, List[Dict] | None] = {
+            query: await self.__acached_results(search_query=query) for query in queries}
+        missing: List[str] = [query for query, results in cached.items() if results is None]
+        vectors: Dict[str, List[float]] = dict(zip(missing, await self.__aget_text_embeddings(texts=missing))) if missing else {}
+
+        async def search(query: str) -> List[Dict]:
+            async def vector() -> List[float]:
+                return vectors.get(query) or await self.__aget_text_embedding(text=query)
+
+            return await self.__aresults(
+                search_query=query, vector=vector, on_result=start_download, cached=cached[query], cache_read=True)
+
+        result_sets: List[List[Dict]] = await asyncio.gather(*[search(query=query) for query in queries])
+        images: Dict[str, bytes | None] = await self.__await_downloads(downloads=downloads)
+        return [
+            self.__attach_images(output=output, images=images)
+            for output in self.__deduplicate(result_sets=result_sets)]
+
+    def page_images(self, page_image_names: List[str]) -> Dict[str, bytes | None]:
+        """Download, concurrently, the images of pages found by other means than the search"""
+        downloads: Dict[str, Future] = {}
+        for page_image_name in page_image_names:
+            self.__start_download(
+                page_image_name=page_image_name,
+                page_image_local_path=self.__page_image_local_path(page_image_name=page_image_name),
+                downloads=downloads)
+        return self.__wait_for_downloads(downloads=downloads)
+
+    async def apage_images(self, page_image_names: List[str]) -> Dict[str, bytes | None]:
+        """Asynchronous counterpart of page_images"""
+        if self.__async_container_client is None:
+            return await asyncio.to_thread(self.page_images, page_image_names=page_image_names)
+        downloads: Dict[str, asyncio.Task] = {}
+        for page_image_name in page_image_names:
+            self.__astart_download(
+                page_image_name=page_image_name,
+                page_image_local_path=self.__page_image_local_path(page_image_name=page_image_name),
+                downloads=downloads)
+        return await self.__await_downloads(downloads=downloads)
+
+    def invalidate_cached_results(self) -> None:
+        """Stop serving cached results of the index, e.g. after it was re-indexed"""
+        if self.__search_result_cache is not None:
+            self.__search_result_cache.invalidate(index_name=self.__index_name)
+
+    def __results(
+            self,
+            search_query: str,
+            vector: Callable[[], List[float]],
+            on_result: Callable[[Dict], None],
+            cached: List[Dict] | None = None,
+            cache_read: bool = False) -> List[Dict]:
+        """Results of a query, from the result cache when it holds them; `on_result` sees every result as it arrives.
+
+        `cached` holds the results the caller already read from the cache and `cache_read` tells that
+        the caller read it and missed, so the cache is not read a second time.
+        """
+        def search() -> List[Dict]:
+            results: List[Dict] = []
+            for result in self.__retriever.search(vector=vector(), k=TOP_K):
+                on_result(result)
+                results.append(result)
+            return results
+
+        if self.__search_result_cache is None:
+            return search()
+        if cached is not None:
+            results: List[Dict] = cached
+        elif cache_read:
+            results = self.__search_result_cache.search(
+                index_name=self.__index_name, query=search_query, k=TOP_K, search=search)
+        else:
+            results = self.__search_result_cache.get_or_search(
+                index_name=self.__index_name, query=search_query, k=TOP_K, search=search)
+        for result in results:
+            on_result(result)
+        return results
+
+    async def __aresults(
+            self,
+            search_query: str,
+            vector: Callable[[], Any],
+            on_result: Callable[[Dict], None],
+            cached: List[Dict] | None = None,
+            cache_read: bool = False) -> List[Dict]:
+        async def search() -> List[Dict]:
+            results: List[Dict] = []
+            async for result in self.__retriever.asearch(vector=await vector(), k=TOP_K):
+                on_result(result)
+                results.append(result)
+            return results
+
+        if self.__search_result_cache is None:
+            return await search()
+        if cached is not None:
+            results: List[Dict] = cached
+        elif cache_read:
+            results = await self.__search_result_cache.asearch(
+                index_name=self.__index_name, query=search_query, k=TOP_K, search=search)
+        else:
+            results = await self.__search_result_cache.aget_or_search(
+                index_name=self.__index_name, query=search_query, k=TOP_K, search=search)
+        for result in results:
+            on_result(result)
+        return results
+
+    def __cached_results(self, search_query: str) -> List[Dict] | None:
+        if self.__search_result_cache is None:
+            return None
+        return self.__search_result_cache.get(index_name=self.__index_name, query=search_query, k=TOP_K)
+
+    async def __acached_results(self, search_query: str) -> List[Dict] | None:
+        if self.__search_result_cache is None:
+            return None
+        return await self.__search_result_cache.aget(index_name=self.__index_name, query=search_query, k=TOP_K)
+
+    def __start_download(
+            self, page_image_name: str, page_image_local_path: str | None, downloads: Dict[str, Future]) -> None:
+        if page_image_name not in downloads:
+            downloads[page_image_name] = self.__download_executor.submit(
+                self.__download_image_from_blob, page_image_name, page_image_local_path)
+
+    def __wait_for_downloads(self, downloads: Dict[str, Future]) -> Dict[str, bytes | None]:
+        return {page_image_name: download.result() for page_image_name, download in downloads.items()}
+
+    def __astart_download(
+            self, page_image_name: str, page_image_local_path: str | None, downloads: Dict[str, asyncio.Task]) -> None:
+        async def download() -> bytes | None:
+            async with self.__download_semaphore:
+                return await self.__adownload_image_from_blob(page_image_name, page_image_local_path)
+
+        if page_image_name not in downloads:
+            downloads[page_image_name] = asyncio.create_task(download())
+
+    async def __await_downloads(self, downloads: Dict[str, asyncio.Task]) -> Dict[str, bytes | None]:
+        return dict(zip(downloads.keys(), await asyncio.gather(*downloads.values())))
+
+    def __attach_images(self, output: List[Dict[str, Any]], images: Dict[str, bytes | None]) -> List[Dict[str, Any]]:
+        if self.__return_image_bytes:
+            for item in output:
+                image_bytes: bytes | None = images.get(item['image_path'])
+                item['image_bytes'] = memoryview(image_bytes) if image_bytes is not None else None
+        return output
+
+    def __deduplicate(self, result_sets: List[List[Dict]]) -> List[list]:
+        """Return the outputs of each result set, keeping every page only for the first set it appears in"""
+        outputs: List[list] = []
+        seen: set[str] = set()
+        for results in result_sets:
+            output = []
+            for result in results:
+                page_image_name, _ = self.__page_image_paths(result=result)
+                if page_image_name in seen:
+                    continue
+                seen.add(page_image_name)
+                output.append(self.__search_output(result=result, page_image_name=page_image_name))
+            outputs.append(output)
+        return outputs
+
+    def __page_image_paths(self, result: Dict) -> tuple[str, str | None]:
+        self.__logger.debug(msg=f"topic: {result['topic']}")  
+        self.__logger.debug(msg=f"related_content: {result['related_content']}")  
+        page_image_name = f"{result['file_name']}/page_{result['page_number']}.png"  
+        return page_image_name, self.__page_image_local_path(page_image_name=page_image_name)
+
+    def __page_image_local_path(self, page_image_name: str) -> str | None:
+        if not self.__persist_images:
+            return None
+        # the directory is created by the download, off the event loop and once per page
+        return os.path.join(self.__image_directory, page_image_name)
+
+    def __search_output(self, result: Dict, page_image_name: str) -> Dict[str, Any]:
+        return {  
+            'id': result['id'] if 'id' in result.keys() else None,  
+            'image_path': page_image_name,  
+            'related_content': result['related_content']  
+        }
   
+    def embed(self, text: str) -> List[float]:
+        """Embedding of `text` with the search model, served from the embedding cache when possible"""
+        return self.__get_text_embedding(text=text)
+
+    async def aembed(self, text: str) -> List[float]:
+        """Asynchronous counterpart of embed"""
+        if self.__async_client is None:
+            return await asyncio.to_thread(self.__get_text_embedding, text=text)
+        return await self.__aget_text_embedding(text=text)
+
     def __get_text_embedding(self, text: str) -> List[float]:  
-        text = text.replace("\n", " ")  
-        return self.__client.embeddings.create(  
-            input=[text],  
-            model=self.__model  
-        ).data[0].embedding  
+        return self.__get_text_embeddings(texts=[text])[0]
+
+    def __get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed every text that is not cached in a single request"""
+        embeddings: Dict[str, List[float] | None] = dict.fromkeys(texts)
+        if self.__embedding_cache is not None:
+            embeddings = dict(zip(texts, self.__embedding_cache.get_many(model=self.__model, texts=texts)))
+        missing: List[str] = [text for text, embedding in embeddings.items() if embedding is None]
+
+        if len(missing) > 0:
+            response = self.__create_embeddings(texts=[text.replace("\n", " ") for text in missing])
+            for text, item in zip(missing, sorted(response.data, key=lambda item: item.index)):
+                embeddings[text] = item.embedding
+            if self.__embedding_cache is not None:
+                self.__embedding_cache.set_many(
+                    model=self.__model, embeddings={text: embeddings[text] for text in missing})
+
+        return [embeddings[text] for text in texts]
   
-    def __download_image_from_blob(self, blob_name: str, download_file_path: str) -> None:  
+    def __download_image_from_blob(self, blob_name: str, download_file_path: str | None) -> bytes | None:  
         """  
-        Download an image from Azure Blob Storage to a local file  
+        Download an image from Azure Blob Storage to a local file, if given, and return its bytes
+        when search returns them
         """  
-        with open(download_file_path, "wb") as download_file:  
-            blob_client = self.__container_client.get_blob_client(blob_name)  
-            download_stream = blob_client.download_blob()  
-            download_file.write(download_stream.readall())  
+        if self.__page_image_cache is not None:
+            return self.__download_image_through_cache(blob_name=blob_name, download_file_path=download_file_path)
+
+        blob_client = self.__container_client.get_blob_client(blob_name)  
+        download_stream = blob_client.download_blob()  
+        data: bytes = download_stream.readall()
+        if download_file_path is not None:
+            os.makedirs(os.path.dirname(download_file_path), exist_ok=True)
+            with open(download_file_path, "wb") as download_file:  
+                download_file.write(data)  
+        return data if self.__return_image_bytes else None
+
+    def __download_image_through_cache(self, blob_name: str, download_file_path: str | None) -> bytes | None:
+        hit, data = self.__cached_image(
+            entry=self.__page_image_cache.lookup(blob_name=blob_name, local_path=download_file_path))
+        if hit:
+            return data
+
+        etag: str | None = self.__page_image_cache.etag(blob_name=blob_name)
+        blob_client = self.__container_client.get_blob_client(blob_name)
+        try:
+            download_stream = blob_client.download_blob(
+                **({"etag": etag, "match_condition": MatchConditions.IfModified} if etag else {}))
+        except ResourceNotModifiedError:
+            hit, data = self.__cached_image(
+                entry=self.__page_image_cache.revalidate(blob_name=blob_name, local_path=download_file_path))
+            if hit:
+                return data
+            download_stream = blob_client.download_blob()
+
+        data = download_stream.readall()
+        self.__page_image_cache.store(
+            blob_name=blob_name,
+            local_path=download_file_path,
+            data=data,
+            etag=download_stream.properties.etag)
+        return data if self.__return_image_bytes else None
+
+    def __cached_image(self, entry: PageImageEntry | None) -> Tuple[bool, bytes | None]:
+        """Whether the cached image can be served, and its bytes when search returns them"""
+        if entry is None:
+            return False, None
+        if not self.__return_image_bytes:
+            return True, None
+        data: bytes | None = self.__page_image_cache.read(entry=entry)
+        return data is not None, data
+
+    def __create_embeddings(self, texts: List[str]) -> Any:
+        if self.__rate_limiter is None:
+            return self.__client.embeddings.create(input=texts, model=self.__model)
+        return self.__rate_limiter.call(
+            deployment=self.__model,
+            request=lambda: self.__client.embeddings.create(input=texts, model=self.__model),
+            tokens=sum(estimate_tokens(text=text) for text in texts))
+
+    async def __acreate_embeddings(self, texts: List[str]) -> Any:
+        if self.__rate_limiter is None:
+            return await self.__async_client.embeddings.create(input=texts, model=self.__model)
+        return await self.__rate_limiter.acall(
+            deployment=self.__model,
+            request=lambda: self.__async_client.embeddings.create(input=texts, model=self.__model),
+            tokens=sum(estimate_tokens(text=text) for text in texts))
+
+    async def __aget_text_embedding(self, text: str) -> List[float]:
+        return (await self.__aget_text_embeddings(texts=[text]))[0]
+
+    async def __aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed every text that is not cached in a single request without blocking the event loop"""
+        embeddings: Dict[str, List[float] | None] = dict.fromkeys(texts)
+        if self.__embedding_cache is not None:
+            embeddings = dict(zip(texts, await self.__embedding_cache.aget_many(model=self.__model, texts=texts)))
+        missing: List[str] = [text for text, embedding in embeddings.items() if embedding is None]
+
+        if len(missing) > 0:
+            response = await self.__acreate_embeddings(texts=[text.replace("\n", " ") for text in missing])
+            for text, item in zip(missing, sorted(response.data, key=lambda item: item.index)):
+                embeddings[text] = item.embedding
+            if self.__embedding_cache is not None:
+                await self.__embedding_cache.aset_many(
+                    model=self.__model, embeddings={text: embeddings[text] for text in missing})
+
+        return [embeddings[text] for text in texts]
+
+    async def __adownload_image_from_blob(self, blob_name: str, download_file_path: str | None) -> bytes | None:
+        """
+        Download an image from Azure Blob Storage to a local file, if given, and return its bytes
+        when search returns them, without blocking the event loop
+        """
+        if self.__page_image_cache is not None:
+            return await self.__adownload_image_through_cache(blob_name=blob_name, download_file_path=download_file_path)
+
+        blob_client = self.__async_container_client.get_blob_client(blob_name)
+        download_stream = await blob_client.download_blob()
+        data: bytes = await download_stream.readall()
+
+        def write() -> None:
+            os.makedirs(os.path.dirname(download_file_path), exist_ok=True)
+            with open(download_file_path, "wb") as download_file:
+                download_file.write(data)
+
+        if download_file_path is not None:
+            await asyncio.to_thread(write)
+        return data if self.__return_image_bytes else None
+
+    async def __adownload_image_through_cache(self, blob_name: str, download_file_path: str | None) -> bytes | None:
+        hit, data = await asyncio.to_thread(
+            lambda: self.__cached_image(
+                entry=self.__page_image_cache.lookup(blob_name=blob_name, local_path=download_file_path)))
+        if hit:
+            return data
+
+        etag: str | None = self.__page_image_cache.etag(blob_name=blob_name)
+        blob_client = self.__async_container_client.get_blob_client(blob_name)
+        try:
+            download_stream = await blob_client.download_blob(
+                **({"etag": etag, "match_condition": MatchConditions.IfModified} if etag else {}))
+        except ResourceNotModifiedError:
+            hit, data = await asyncio.to_thread(
+                lambda: self.__cached_image(
+                    entry=self.__page_image_cache.revalidate(blob_name=blob_name, local_path=download_file_path)))
+            if hit:
+                return data
+            download_stream = await blob_client.download_blob()
+
+        data = await download_stream.readall()
+        await asyncio.to_thread(
+            self.__page_image_cache.store,
+            blob_name=blob_name,
+            local_path=download_file_path,
+            data=data,
+            etag=download_stream.properties.etag)
+        return data if self.__return_image_bytes else None
@@ -0,0 +1,123 @@
+import json
+import os
+from typing import Any, AsyncIterator, Dict, Iterable, List
+import numpy as np
+from retriever import SEARCH_FIELDS
+
+EMBEDDINGS_FILE: str = "embeddings.npy"
+METADATA_FILE: str = "metadata.json"
+
+class VectorIndex:
+    """In-process vector index of pages, searched by cosine similarity.
+
+    Embeddings are normalized once and kept as a contiguous float32 matrix, which `load` can map from
+    disk instead of reading, so a query is a single matrix-vector product followed by `argpartition`
+    for the top k. Metadata is kept in columnar arrays and only materialized for the returned rows.
+    Results have the shape of Azure AI Search results, with the similarity as `@search.score`.
+    """
+
+    def __init__(self, embeddings: np.ndarray, metadata: Dict[str, np.ndarray], index_name: str = "local") -> None:
+        if embeddings.ndim != 2:
+            raise ValueError("Embeddings must be a matrix with one row per page")
+        for field, column in metadata.items():
+            if len(column) != len(embeddings):
+                raise ValueError(f"Metadata field {field} has {len(column)} values for {len(embeddings)} pages")
+        self.__embeddings: np.ndarray = self.__normalize(embeddings=embeddings)
+        self.__metadata: Dict[str, np.ndarray] = metadata
+        self.__index_name: str = index_name
+
+    @classmethod
+    def from_documents(
+            cls,
+            documents: Iterable[Dict[str, Any]],
+            vector_field: str = "contentVector",
+            index_name: str = "local") -> "VectorIndex":
+        """Build an index from documents shaped like those of the Azure AI Search index"""
+        documents = list(documents)
+        fields: List[str] = ["id"] + SEARCH_FIELDS if any("id" in document for document in documents) else SEARCH_FIELDS
+        return cls(
+            embeddings=np.array([document[vector_field] for document in documents], dtype=np.float32),
+            metadata={field: cls.__column(values=[document.get(field) for document in documents]) for field in fields},
+            index_name=index_name)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "VectorIndex":
+        """Load an index saved by `save`, mapping the embeddings from disk when `mmap` is set"""
+        with open(os.path.join(directory, METADATA_FILE), mode="r", encoding="utf-8") as file:
+            metadata: Dict[str, Any] = json.load(file)
+        embeddings: np.ndarray = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r" if mmap else None)
+        return cls(
+            embeddings=embeddings,
+            metadata={field: cls.__column(values=values) for field, values in metadata["columns"].items()},
+            index_name=metadata.get("index_name", os.path.basename(os.path.normpath(directory))))
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, EMBEDDINGS_FILE), np.ascontiguousarray(self.__embeddings, dtype=np.float32))
+        with open(os.path.join(directory, METADATA_FILE), mode="w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "index_name": self.__index_name,
+                    "columns": {field: column.tolist() for field, column in self.__metadata.items()},
+                },
+                file,
+                ensure_ascii=False)
+
+    @property
+    def index_name(self) -> str:
+        return self.__index_name
+
+    @property
+    def asynchronous(self) -> bool:
+        return True
+
+    def __len__(self) -> int:
+        return len(self.__embeddings)
+
+    def search(self, vector: List[float], k: int) -> List[Dict[str, Any]]:
+        """The `k` pages most similar to `vector`, most similar first"""
+        if len(self.__embeddings) == 0 or k <= 0:
+            return []
+        query: np.ndarray = np.asarray(vector, dtype=np.float32)
+        norm: float = float(np.linalg.norm(query))
+        if norm == 0:
+            return []
+        scores: np.ndarray = self.__embeddings @ (query / norm)
+
+        if k < len(scores):
+            rows: np.ndarray = np.argpartition(-scores, k - 1)[:k]
+        else:
+            rows = np.arange(len(scores))
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+        return [self.__result(row=int(row), score=float(scores[row])) for row in rows]
+
+    async def asearch(self, vector: List[float], k: int) -> AsyncIterator[Dict[str, Any]]:
+        # a brute force search of an in-memory index takes less time than a thread hand-off
+        for result in self.search(vector=vector, k=k):
+            yield result
+
+    def __result(self, row: int, score: float) -> Dict[str, Any]:
+        result: Dict[str, Any] = {field: column[row] for field, column in self.__metadata.items()}
+        for field, value in result.items():
+            if isinstance(value, np.generic):
+                result[field] = value.item()
+        result["@search.score"] = score
+        return result
+
+    @staticmethod
+    def __normalize(embeddings: np.ndarray) -> np.ndarray:
+        """Unit rows as a contiguous float32 matrix, without copying embeddings that already are"""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        norms: np.ndarray = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        if np.allclose(norms[norms > 0], 1.0, atol=1e-4):
+            # a saved index stays mapped from disk
+            return embeddings
+        return embeddings / np.where(norms > 0, norms, 1.0)
+
+    @staticmethod
+    def __column(values: List[Any]) -> np.ndarray:
+        if all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+            return np.array(values, dtype=np.int64)
+        column: np.ndarray = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
@@ -1,8 +1,13 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 @dataclass
 class AgentResponse:
     """Class to represent a response from an agent"""
     conversation: list
     response: str | None
-    streaming: bool = False
\ No newline at end of file
+    streaming: bool = False
+    # tokens of the prompt sent at each iteration of the agent loop
+    prompt_tokens: list[int] = field(default_factory=list)
+    # image parts, and bytes of their data URLs, left out of the prompt at each iteration
+    removed_image_parts: list[int] = field(default_factory=list)
+    removed_image_bytes: list[int] = field(default_factory=list)
\ No newline at end of file
@@ -0,0 +1,146 @@
+from collections import deque
+from typing import Any, Iterable, Iterator, List, overload
+
+def message_role(message: Any) -> str | None:
+    """Role of a message given as a dict or as an OpenAI message object"""
+    return message.get("role") if isinstance(message, dict) else getattr(message, "role", None)
+
+def message_content(message: Any) -> Any:
+    return message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+
+class Turn:
+    """A user question and the messages that answer it"""
+
+    def __init__(self, question: Any) -> None:
+        self.messages: List[Any] = [question]
+        # whether the tool messages that returned nothing have been removed
+        self.stripped: bool = False
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+class Conversation:
+    """Messages of a conversation grouped by user turn.
+
+    The preamble holds the messages before the first question, such as the persona and the
+    initial message, and is never trimmed. The last turn is available and old turns are dropped
+    in constant time; `messages` is the flat view sent to the chat API. Indexing, iteration and
+    `append`/`pop` follow the flat view so the conversation can stand in for a list of messages.
+    """
+
+    def __init__(self, preamble: Iterable[Any] | None = None, messages: Iterable[Any] | None = None) -> None:
+        self.__preamble: List[Any] = list(preamble or [])
+        self.__turns: deque[Turn] = deque()
+        self.__length: int = len(self.__preamble)
+        self.extend(messages=messages or [])
+
+    @classmethod
+    def from_messages(cls, messages: Iterable[Any]) -> "Conversation":
+        """Group a flat list of messages; messages before the first question form the preamble"""
+        conversation = cls()
+        conversation.extend(messages=messages)
+        return conversation
+
+    @property
+    def preamble(self) -> List[Any]:
+        return self.__preamble
+
+    @property
+    def turns(self) -> deque[Turn]:
+        return self.__turns
+
+    @property
+    def last_turn(self) -> List[Any]:
+        """Messages of the last question, starting with the question, or an empty list"""
+        return self.__turns[-1].messages if len(self.__turns) > 0 else []
+
+    def append(self, message: Any) -> None:
+        if message_role(message=message) == "user":
+            self.__turns.append(Turn(question=message))
+        elif len(self.__turns) > 0:
+            self.__turns[-1].messages.append(message)
+            # the new message has not been stripped yet
+            self.__turns[-1].stripped = False
+        else:
+            self.__preamble.append(message)
+        self.__length += 1
+
+    def extend(self, messages: Iterable[Any]) -> None:
+        for message in messages:
+            self.append(message=message)
+
+    def pop(self) -> Any:
+        """Remove and return the last message"""
+        if len(self.__turns) == 0:
+            message: Any = self.__preamble.pop()
+        else:
+            turn: Turn = self.__turns[-1]
+            message = turn.messages.pop()
+            if len(turn) == 0:
+                self.__turns.pop()
+        self.__length -= 1
+        return message
+
+    def trim(self, max_turns: int) -> None:
+        """Keep only the last `max_turns` turns"""
+        while len(self.__turns) > max(max_turns, 0):
+            self.__length -= len(self.__turns.popleft())
+
+    def strip_detail(self, max_turns_with_detail: int) -> None:
+        """Remove the tool messages that returned nothing from all but the last `max_turns_with_detail` turns"""
+        # turns only get older, so the turns before the first stripped one are stripped already
+        for index in range(len(self.__turns) - 1 - max(max_turns_with_detail, 0), -1, -1):
+            turn: Turn = self.__turns[index]
+            if turn.stripped:
+                break
+            messages: List[Any] = [
+                message for message in turn.messages
+                if message_role(message=message) in ("user", "assistant") or len(message_content(message=message) or []) > 0]
+            self.__length -= len(turn) - len(messages)
+            turn.messages = messages
+            turn.stripped = True
+
+    def reset_to_last_question(self) -> None:
+        """Drop everything that was added after the last question"""
+        if len(self.__turns) == 0:
+            return
+        turn: Turn = self.__turns[-1]
+        self.__length -= len(turn) - 1
+        del turn.messages[1:]
+
+    def messages(self) -> List[Any]:
+        """Flat list of the messages, as sent to the chat API"""
+        messages: List[Any] = list(self.__preamble)
+        for turn in self.__turns:
+            messages.extend(turn.messages)
+        return messages
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def __iter__(self) -> Iterator[Any]:
+        yield from self.__preamble
+        for turn in self.__turns:
+            yield from turn.messages
+
+    @overload
+    def __getitem__(self, index: int) -> Any: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Any]: ...
+
+    def __getitem__(self, index: int | slice) -> Any:
+        if isinstance(index, slice):
+            return self.messages()[index]
+        if index < 0:
+            index += self.__length
+        if index < 0 or index >= self.__length:
+            raise IndexError("conversation index out of range")
+        if index < len(self.__preamble):
+            return self.__preamble[index]
+        index -= len(self.__preamble)
+        for turn in self.__turns:
+            if index < len(turn):
+                return turn.messages[index]
+            index -= len(turn)
+        raise IndexError("conversation index out of range")
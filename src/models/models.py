@@ -3,3 +3,4 @@
 from agent_response import AgentResponse
 from agent_configuration import AgentConfiguration, agent_configuration_from_dict
 from settings import Settings
+from conversation import Conversation, Turn, message_role, message_content
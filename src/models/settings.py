@@ -1,3 +1,4 @@
+from typing import Literal
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -14,7 +15,25 @@ class Settings(BaseSettings):
     azure_vision_key: str = Field(validation_alias='AZURE_AI_VISION_API_KEY')
     azure_vision_endpoint: str = Field(validation_alias='AZURE_AI_VISION_ENDPOINT')
     smart_agent_prompt_location: str = Field(validation_alias='SMART_AGENT_PROMPT_LOCATION')
+    smart_agent_prompt_locations: dict[str, str] = Field(validation_alias='SMART_AGENT_PROMPT_LOCATIONS', default={})
+    smart_agent_prompt_refresh_interval: float = Field(validation_alias='SMART_AGENT_PROMPT_REFRESH_INTERVAL', default=30.0)
     smart_agent_image_path: str = Field(validation_alias='IMAGE_PATH')
+    smart_agent_max_prompt_tokens: int | None = Field(validation_alias='SMART_AGENT_MAX_PROMPT_TOKENS', default=32000)
+    smart_agent_max_questions_with_images: int | None = Field(validation_alias='SMART_AGENT_MAX_QUESTIONS_WITH_IMAGES', default=1)
+    smart_agent_deduplicate_images: bool = Field(validation_alias='SMART_AGENT_DEDUPLICATE_IMAGES', default=True)
+    smart_agent_max_question_to_keep: int = Field(validation_alias='SMART_AGENT_MAX_QUESTION_TO_KEEP', default=3)
+    smart_agent_persist_images: bool = Field(validation_alias='SMART_AGENT_PERSIST_IMAGES', default=True)
+    smart_agent_image_max_dimension: int = Field(validation_alias='SMART_AGENT_IMAGE_MAX_DIMENSION', default=1024)
+    smart_agent_image_format: Literal["JPEG", "PNG", "WEBP"] = Field(validation_alias='SMART_AGENT_IMAGE_FORMAT', default="JPEG")
+    smart_agent_image_quality: int = Field(validation_alias='SMART_AGENT_IMAGE_QUALITY', default=85)
+    smart_agent_image_detail: Literal["auto", "low", "high"] = Field(validation_alias='SMART_AGENT_IMAGE_DETAIL', default="auto")
+    smart_agent_image_cache_max_entries: int = Field(validation_alias='SMART_AGENT_IMAGE_CACHE_MAX_ENTRIES', default=256)
+    smart_agent_answer_cache_enabled: bool = Field(validation_alias='SMART_AGENT_ANSWER_CACHE_ENABLED', default=False)
+    smart_agent_answer_cache_threshold: float = Field(validation_alias='SMART_AGENT_ANSWER_CACHE_THRESHOLD', default=0.95)
+    smart_agent_answer_cache_ttl: float = Field(validation_alias='SMART_AGENT_ANSWER_CACHE_TTL', default=3600.0)
+    smart_agent_answer_cache_max_entries: int = Field(validation_alias='SMART_AGENT_ANSWER_CACHE_MAX_ENTRIES', default=1024)
+    smart_agent_max_tool_workers: int = Field(validation_alias='SMART_AGENT_MAX_TOOL_WORKERS', default=16)
+    smart_agent_tool_timeout: float = Field(validation_alias='SMART_AGENT_TOOL_TIMEOUT', default=60.0)
     azure_redis_endpoint: str = Field(validation_alias='AZURE_REDIS_ENDPOINT')
     azure_redis_key: str = Field(validation_alias='AZURE_REDIS_KEY')
     azure_storage_account_key: str = Field(validation_alias='AZURE_STORAGE_ACCOUNT_KEY')  
@@ -24,3 +43,37 @@ class Settings(BaseSettings):
     app_port: int = Field(validation_alias='APP_PORT', default='8000')
     app_host: str = Field(validation_alias='APP_HOST', default='localhost')
     api_host: str = Field(validation_alias='API_HOST', default='localhost')
+    search_backend: Literal["azure", "local"] = Field(validation_alias='SEARCH_BACKEND', default="azure")
+    local_vector_index_path: str | None = Field(validation_alias='LOCAL_VECTOR_INDEX_PATH', default=None)
+    local_vector_index_mmap: bool = Field(validation_alias='LOCAL_VECTOR_INDEX_MMAP', default=True)
+    graph_index_path: str | None = Field(validation_alias='GRAPH_INDEX_PATH', default=None)
+    graph_search_max_hops: int = Field(validation_alias='GRAPH_SEARCH_MAX_HOPS', default=1)
+    graph_search_max_results: int = Field(validation_alias='GRAPH_SEARCH_MAX_RESULTS', default=25)
+    graph_retrieval_max_pages: int = Field(validation_alias='GRAPH_RETRIEVAL_MAX_PAGES', default=3)
+    retrieval_max_results: int = Field(validation_alias='RETRIEVAL_MAX_RESULTS', default=5)
+    rank_fusion_k: int = Field(validation_alias='RANK_FUSION_K', default=60)
+    search_max_workers: int = Field(validation_alias='SEARCH_MAX_WORKERS', default=16)
+    blob_download_max_concurrency: int = Field(validation_alias='BLOB_DOWNLOAD_MAX_CONCURRENCY', default=16)
+    page_image_cache_max_bytes: int = Field(validation_alias='PAGE_IMAGE_CACHE_MAX_BYTES', default=1 << 30)
+    page_image_cache_max_age: float = Field(validation_alias='PAGE_IMAGE_CACHE_MAX_AGE', default=300.0)
+    search_result_cache_ttl: int = Field(validation_alias='SEARCH_RESULT_CACHE_TTL', default=300)
+    search_result_cache_max_entries: int = Field(validation_alias='SEARCH_RESULT_CACHE_MAX_ENTRIES', default=1024)
+    embedding_cache_max_entries: int = Field(validation_alias='EMBEDDING_CACHE_MAX_ENTRIES', default=10000)
+    embedding_cache_ttl: int = Field(validation_alias='EMBEDDING_CACHE_TTL', default=604800)
+    shared_memory_cache_path: str | None = Field(validation_alias='SHARED_MEMORY_CACHE_PATH', default=None)
+    shared_memory_cache_size: int = Field(validation_alias='SHARED_MEMORY_CACHE_SIZE', default=256 << 20)
+    shared_memory_cache_max_entries: int = Field(validation_alias='SHARED_MEMORY_CACHE_MAX_ENTRIES', default=65536)
+    history_compression: Literal["none", "zlib", "zstd"] = Field(validation_alias='HISTORY_COMPRESSION', default="none")
+    history_allow_legacy_pickle: bool = Field(validation_alias='HISTORY_ALLOW_LEGACY_PICKLE', default=False)
+    history_ttl: int = Field(validation_alias='HISTORY_TTL', default=3600)
+    redis_max_connections: int = Field(validation_alias='REDIS_MAX_CONNECTIONS', default=50)
+    redis_pool_timeout: int = Field(validation_alias='REDIS_POOL_TIMEOUT', default=20)
+    redis_health_check_interval: int = Field(validation_alias='REDIS_HEALTH_CHECK_INTERVAL', default=30)
+    openai_rate_limiter_enabled: bool = Field(validation_alias='OPENAI_RATE_LIMITER_ENABLED', default=False)
+    openai_requests_per_minute: dict[str, int] = Field(validation_alias='OPENAI_REQUESTS_PER_MINUTE', default={})
+    openai_tokens_per_minute: dict[str, int] = Field(validation_alias='OPENAI_TOKENS_PER_MINUTE', default={})
+    openai_max_concurrency: int = Field(validation_alias='OPENAI_MAX_CONCURRENCY', default=16)
+    openai_max_retries: int = Field(validation_alias='OPENAI_MAX_RETRIES', default=6)
+    http_max_connections: int = Field(validation_alias='HTTP_MAX_CONNECTIONS', default=100)
+    http_max_keepalive_connections: int = Field(validation_alias='HTTP_MAX_KEEPALIVE_CONNECTIONS', default=20)
+    http_timeout: float = Field(validation_alias='HTTP_TIMEOUT', default=60.0)
@@ -1,25 +1,26 @@
-import base64
-import pickle
 from distributedcache import CacheProtocol
+from models import Conversation
+from history_codec import HistoryCodec
 
 class History:
     """History class"""
 
-    def __init__(self, session_id: str, cache: CacheProtocol) -> None:
+    def __init__(self, session_id: str, cache: CacheProtocol, codec: HistoryCodec | None = None) -> None:
         """Constructor for History"""
         self.__session_id: str = session_id
         self.__cache: CacheProtocol = cache
+        self.__codec: HistoryCodec = codec or HistoryCodec()
         cache_history = self.__cache.get(name=self.__session_id)
 
         if cache_history is None:
             return
         
-        self.history = pickle.loads(base64.b64decode(s=cache_history))
+        self.history = self.__codec.decode(payload=cache_history)
 
 
     def set_history(self, history) -> None:
         """Set the history"""
-        self.__cache.set(name=self.__session_id, value=base64.b64encode(s=pickle.dumps(obj=history)))
+        self.__cache.set(name=self.__session_id, value=self.__codec.encode(conversation=history))
 
     def clean_up_history(self, max_q_with_detail_hist=1, max_q_to_keep=2) -> None:
         """Clean up the history"""
@@ -29,30 +30,11 @@ class History:
         if cache_history is None:
             return
         
-        history = pickle.loads(base64.b64decode(s=cache_history))
-        question_count=0
-        removal_indices=[]
+        conversation: Conversation = Conversation.from_messages(messages=self.__codec.decode(payload=cache_history))
+        conversation.strip_detail(max_turns_with_detail=max_q_with_detail_hist)
+        conversation.trim(max_turns=max_q_to_keep - 1)
 
-        for idx in range(len(history)-1, 0, -1):
-            message = dict(history[idx])
-
-            if message.get("role") == "user":
-                question_count +=1
-
-            if question_count>= max_q_with_detail_hist and question_count < max_q_to_keep:
-                if message.get("role") != "user" \
-                    and message.get("role") != "assistant" \
-                        and len(message.get("content") or []) == 0:
-                    removal_indices.append(idx)
-
-            if question_count >= max_q_to_keep:
-                removal_indices.append(idx)
-        
-        # remove items with indices in removal_indices
-        for index in removal_indices:
-            del history[index]
-
-        self.set_history(history=history)
+        self.set_history(history=conversation.messages())
 
     def reset_history_to_last_question(self) -> None:
         """Reset the history to the last question"""
@@ -62,14 +44,7 @@ class History:
         if cache_history is None:
             return
         
-        history = pickle.loads(base64.b64decode(s=cache_history))
-        
-        for i in range(len(history)-1, -1, -1):
-            message = dict(history[i])   
-            
-            if message.get("role") == "user":
-                break
-            
-            history.pop()
+        conversation: Conversation = Conversation.from_messages(messages=self.__codec.decode(payload=cache_history))
+        conversation.reset_to_last_question()
 
-        self.set_history(history=history)
+        self.set_history(history=conversation.messages())
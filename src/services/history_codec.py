@@ -0,0 +1,113 @@
+import base64
+import binascii
+import json
+import pickle
+import zlib
+from enum import IntEnum
+from logging import Logger
+from typing import Any, Dict, List, Literal
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, conversations are then stored uncompressed
+    zstandard = None
+
+# every encoded conversation starts with the magic, the schema version and the compression
+MAGIC: bytes = b"\x00HC"
+SCHEMA_VERSION: int = 1
+
+class Compression(IntEnum):
+    NONE = 0
+    ZLIB = 1
+    ZSTD = 2
+
+class HistoryCodec:
+    """Serializes conversations as compact, versioned JSON of plain message dicts.
+
+    Pydantic messages such as `ChatCompletionMessage` are stored as the dicts the chat API accepts.
+    Payloads larger than `compression_threshold` bytes can be compressed; zstd is much cheaper than
+    zlib on the base64 page images that make up most of a conversation. Conversations written by the
+    former pickle format are only read when `allow_legacy_pickle` is set, since unpickling runs
+    arbitrary code.
+    """
+
+    def __init__(
+            self,
+            compression: Literal["none", "zlib", "zstd"] = "none",
+            compression_level: int | None = None,
+            compression_threshold: int = 1024,
+            allow_legacy_pickle: bool = False,
+            logger: Logger | None = None,
+        ) -> None:
+        self.__logger: Logger = logger or Logger(name="history_codec")
+        if compression == "zstd" and zstandard is None:
+            self.__logger.warning(msg="zstandard is not installed, storing conversations uncompressed")
+            compression = "none"
+        self.__compression: Compression = Compression[compression.upper()]
+        self.__compression_level: int | None = compression_level
+        self.__compression_threshold: int = compression_threshold
+        self.__allow_legacy_pickle: bool = allow_legacy_pickle
+
+    def encode(self, conversation: List[Any]) -> bytes:
+        """Serialize a conversation, or any part of one"""
+        payload: bytes = json.dumps(
+            [self.__to_dict(message=message) for message in conversation],
+            separators=(",", ":"),
+            ensure_ascii=False).encode(encoding="utf-8")
+
+        compression: Compression = self.__compression if len(payload) >= self.__compression_threshold else Compression.NONE
+        return MAGIC + bytes([SCHEMA_VERSION, compression]) + self.__compress(payload=payload, compression=compression)
+
+    def decode(self, payload: bytes | str | None) -> List[Dict[str, Any]]:
+        """Deserialize a conversation; a missing or legacy payload that may not be read is an empty conversation"""
+        if not payload:
+            return []
+        if isinstance(payload, str):
+            payload = payload.encode(encoding="utf-8")
+        if not payload.startswith(MAGIC):
+            return self.__decode_legacy(payload=payload)
+
+        header_length: int = len(MAGIC) + 2
+        if len(payload) < header_length:
+            raise ValueError("Truncated conversation payload")
+        version: int = payload[len(MAGIC)]
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"Conversation schema version {version} is newer than the supported {SCHEMA_VERSION}")
+
+        data: bytes = self.__decompress(payload=payload[header_length:], compression=Compression(payload[len(MAGIC) + 1]))
+        return json.loads(data)
+
+    def __compress(self, payload: bytes, compression: Compression) -> bytes:
+        if compression == Compression.ZLIB:
+            return zlib.compress(payload, level=self.__compression_level if self.__compression_level is not None else 1)
+        if compression == Compression.ZSTD:
+            return zstandard.ZstdCompressor(
+                level=self.__compression_level if self.__compression_level is not None else 3).compress(payload)
+        return payload
+
+    @staticmethod
+    def __decompress(payload: bytes, compression: Compression) -> bytes:
+        if compression == Compression.ZLIB:
+            return zlib.decompress(payload)
+        if compression == Compression.ZSTD:
+            if zstandard is None:
+                raise ValueError("Conversation is compressed with zstd but zstandard is not installed")
+            return zstandard.ZstdDecompressor().decompress(payload)
+        return payload
+
+    def __decode_legacy(self, payload: bytes) -> List[Any]:
+        if not self.__allow_legacy_pickle:
+            self.__logger.warning(msg="Ignoring a conversation stored in the legacy pickle format")
+            return []
+        try:
+            return pickle.loads(base64.b64decode(s=payload))
+        except (binascii.Error, pickle.UnpicklingError, EOFError) as e:
+            self.__logger.error(msg=f"Ignoring an unreadable legacy conversation: {e}")
+            return []
+
+    @staticmethod
+    def __to_dict(message: Any) -> Dict[str, Any]:
+        if isinstance(message, dict):
+            return message
+        if hasattr(message, "model_dump"):
+            return message.model_dump(mode="json", exclude_none=True)
+        return dict(message)
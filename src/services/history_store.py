@@ -0,0 +1,81 @@
+from logging import Logger
+from typing import Any, List
+from distributedcache import ListCacheProtocol, AsyncListCacheProtocol
+from history_codec import HistoryCodec
+
+class HistoryStore:
+    """Append-only conversation history.
+
+    Every session is a Redis list with one element per answered question, so persisting a turn
+    appends only its messages and refreshes the TTL in one pipelined round trip, and concurrent
+    requests of a session no longer overwrite each other. Only the last `max_turns` turns, the
+    ones the agent keeps in its context, are retained and loaded.
+    """
+
+    def __init__(
+            self,
+            cache: ListCacheProtocol,
+            async_cache: AsyncListCacheProtocol | None = None,
+            codec: HistoryCodec | None = None,
+            max_turns: int = 2,
+            ttl: int = 3600,
+            key_prefix: str = "history",
+            logger: Logger | None = None,
+        ) -> None:
+        self.__cache: ListCacheProtocol = cache
+        self.__async_cache: AsyncListCacheProtocol | None = async_cache
+        self.__codec: HistoryCodec = codec or HistoryCodec()
+        self.__max_turns: int = max_turns
+        self.__ttl: int = ttl
+        self.__key_prefix: str = key_prefix
+        self.__logger: Logger = logger or Logger(name="history_store")
+
+    def key(self, session_id: str) -> str:
+        return f"{self.__key_prefix}:{session_id}"
+
+    def load(self, session_id: str) -> List[Any]:
+        """Return the messages of the retained turns of a session, oldest first"""
+        if self.__max_turns <= 0:
+            return []
+        return self.__messages(turns=self.__cache.lrange(name=self.key(session_id=session_id), start=-self.__max_turns, end=-1))
+
+    async def aload(self, session_id: str) -> List[Any]:
+        """Return the messages of the retained turns of a session without blocking the event loop"""
+        if self.__max_turns <= 0:
+            return []
+        return self.__messages(
+            turns=await self.__async_cache.lrange(name=self.key(session_id=session_id), start=-self.__max_turns, end=-1))
+
+    def append(self, session_id: str, turn: List[Any]) -> None:
+        """Append the messages of an answered question and drop the turns that are no longer retained"""
+        if len(turn) == 0:
+            return
+        pipeline = self.__cache.pipeline(transaction=True)
+        self.__queue_append(pipeline=pipeline, session_id=session_id, turn=turn)
+        pipeline.execute()
+
+    async def aappend(self, session_id: str, turn: List[Any]) -> None:
+        """Append the messages of an answered question without blocking the event loop"""
+        if len(turn) == 0:
+            return
+        pipeline = self.__async_cache.pipeline(transaction=True)
+        self.__queue_append(pipeline=pipeline, session_id=session_id, turn=turn)
+        await pipeline.execute()
+
+    def __queue_append(self, pipeline: Any, session_id: str, turn: List[Any]) -> None:
+        key: str = self.key(session_id=session_id)
+        if self.__max_turns <= 0:
+            pipeline.delete(key)
+            return
+        pipeline.rpush(key, self.__codec.encode(conversation=turn))
+        pipeline.ltrim(key, -self.__max_turns, -1)
+        pipeline.expire(key, self.__ttl)
+
+    def __messages(self, turns: List[bytes] | None) -> List[Any]:
+        messages: List[Any] = []
+        for turn in turns or []:
+            try:
+                messages.extend(self.__codec.decode(payload=turn))
+            except ValueError as e:
+                self.__logger.error(msg=f"Ignoring an unreadable conversation turn: {e}")
+        return messages
@@ -0,0 +1,380 @@
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from logging import Logger
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, TypeVar
+from distributedcache import ScriptCacheProtocol, AsyncScriptCacheProtocol
+try:
+    import openai
+except ImportError:  # openai is optional, connection errors are then not recognized
+    openai = None
+
+T = TypeVar("T")
+
+# the status codes the OpenAI client retries itself when max_retries is not zero
+RETRY_STATUSES: Tuple[int, ...] = (408, 409, 429, 500, 502, 503, 504)
+
+# KEYS: budget hash and pause key of a deployment; ARGV: requests and tokens per minute, zero for
+# no limit, and tokens of the request. Returns the seconds to wait, zero once the budget is taken.
+RATE_LIMIT_SCRIPT: str = """
+local pause = redis.call('PTTL', KEYS[2])
+if pause > 0 then
+    return tostring(pause / 1000)
+end
+local requests_per_minute = tonumber(ARGV[1])
+local tokens_per_minute = tonumber(ARGV[2])
+if requests_per_minute <= 0 and tokens_per_minute <= 0 then
+    return '0'
+end
+local cost = math.min(tonumber(ARGV[3]), math.max(tokens_per_minute, 0))
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'updated_at')
+local elapsed = math.max(now - (tonumber(state[3]) or now), 0)
+local requests = math.min(requests_per_minute, (tonumber(state[1]) or requests_per_minute) + elapsed * requests_per_minute / 60)
+local tokens = math.min(tokens_per_minute, (tonumber(state[2]) or tokens_per_minute) + elapsed * tokens_per_minute / 60)
+local wait = 0
+if requests_per_minute > 0 and requests < 1 then
+    wait = (1 - requests) * 60 / requests_per_minute
+end
+if tokens_per_minute > 0 and tokens < cost then
+    wait = math.max(wait, (cost - tokens) * 60 / tokens_per_minute)
+end
+if wait == 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'requests', requests, 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], 120)
+return tostring(wait)
+"""
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of `text`, about four characters per token"""
+    return len(text) // 4 + 1
+
+def status_code(error: BaseException) -> int | None:
+    return getattr(error, "status_code", None)
+
+def is_retryable(error: BaseException) -> bool:
+    return status_code(error=error) in RETRY_STATUSES
+
+def is_retryable_openai_error(error: BaseException) -> bool:
+    """Whether the OpenAI client would have retried the call that raised `error`"""
+    return is_retryable(error=error) or (openai is not None and isinstance(error, openai.APIConnectionError))
+
+def retry_after(error: BaseException) -> float | None:
+    """Seconds the service asked to wait before retrying, from the headers of its response"""
+    headers: Any = getattr(getattr(error, "response", None), "headers", None)
+    if headers is None:
+        return None
+    for name, scale in [("retry-after-ms", 0.001), ("retry-after", 1.0)]:
+        value: str | None = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(float(value) * scale, 0.0)
+        except ValueError:
+            # an HTTP date, left to the exponential backoff
+            continue
+    return None
+
+@dataclass
+class TokenBucket:
+    """Request and token budgets of a deployment, refilled continuously over a minute"""
+    requests: float
+    tokens: float
+    updated_at: float
+    paused_until: float = 0.0
+
+    def take(self, now: float, requests_per_minute: int, tokens_per_minute: int, tokens: int) -> float:
+        """Take one request and `tokens` tokens, or return the seconds to wait until they are available"""
+        if self.paused_until > now:
+            return self.paused_until - now
+        if requests_per_minute <= 0 and tokens_per_minute <= 0:
+            return 0.0
+        cost: int = min(tokens, max(tokens_per_minute, 0))
+        elapsed: float = max(now - self.updated_at, 0.0)
+        self.requests = min(requests_per_minute, self.requests + elapsed * requests_per_minute / 60)
+        self.tokens = min(tokens_per_minute, self.tokens + elapsed * tokens_per_minute / 60)
+        self.updated_at = now
+        wait: float = 0.0
+        if requests_per_minute > 0 and self.requests < 1:
+            wait = (1 - self.requests) * 60 / requests_per_minute
+        if tokens_per_minute > 0 and self.tokens < cost:
+            wait = max(wait, (cost - self.tokens) * 60 / tokens_per_minute)
+        if wait == 0.0:
+            self.requests -= 1
+            self.tokens -= cost
+        return wait
+
+class AdaptiveConcurrencyLimit:
+    """Concurrency limit adjusted with additive increase and multiplicative decrease.
+
+    Every successful call raises the limit by one over the current limit, about one per round of
+    calls, up to `maximum`; a rate limited call multiplies it by `decrease_factor`, down to
+    `minimum`. Calls started before the last decrease do not decrease it again, so one burst of
+    429s only halves the limit once. Threads and event loops can wait on the same limit.
+    """
+
+    def __init__(self, maximum: int = 16, minimum: int = 1, decrease_factor: float = 0.5) -> None:
+        self.__maximum: int = maximum
+        self.__minimum: int = minimum
+        self.__decrease_factor: float = decrease_factor
+        self.__limit: float = float(maximum)
+        self.__in_flight: int = 0
+        self.__decreased_at: float = float("-inf")
+        self.__condition: threading.Condition = threading.Condition()
+        self.__waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    @property
+    def limit(self) -> int:
+        return max(int(self.__limit), self.__minimum)
+
+    @property
+    def in_flight(self) -> int:
+        return self.__in_flight
+
+    def acquire(self) -> float:
+        """Wait for a free slot and return when the call started"""
+        with self.__condition:
+            while self.__in_flight >= self.limit:
+                self.__condition.wait()
+            self.__in_flight += 1
+            return time.monotonic()
+
+    async def aacquire(self) -> float:
+        """Wait for a free slot without blocking the event loop"""
+        while True:
+            with self.__condition:
+                if self.__in_flight < self.limit:
+                    self.__in_flight += 1
+                    return time.monotonic()
+                loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+                waiter: asyncio.Future = loop.create_future()
+                self.__waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, started_at: float, rate_limited: bool = False) -> None:
+        """Free the slot of a call and adjust the limit to its outcome"""
+        with self.__condition:
+            self.__in_flight -= 1
+            if not rate_limited:
+                self.__limit = min(self.__limit + 1 / self.__limit, float(self.__maximum))
+            elif started_at >= self.__decreased_at:
+                self.__limit = max(self.__limit * self.__decrease_factor, float(self.__minimum))
+                self.__decreased_at = time.monotonic()
+            waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = self.__waiters
+            self.__waiters = []
+            self.__condition.notify_all()
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(self.__wake, waiter)
+
+    @staticmethod
+    def __wake(waiter: asyncio.Future) -> None:
+        if not waiter.done():
+            waiter.set_result(None)
+
+class RateLimiter:
+    """Client-side rate limiter for the Azure OpenAI deployments.
+
+    Before a call, one request and its estimated tokens are taken from token buckets sized to the
+    requests and tokens per minute of the deployment. When a Redis client is given, the buckets are
+    kept in Redis and updated by a Lua script, so every worker draws from the same budget;
+    otherwise, or when Redis fails, they are kept in the process. Calls run under an
+    `AdaptiveConcurrencyLimit` per deployment and retryable errors are retried up to `max_retries`
+    times, after the delay the service asked for or an exponential backoff with full jitter. A 429
+    also pauses the deployment for that delay, for every worker when the buckets are in Redis. The
+    OpenAI clients should then be created with `max_retries=0`, so calls are not retried twice.
+    """
+
+    def __init__(
+            self,
+            requests_per_minute: Dict[str, int] | None = None,
+            tokens_per_minute: Dict[str, int] | None = None,
+            cache: ScriptCacheProtocol | None = None,
+            async_cache: AsyncScriptCacheProtocol | None = None,
+            max_concurrency: int = 16,
+            max_retries: int = 6,
+            base_delay: float = 1.0,
+            max_delay: float = 60.0,
+            retryable: Callable[[BaseException], bool] | None = None,
+            key_prefix: str = "rate_limit",
+            logger: Logger | None = None,
+        ) -> None:
+        self.__requests_per_minute: Dict[str, int] = requests_per_minute or {}
+        self.__tokens_per_minute: Dict[str, int] = tokens_per_minute or {}
+        self.__cache: ScriptCacheProtocol | None = cache
+        self.__async_cache: AsyncScriptCacheProtocol | None = async_cache
+        self.__script: Any | None = cache.register_script(RATE_LIMIT_SCRIPT) if cache is not None else None
+        self.__async_script: Any | None = async_cache.register_script(RATE_LIMIT_SCRIPT) if async_cache is not None else None
+        self.__max_concurrency: int = max_concurrency
+        self.__max_retries: int = max_retries
+        self.__base_delay: float = base_delay
+        self.__max_delay: float = max_delay
+        self.__retryable: Callable[[BaseException], bool] = retryable or is_retryable
+        self.__key_prefix: str = key_prefix
+        self.__logger: Logger = logger or Logger(name="rate_limiter")
+        self.__lock: threading.Lock = threading.Lock()
+        self.__buckets: Dict[str, TokenBucket] = {}
+        self.__concurrency: Dict[str, AdaptiveConcurrencyLimit] = {}
+        self.__stats: Dict[str, float] = {"calls": 0, "retries": 0, "rate_limited": 0, "throttled_seconds": 0.0}
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        with self.__lock:
+            return dict(self.__stats, concurrency={
+                deployment: concurrency.limit for deployment, concurrency in self.__concurrency.items()})
+
+    def call(self, deployment: str, request: Callable[[], T], tokens: int = 0) -> T:
+        """Run `request` within the budgets of `deployment`, retrying it when it fails with a retryable error"""
+        concurrency: AdaptiveConcurrencyLimit = self.__concurrency_limit(deployment=deployment)
+        attempt: int = 0
+        while True:
+            self.__acquire(deployment=deployment, tokens=tokens)
+            started_at: float = concurrency.acquire()
+            rate_limited: bool = False
+            try:
+                return request()
+            except Exception as e:
+                rate_limited = status_code(error=e) == 429
+                delay: float | None = self.__retry_delay(deployment=deployment, error=e, attempt=attempt)
+                if delay is None:
+                    raise
+                if rate_limited:
+                    self.__pause(deployment=deployment, delay=delay)
+            finally:
+                concurrency.release(started_at=started_at, rate_limited=rate_limited)
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(self, deployment: str, request: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """Asynchronous counterpart of call"""
+        concurrency: AdaptiveConcurrencyLimit = self.__concurrency_limit(deployment=deployment)
+        attempt: int = 0
+        while True:
+            await self.__aacquire(deployment=deployment, tokens=tokens)
+            started_at: float = await concurrency.aacquire()
+            rate_limited: bool = False
+            try:
+                return await request()
+            except Exception as e:
+                rate_limited = status_code(error=e) == 429
+                delay: float | None = self.__retry_delay(deployment=deployment, error=e, attempt=attempt)
+                if delay is None:
+                    raise
+                if rate_limited:
+                    await self.__apause(deployment=deployment, delay=delay)
+            finally:
+                concurrency.release(started_at=started_at, rate_limited=rate_limited)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def __acquire(self, deployment: str, tokens: int) -> None:
+        while True:
+            wait: float = self.__take(deployment=deployment, tokens=tokens)
+            if wait <= 0:
+                return
+            self.__throttled(wait=wait)
+            time.sleep(wait)
+
+    async def __aacquire(self, deployment: str, tokens: int) -> None:
+        while True:
+            wait: float = await self.__atake(deployment=deployment, tokens=tokens)
+            if wait <= 0:
+                return
+            self.__throttled(wait=wait)
+            await asyncio.sleep(wait)
+
+    def __take(self, deployment: str, tokens: int) -> float:
+        """Seconds to wait before the budgets of `deployment` allow a call, zero once it is taken"""
+        if self.__script is not None:
+            try:
+                return float(self.__script(keys=self.__keys(deployment=deployment), args=self.__args(
+                    deployment=deployment, tokens=tokens)))
+            except Exception as e:
+                self.__logger.error(msg=f"Failed to take the shared rate limit budget, using the local one: {e}")
+        return self.__take_local(deployment=deployment, tokens=tokens)
+
+    async def __atake(self, deployment: str, tokens: int) -> float:
+        if self.__async_script is not None:
+            try:
+                return float(await self.__async_script(keys=self.__keys(deployment=deployment), args=self.__args(
+                    deployment=deployment, tokens=tokens)))
+            except Exception as e:
+                self.__logger.error(msg=f"Failed to take the shared rate limit budget, using the local one: {e}")
+        return self.__take_local(deployment=deployment, tokens=tokens)
+
+    def __take_local(self, deployment: str, tokens: int) -> float:
+        requests_per_minute, tokens_per_minute, tokens = self.__args(deployment=deployment, tokens=tokens)
+        with self.__lock:
+            now: float = time.monotonic()
+            bucket: TokenBucket = self.__buckets.setdefault(deployment, TokenBucket(
+                requests=requests_per_minute, tokens=tokens_per_minute, updated_at=now))
+            return bucket.take(
+                now=now, requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute, tokens=tokens)
+
+    def __retry_delay(self, deployment: str, error: Exception, attempt: int) -> float | None:
+        """Seconds to wait before retrying a failed call, or None if it must not be retried"""
+        rate_limited: bool = status_code(error=error) == 429
+        with self.__lock:
+            self.__stats["rate_limited"] += rate_limited
+        if attempt >= self.__max_retries or not self.__retryable(error):
+            return None
+        delay: float | None = retry_after(error=error)
+        if delay is None:
+            delay = random.uniform(0, self.__base_delay * 2 ** attempt)
+        delay = min(delay, self.__max_delay)
+        with self.__lock:
+            self.__stats["retries"] += 1
+        self.__logger.warning(msg=f"Retrying a call to {deployment} in {delay:.2f}s after: {error}")
+        return delay
+
+    def __pause(self, deployment: str, delay: float) -> None:
+        """Make every worker wait `delay` seconds before calling `deployment` again"""
+        if self.__cache is not None:
+            try:
+                self.__cache.set(name=self.__keys(deployment=deployment)[1], value=1, px=max(int(delay * 1000), 1))
+                return
+            except Exception as e:
+                self.__logger.error(msg=f"Failed to share the rate limit pause of {deployment}: {e}")
+        self.__pause_local(deployment=deployment, delay=delay)
+
+    async def __apause(self, deployment: str, delay: float) -> None:
+        if self.__async_cache is not None:
+            try:
+                await self.__async_cache.set(
+                    name=self.__keys(deployment=deployment)[1], value=1, px=max(int(delay * 1000), 1))
+                return
+            except Exception as e:
+                self.__logger.error(msg=f"Failed to share the rate limit pause of {deployment}: {e}")
+        self.__pause_local(deployment=deployment, delay=delay)
+
+    def __pause_local(self, deployment: str, delay: float) -> None:
+        requests_per_minute, tokens_per_minute, _ = self.__args(deployment=deployment, tokens=0)
+        with self.__lock:
+            now: float = time.monotonic()
+            bucket: TokenBucket = self.__buckets.setdefault(deployment, TokenBucket(
+                requests=requests_per_minute, tokens=tokens_per_minute, updated_at=now))
+            bucket.paused_until = max(bucket.paused_until, now + delay)
+
+    def __keys(self, deployment: str) -> List[str]:
+        # the braces keep both keys in the same slot of a Redis cluster
+        return [f"{self.__key_prefix}:{{{deployment}}}", f"{self.__key_prefix}:{{{deployment}}}:pause"]
+
+    def __args(self, deployment: str, tokens: int) -> Tuple[int, int, int]:
+        return self.__requests_per_minute.get(deployment, 0), self.__tokens_per_minute.get(deployment, 0), tokens
+
+    def __concurrency_limit(self, deployment: str) -> AdaptiveConcurrencyLimit:
+        with self.__lock:
+            self.__stats["calls"] += 1
+            concurrency: AdaptiveConcurrencyLimit | None = self.__concurrency.get(deployment)
+            if concurrency is None:
+                concurrency = self.__concurrency[deployment] = AdaptiveConcurrencyLimit(maximum=self.__max_concurrency)
+            return concurrency
+
+    def __throttled(self, wait: float) -> None:
+        with self.__lock:
+            self.__stats["throttled_seconds"] += wait
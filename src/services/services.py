@@ -1,2 +1,7 @@
 """The main module for services."""
 from history import History
+from history_codec import HistoryCodec, Compression
+from history_store import HistoryStore
+from rate_limiter import (
+    RateLimiter, AdaptiveConcurrencyLimit, TokenBucket, estimate_tokens, is_retryable, is_retryable_openai_error,
+    retry_after)
@@ -0,0 +1,112 @@
+import threading
+from dataclasses import dataclass
+from logging import Logger
+from typing import Dict, List
+import yaml
+import fsspec
+from fsspec.utils import get_protocol
+from openai.types.chat.chat_completion_tool_param import ChatCompletionToolParam
+from models import AgentConfiguration, agent_configuration_from_dict
+
+DEFAULT_AGENT_NAME: str = "default"
+
+# metadata keys that change whenever the underlying file changes, in order of preference
+VERSION_KEYS: List[str] = ["ETag", "etag", "mtime", "last_modified", "LastModified", "created"]
+
+@dataclass(frozen=True)
+class CachedAgentConfiguration:
+    """A parsed agent configuration together with its precompiled OpenAI tool list"""
+    name: str
+    location: str
+    version: str
+    agent_configuration: AgentConfiguration
+    functions_spec: List[ChatCompletionToolParam]
+
+class AgentConfigurationCache:
+    """Keeps parsed agent configurations in memory and reloads them when the source file changes.
+
+    Each named configuration is loaded once; a background thread revalidates the source by its
+    ETag or modification time every `refresh_interval` seconds and only re-reads it when it changed.
+    """
+
+    def __init__(self, refresh_interval: float = 30.0, logger: Logger | None = None) -> None:
+        self.__refresh_interval: float = refresh_interval
+        self.__logger: Logger = logger or Logger(name="agent_configuration_cache")
+        self.__lock: threading.Lock = threading.Lock()
+        self.__entries: Dict[str, CachedAgentConfiguration] = {}
+        self.__stop: threading.Event = threading.Event()
+        self.__thread: threading.Thread | None = None
+
+    def register(self, name: str, location: str) -> CachedAgentConfiguration:
+        """Load the configuration at `location` and make it available as `name`"""
+        entry: CachedAgentConfiguration = self.__load(name=name, location=location)
+        with self.__lock:
+            self.__entries[name] = entry
+        return entry
+
+    def get(self, name: str = DEFAULT_AGENT_NAME) -> CachedAgentConfiguration:
+        """Return the cached configuration registered as `name`"""
+        entry: CachedAgentConfiguration | None = self.__entries.get(name)
+        if entry is None:
+            raise KeyError(f"Agent configuration {name} is not registered")
+        return entry
+
+    def names(self) -> List[str]:
+        return list(self.__entries.keys())
+
+    def refresh(self) -> None:
+        """Reload every configuration whose source changed since it was loaded"""
+        for name, entry in list(self.__entries.items()):
+            try:
+                if self.__version(location=entry.location) == entry.version:
+                    continue
+                self.register(name=name, location=entry.location)
+                self.__logger.info(msg=f"Reloaded agent configuration {name} from {entry.location}")
+            except Exception as e:
+                # keep serving the last good configuration
+                self.__logger.error(msg=f"Failed to revalidate agent configuration {name}: {e}")
+
+    def start(self) -> None:
+        """Start revalidating configurations in the background"""
+        if self.__thread is not None or self.__refresh_interval <= 0:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(
+            target=self.__run, name="agent-configuration-refresh", daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """Stop the background revalidation"""
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout=self.__refresh_interval)
+            self.__thread = None
+
+    def __run(self) -> None:
+        while not self.__stop.wait(timeout=self.__refresh_interval):
+            self.refresh()
+
+    def __version(self, location: str) -> str:
+        info: dict = self.__fs(location=location).info(path=location)
+        for key in VERSION_KEYS:
+            if info.get(key) is not None:
+                return f"{key}:{info[key]}:{info.get('size')}"
+        return f"size:{info.get('size')}"
+
+    def __load(self, name: str, location: str) -> CachedAgentConfiguration:
+        # read the version first so a concurrent edit is picked up by the next revalidation
+        version: str = self.__version(location=location)
+        with self.__fs(location=location).open(path=location, mode="r", encoding="utf-8") as file:
+            agent_configuration: AgentConfiguration = agent_configuration_from_dict(data=yaml.safe_load(stream=file))
+
+        return CachedAgentConfiguration(
+            name=name,
+            location=location,
+            version=version,
+            agent_configuration=agent_configuration,
+            functions_spec=[tool.to_openai_tool() for tool in agent_configuration.tools],
+        )
+
+    @staticmethod
+    def __fs(location: str) -> fsspec.AbstractFileSystem:
+        return fsspec.filesystem(protocol=get_protocol(url=location))
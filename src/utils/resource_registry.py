@@ -0,0 +1,493 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from typing import Any, Callable, Dict
+import redis
+import redis.asyncio
+import requests
+from requests.adapters import HTTPAdapter
+from openai import AzureOpenAI, AsyncAzureOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient, DEFAULT_MAX_RETRIES
+import httpx
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
+from azure.search.documents import SearchClient
+from azure.storage.blob import BlobServiceClient, ContainerClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient, ContainerClient as AsyncContainerClient
+from models import Settings
+from distributedcache import SharedMemoryCache
+from functions import EmbeddingCache, PageImageCache, SearchResultCache, Retriever, AzureSearchRetriever, VectorIndex, GraphIndex
+from agents import ImagePipeline, ImageVariant, ContextBuilder, SemanticAnswerCache
+from services import HistoryCodec, HistoryStore, RateLimiter, is_retryable_openai_error
+from agent_configuration_cache import AgentConfigurationCache, DEFAULT_AGENT_NAME
+
+# asynchronous resources, in the order they are closed
+ASYNC_RESOURCES: list[str] = [
+    "async_openai_client", "async_search_client", "async_blob_service_client", "async_redis_pool"]
+
+class ResourceRegistry:
+    """Process-wide registry of long-lived clients and connection pools.
+
+    Resources are created lazily on first use and shared by every request served by the worker,
+    so TLS handshakes and connection setup are paid once per worker instead of once per request.
+    """
+
+    __instance: "ResourceRegistry | None" = None
+    __instance_pid: int | None = None
+    __instance_lock: threading.Lock = threading.Lock()
+
+    def __init__(self, settings: Settings, logger: Logger | None = None) -> None:
+        self.__settings: Settings = settings
+        self.__logger: Logger = logger or Logger(name="resource_registry")
+        self.__lock: threading.RLock = threading.RLock()
+        self.__resources: Dict[str, Any] = {}
+        self.__closed: bool = False
+
+    @classmethod
+    def get_instance(cls, settings: Settings) -> "ResourceRegistry":
+        """Return the registry of the current worker process, creating it on first use"""
+        with cls.__instance_lock:
+            # a forked worker must not reuse sockets inherited from its parent
+            if cls.__instance is None or cls.__instance_pid != os.getpid():
+                cls.__instance = ResourceRegistry(settings=settings)
+                cls.__instance_pid = os.getpid()
+            return cls.__instance
+
+    @classmethod
+    def close_instance(cls) -> None:
+        """Close and forget the registry of the current worker process"""
+        with cls.__instance_lock:
+            if cls.__instance is not None and cls.__instance_pid == os.getpid():
+                cls.__instance.close()
+            cls.__instance = None
+            cls.__instance_pid = None
+
+    @classmethod
+    async def aclose_instance(cls) -> None:
+        """Close and forget the registry of the current worker process, including its asynchronous clients"""
+        with cls.__instance_lock:
+            instance: ResourceRegistry | None = cls.__instance if cls.__instance_pid == os.getpid() else None
+            cls.__instance = None
+            cls.__instance_pid = None
+        if instance is not None:
+            await instance.aclose()
+
+    @property
+    def settings(self) -> Settings:
+        return self.__settings
+
+    def redis_client(self) -> redis.Redis:
+        """Redis client backed by the shared, size-limited connection pool"""
+        pool: redis.BlockingConnectionPool = self.__get_or_create(
+            name="redis_pool", factory=self.__create_redis_pool)
+        return redis.Redis(connection_pool=pool)
+
+    def openai_client(self) -> AzureOpenAI:
+        """Azure OpenAI client sharing one pooled HTTP client"""
+        return self.__get_or_create(name="openai_client", factory=self.__create_openai_client)
+
+    def search_client(self) -> SearchClient:
+        """Azure AI Search client sharing the pooled HTTP session"""
+        return self.__get_or_create(name="search_client", factory=self.__create_search_client)
+
+    def container_client(self) -> ContainerClient:
+        """Blob container client sharing the pooled HTTP session"""
+        blob_service_client: BlobServiceClient = self.__get_or_create(
+            name="blob_service_client", factory=self.__create_blob_service_client)
+        return blob_service_client.get_container_client(container=self.__settings.azure_container_name)
+
+    def async_redis_client(self) -> redis.asyncio.Redis:
+        """Asynchronous Redis client backed by the shared, size-limited connection pool"""
+        pool: redis.asyncio.BlockingConnectionPool = self.__get_or_create(
+            name="async_redis_pool", factory=self.__create_async_redis_pool)
+        return redis.asyncio.Redis(connection_pool=pool)
+
+    def async_openai_client(self) -> AsyncAzureOpenAI:
+        """Asynchronous Azure OpenAI client sharing one pooled HTTP client"""
+        return self.__get_or_create(name="async_openai_client", factory=self.__create_async_openai_client)
+
+    def async_search_client(self) -> AsyncSearchClient:
+        """Asynchronous Azure AI Search client"""
+        return self.__get_or_create(name="async_search_client", factory=self.__create_async_search_client)
+
+    def async_container_client(self) -> AsyncContainerClient:
+        """Asynchronous blob container client"""
+        blob_service_client: AsyncBlobServiceClient = self.__get_or_create(
+            name="async_blob_service_client", factory=self.__create_async_blob_service_client)
+        return blob_service_client.get_container_client(container=self.__settings.azure_container_name)
+
+    def embedding_cache(self) -> EmbeddingCache:
+        """Query embedding cache shared by every search of the worker, backed by Redis"""
+        return self.__get_or_create(name="embedding_cache", factory=self.__create_embedding_cache)
+
+    def shared_memory_cache(self) -> SharedMemoryCache:
+        """Cache mapped from SHARED_MEMORY_CACHE_PATH, shared by the worker processes of the host"""
+        return self.__get_or_create(name="shared_memory_cache", factory=self.__create_shared_memory_cache)
+
+    def retriever(self) -> Retriever:
+        """Azure AI Search, or the local vector index when SEARCH_BACKEND is local"""
+        return self.__get_or_create(name="retriever", factory=self.__create_retriever)
+
+    def graph_index(self) -> GraphIndex:
+        """Graph of the ontology entities and pages, loaded once from GRAPH_INDEX_PATH"""
+        return self.__get_or_create(name="graph_index", factory=self.__create_graph_index)
+
+    def search_result_cache(self) -> SearchResultCache:
+        """Search results shared by every worker through Redis"""
+        return self.__get_or_create(name="search_result_cache", factory=self.__create_search_result_cache)
+
+    def page_image_cache(self) -> PageImageCache:
+        """On-disk cache of the page images under the image directory"""
+        return self.__get_or_create(name="page_image_cache", factory=self.__create_page_image_cache)
+
+    def search_executor(self) -> ThreadPoolExecutor:
+        """Bounded thread pool that runs the searches of batched queries"""
+        return self.__get_or_create(name="search_executor", factory=self.__create_search_executor)
+
+    def graph_executor(self) -> ThreadPoolExecutor:
+        """Bounded thread pool that runs the graph leg of the searches while the vector search runs"""
+        return self.__get_or_create(name="graph_executor", factory=self.__create_graph_executor)
+
+    def download_executor(self) -> ThreadPoolExecutor:
+        """Bounded thread pool that downloads page images, shared by every request of the worker"""
+        return self.__get_or_create(name="download_executor", factory=self.__create_download_executor)
+
+    def async_download_semaphore(self) -> asyncio.Semaphore:
+        """Bounds the concurrent asynchronous page image downloads of the worker"""
+        return self.__get_or_create(name="async_download_semaphore", factory=self.__create_async_download_semaphore)
+
+    def image_pipeline(self) -> ImagePipeline:
+        """Prepares the page images sent to the model and memoizes their data URLs"""
+        return self.__get_or_create(name="image_pipeline", factory=self.__create_image_pipeline)
+
+    def context_builder(self) -> ContextBuilder:
+        """Fits the prompts of the agents in the configured token budget"""
+        return self.__get_or_create(name="context_builder", factory=self.__create_context_builder)
+
+    def answer_cache(self) -> SemanticAnswerCache:
+        """Answers to first questions, shared by every session of the worker"""
+        return self.__get_or_create(name="answer_cache", factory=self.__create_answer_cache)
+
+    def history_codec(self) -> HistoryCodec:
+        """Serializes the conversations persisted in Redis"""
+        return self.__get_or_create(name="history_codec", factory=self.__create_history_codec)
+
+    def history_store(self) -> HistoryStore:
+        """Append-only store of the conversations, retaining the turns the agent keeps in context"""
+        return self.__get_or_create(name="history_store", factory=self.__create_history_store)
+
+    def tool_executor(self) -> ThreadPoolExecutor:
+        """Bounded thread pool that runs agent tool calls concurrently"""
+        return self.__get_or_create(name="tool_executor", factory=self.__create_tool_executor)
+
+    def rate_limiter(self) -> RateLimiter:
+        """Request and token budgets of the Azure OpenAI deployments, shared by every worker through Redis"""
+        return self.__get_or_create(name="rate_limiter", factory=self.__create_rate_limiter)
+
+    def agent_configurations(self) -> AgentConfigurationCache:
+        """Cache of the default and named agent configurations, revalidated in the background"""
+        return self.__get_or_create(name="agent_configurations", factory=self.__create_agent_configurations)
+
+    def health(self) -> Dict[str, bool]:
+        """Report whether the pooled resources are usable"""
+        status: Dict[str, bool] = {"registry": not self.__closed}
+        try:
+            status["redis"] = bool(self.redis_client().ping())
+        except Exception as e:
+            self.__logger.error(msg=f"redis health check failed: {e}")
+            status["redis"] = False
+        return status
+
+    async def aclose(self) -> None:
+        """Close the asynchronous clients, then every other pooled resource"""
+        with self.__lock:
+            resources: Dict[str, Any] = {
+                name: self.__resources.pop(name) for name in ASYNC_RESOURCES if name in self.__resources}
+
+        for name in ASYNC_RESOURCES:
+            resource = resources.get(name)
+            if resource is None:
+                continue
+            try:
+                if name == "async_redis_pool":
+                    await resource.disconnect()
+                else:
+                    await resource.close()
+            except Exception as e:
+                self.__logger.error(msg=f"failed to close {name}: {e}")
+
+        self.close()
+
+    def close(self) -> None:
+        """Close every pooled resource, most dependent first"""
+        with self.__lock:
+            self.__closed = True
+            resources: Dict[str, Any] = self.__resources
+            self.__resources = {}
+
+        agent_configurations: AgentConfigurationCache | None = resources.get("agent_configurations")
+        if agent_configurations is not None:
+            agent_configurations.stop()
+
+        for name in ["tool_executor", "search_executor", "graph_executor", "download_executor"]:
+            executor: ThreadPoolExecutor | None = resources.get(name)
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        for name in ["openai_client", "search_client", "blob_service_client", "http_session", "shared_memory_cache"]:
+            resource = resources.get(name)
+            if resource is not None:
+                try:
+                    resource.close()
+                except Exception as e:
+                    self.__logger.error(msg=f"failed to close {name}: {e}")
+
+        redis_pool: redis.BlockingConnectionPool | None = resources.get("redis_pool")
+        if redis_pool is not None:
+            redis_pool.disconnect()
+
+    def __get_or_create(self, name: str, factory: Callable[[], Any]) -> Any:
+        resource = self.__resources.get(name)
+        if resource is not None:
+            return resource
+
+        with self.__lock:
+            if self.__closed:
+                raise RuntimeError("ResourceRegistry has been closed")
+            resource = self.__resources.get(name)
+            if resource is None:
+                resource = factory()
+                self.__resources[name] = resource
+            return resource
+
+    def __create_embedding_cache(self) -> EmbeddingCache:
+        return EmbeddingCache(
+            max_entries=self.__settings.embedding_cache_max_entries,
+            ttl=self.__settings.embedding_cache_ttl,
+            cache=self.redis_client(),
+            async_cache=self.async_redis_client(),
+            host_cache=self.shared_memory_cache() if self.__settings.shared_memory_cache_path is not None else None,
+        )
+
+    def __create_shared_memory_cache(self) -> SharedMemoryCache:
+        return SharedMemoryCache(
+            path=self.__settings.shared_memory_cache_path,
+            size=self.__settings.shared_memory_cache_size,
+            max_entries=self.__settings.shared_memory_cache_max_entries,
+            logger=self.__logger,
+        )
+
+    def __create_retriever(self) -> Retriever:
+        if self.__settings.search_backend == "local":
+            if self.__settings.local_vector_index_path is None:
+                raise ValueError("LOCAL_VECTOR_INDEX_PATH is required when SEARCH_BACKEND is local")
+            return VectorIndex.load(
+                directory=self.__settings.local_vector_index_path, mmap=self.__settings.local_vector_index_mmap)
+        return AzureSearchRetriever(
+            search_client=self.search_client(),
+            async_search_client=self.async_search_client(),
+            index_name=self.__settings.azure_search_index_name,
+        )
+
+    def __create_graph_index(self) -> GraphIndex:
+        if self.__settings.graph_index_path is None:
+            raise ValueError("GRAPH_INDEX_PATH is required to search the graph")
+        return GraphIndex.load(path=self.__settings.graph_index_path)
+
+    def __create_search_result_cache(self) -> SearchResultCache:
+        return SearchResultCache(
+            cache=self.redis_client(),
+            async_cache=self.async_redis_client(),
+            ttl=self.__settings.search_result_cache_ttl,
+            max_entries=self.__settings.search_result_cache_max_entries,
+        )
+
+    def __create_page_image_cache(self) -> PageImageCache:
+        return PageImageCache(
+            directory=self.__settings.smart_agent_image_path,
+            max_bytes=self.__settings.page_image_cache_max_bytes,
+            max_age=self.__settings.page_image_cache_max_age,
+            memory_cache=self.shared_memory_cache() if self.__settings.shared_memory_cache_path is not None else None,
+        )
+
+    def __create_search_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.__settings.search_max_workers, thread_name_prefix="search_vector_function")
+
+    def __create_graph_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self.__settings.search_max_workers, thread_name_prefix="graph_retrieval")
+
+    def __create_download_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.__settings.blob_download_max_concurrency, thread_name_prefix="blob_download")
+
+    def __create_async_download_semaphore(self) -> asyncio.Semaphore:
+        return asyncio.Semaphore(value=self.__settings.blob_download_max_concurrency)
+
+    def __create_image_pipeline(self) -> ImagePipeline:
+        return ImagePipeline(
+            variant=ImageVariant(
+                max_dimension=self.__settings.smart_agent_image_max_dimension,
+                format=self.__settings.smart_agent_image_format,
+                quality=self.__settings.smart_agent_image_quality,
+                detail=self.__settings.smart_agent_image_detail,
+            ),
+            max_entries=self.__settings.smart_agent_image_cache_max_entries,
+        )
+
+    def __create_context_builder(self) -> ContextBuilder:
+        return ContextBuilder(
+            max_prompt_tokens=self.__settings.smart_agent_max_prompt_tokens,
+            max_turns_with_images=self.__settings.smart_agent_max_questions_with_images,
+            deduplicate_images=self.__settings.smart_agent_deduplicate_images,
+        )
+
+    def __create_answer_cache(self) -> SemanticAnswerCache:
+        return SemanticAnswerCache(
+            threshold=self.__settings.smart_agent_answer_cache_threshold,
+            ttl=self.__settings.smart_agent_answer_cache_ttl,
+            max_entries=self.__settings.smart_agent_answer_cache_max_entries,
+        )
+
+    def __create_history_codec(self) -> HistoryCodec:
+        return HistoryCodec(
+            compression=self.__settings.history_compression,
+            allow_legacy_pickle=self.__settings.history_allow_legacy_pickle,
+        )
+
+    def __create_history_store(self) -> HistoryStore:
+        return HistoryStore(
+            cache=self.redis_client(),
+            async_cache=self.async_redis_client(),
+            codec=self.history_codec(),
+            # the agent keeps max_question_to_keep - 1 questions, including the one being asked
+            max_turns=self.__settings.smart_agent_max_question_to_keep - 2,
+            ttl=self.__settings.history_ttl,
+        )
+
+    def __create_tool_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.__settings.smart_agent_max_tool_workers, thread_name_prefix="smart_agent_tool")
+
+    def __create_agent_configurations(self) -> AgentConfigurationCache:
+        cache = AgentConfigurationCache(refresh_interval=self.__settings.smart_agent_prompt_refresh_interval)
+        cache.register(name=DEFAULT_AGENT_NAME, location=self.__settings.smart_agent_prompt_location)
+        for name, location in self.__settings.smart_agent_prompt_locations.items():
+            cache.register(name=name, location=location)
+        cache.start()
+        return cache
+
+    def __create_redis_pool(self) -> redis.BlockingConnectionPool:
+        return redis.BlockingConnectionPool(
+            connection_class=redis.SSLConnection,
+            max_connections=self.__settings.redis_max_connections,
+            timeout=self.__settings.redis_pool_timeout,
+            host=self.__settings.azure_redis_endpoint,
+            port=6380,
+            db=0,
+            password=self.__settings.azure_redis_key,
+            decode_responses=False,
+            health_check_interval=self.__settings.redis_health_check_interval,
+        )
+
+    def __create_async_redis_pool(self) -> redis.asyncio.BlockingConnectionPool:
+        return redis.asyncio.BlockingConnectionPool(
+            connection_class=redis.asyncio.SSLConnection,
+            max_connections=self.__settings.redis_max_connections,
+            timeout=self.__settings.redis_pool_timeout,
+            host=self.__settings.azure_redis_endpoint,
+            port=6380,
+            db=0,
+            password=self.__settings.azure_redis_key,
+            decode_responses=False,
+            health_check_interval=self.__settings.redis_health_check_interval,
+        )
+
+    def __create_async_openai_client(self) -> AsyncAzureOpenAI:
+        return AsyncAzureOpenAI(
+            api_key=self.__settings.openai_key,
+            api_version=self.__settings.openai_api_version,
+            azure_endpoint=self.__settings.openai_endpoint,
+            # the rate limiter retries the calls itself
+            max_retries=0 if self.__settings.openai_rate_limiter_enabled else DEFAULT_MAX_RETRIES,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.__settings.http_max_connections,
+                    max_keepalive_connections=self.__settings.http_max_keepalive_connections,
+                ),
+                timeout=self.__settings.http_timeout,
+            ),
+        )
+
+    def __create_async_search_client(self) -> AsyncSearchClient:
+        return AsyncSearchClient(
+            endpoint=self.__settings.azure_search_endpoint,
+            index_name=self.__settings.azure_search_index_name,
+            credential=AzureKeyCredential(key=self.__settings.azure_search_key),
+        )
+
+    def __create_async_blob_service_client(self) -> AsyncBlobServiceClient:
+        return AsyncBlobServiceClient(
+            account_url=f"https://{self.__settings.azure_storage_account_name}.blob.core.windows.net",
+            credential=self.__settings.azure_storage_account_key,
+        )
+
+    def __create_openai_client(self) -> AzureOpenAI:
+        return AzureOpenAI(
+            api_key=self.__settings.openai_key,
+            api_version=self.__settings.openai_api_version,
+            azure_endpoint=self.__settings.openai_endpoint,
+            # the rate limiter retries the calls itself
+            max_retries=0 if self.__settings.openai_rate_limiter_enabled else DEFAULT_MAX_RETRIES,
+            http_client=DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.__settings.http_max_connections,
+                    max_keepalive_connections=self.__settings.http_max_keepalive_connections,
+                ),
+                timeout=self.__settings.http_timeout,
+            ),
+        )
+
+    def __create_rate_limiter(self) -> RateLimiter:
+        return RateLimiter(
+            requests_per_minute=self.__settings.openai_requests_per_minute,
+            tokens_per_minute=self.__settings.openai_tokens_per_minute,
+            cache=self.redis_client(),
+            async_cache=self.async_redis_client(),
+            max_concurrency=self.__settings.openai_max_concurrency,
+            max_retries=self.__settings.openai_max_retries,
+            retryable=is_retryable_openai_error,
+            logger=self.__logger,
+        )
+
+    def __create_http_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.__settings.http_max_keepalive_connections,
+            pool_maxsize=self.__settings.http_max_connections,
+            pool_block=True,
+        )
+        session.mount(prefix="https://", adapter=adapter)
+        session.mount(prefix="http://", adapter=adapter)
+        return session
+
+    def __transport(self) -> RequestsTransport:
+        session: requests.Session = self.__get_or_create(name="http_session", factory=self.__create_http_session)
+        return RequestsTransport(session=session, session_owner=False, connection_timeout=self.__settings.http_timeout)
+
+    def __create_search_client(self) -> SearchClient:
+        return SearchClient(
+            endpoint=self.__settings.azure_search_endpoint,
+            index_name=self.__settings.azure_search_index_name,
+            credential=AzureKeyCredential(key=self.__settings.azure_search_key),
+            transport=self.__transport(),
+        )
+
+    def __create_blob_service_client(self) -> BlobServiceClient:
+        return BlobServiceClient(
+            account_url=f"https://{self.__settings.azure_storage_account_name}.blob.core.windows.net",
+            credential=self.__settings.azure_storage_account_key,
+            transport=self.__transport(),
+        )
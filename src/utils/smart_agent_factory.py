@@ -1,83 +1,147 @@
-from typing import Awaitable
-import redis
-import yaml
 import fsspec
 from logging import Logger
-from openai import AzureOpenAI
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
-from distributedcache import CacheProtocol
-from functions import SearchVectorFunction
-from models import AgentConfiguration, agent_configuration_from_dict
+from functions import SearchFunction, SearchVectorFunction, GraphSearchFunction, RetrievalOrchestrator
 from models import Settings
-import base64
-import pickle
 from agents import Smart_Agent
-from redis.commands.core import BasicKeyCommands
-from redis.typing import KeyT, ResponseT, AbsExpiryT, ExpiryT, EncodableT
+from resource_registry import ResourceRegistry
+from agent_configuration_cache import CachedAgentConfiguration, DEFAULT_AGENT_NAME
 
 class SmartAgentFactory:
     @staticmethod
-    def create_smart_agent(fs: fsspec.AbstractFileSystem, settings: Settings, session_id: str) -> Smart_Agent:
-        with fs.open(path=settings.smart_agent_prompt_location, mode="r", encoding="utf-8") as file:
-            agent_config_data = yaml.safe_load(stream=file)
-            agent_config: AgentConfiguration = agent_configuration_from_dict(data=agent_config_data)
-
-        search_client = SearchClient(
-            endpoint=settings.azure_search_endpoint,
-            index_name=settings.azure_search_index_name,
-            credential=AzureKeyCredential(key=settings.azure_search_key)
+    def create_smart_agent(
+            fs: fsspec.AbstractFileSystem,
+            settings: Settings,
+            session_id: str,
+            resources: ResourceRegistry | None = None,
+            agent_name: str = DEFAULT_AGENT_NAME) -> Smart_Agent:
+        resources = resources or ResourceRegistry.get_instance(settings=settings)
+        init_history=[]
+        if session_id:
+            init_history = resources.history_store().load(session_id=session_id)
+        return SmartAgentFactory.__build(
+            fs=fs,
+            settings=settings,
+            resources=resources,
+            agent_name=agent_name,
+            init_history=init_history,
+            asynchronous=False,
         )
 
-        client = AzureOpenAI(
-            api_key=settings.openai_key,
-            api_version=settings.openai_api_version,
-            azure_endpoint=settings.openai_endpoint,
+    @staticmethod
+    async def acreate_smart_agent(
+            fs: fsspec.AbstractFileSystem,
+            settings: Settings,
+            session_id: str,
+            resources: ResourceRegistry | None = None,
+            agent_name: str = DEFAULT_AGENT_NAME) -> Smart_Agent:
+        """Create a smart agent whose arun uses the asynchronous clients"""
+        resources = resources or ResourceRegistry.get_instance(settings=settings)
+        init_history=[]
+        if session_id:
+            init_history = await resources.history_store().aload(session_id=session_id)
+        return SmartAgentFactory.__build(
+            fs=fs,
+            settings=settings,
+            resources=resources,
+            agent_name=agent_name,
+            init_history=init_history,
+            asynchronous=True,
         )
 
-        search_vector_function = SearchVectorFunction(  
-            logger=Logger(name="search_vector_function"),  
-            search_client=search_client,  
-            client=client,  
-            model=settings.openai_embedding_deployment,  
-            image_directory=settings.smart_agent_image_path,  
-            storage_account_key=settings.azure_storage_account_key,  
-            storage_account_name=settings.azure_storage_account_name,  
-            container_name=settings.azure_container_name  
-        )  
+    @staticmethod
+    def __build(
+            fs: fsspec.AbstractFileSystem,
+            settings: Settings,
+            resources: ResourceRegistry,
+            agent_name: str,
+            init_history: list,
+            asynchronous: bool) -> Smart_Agent:
+        agent_config: CachedAgentConfiguration = resources.agent_configurations().get(name=agent_name)
 
-        redis_client: CacheProtocol[KeyT, ResponseT, EncodableT, ExpiryT, AbsExpiryT] = redis.Redis(
-            host=settings.azure_redis_endpoint,
-            port=6380,
-            ssl=True,
-            db=0,
-            password=settings.azure_redis_key,
-            decode_responses=True
+        client = resources.openai_client()
+        async_client = resources.async_openai_client() if asynchronous else None
+
+        search_vector_function = SearchVectorFunction(
+            logger=Logger(name="search_vector_function"),
+            search_client=resources.search_client(),
+            client=client,
+            model=settings.openai_embedding_deployment,
+            image_directory=settings.smart_agent_image_path,
+            container_client=resources.container_client(),
+            async_search_client=resources.async_search_client() if asynchronous else None,
+            async_client=async_client,
+            async_container_client=resources.async_container_client() if asynchronous else None,
+            embedding_cache=resources.embedding_cache(),
+            search_executor=resources.search_executor(),
+            page_image_cache=resources.page_image_cache(),
+            download_executor=resources.download_executor(),
+            download_semaphore=resources.async_download_semaphore(),
+            return_image_bytes=True,
+            persist_images=settings.smart_agent_persist_images,
+            search_result_cache=resources.search_result_cache() if settings.search_result_cache_ttl > 0 else None,
+            retriever=resources.retriever(),
+            rate_limiter=resources.rate_limiter() if settings.openai_rate_limiter_enabled else None,
         )
-        init_history=[]
-        if session_id:
 
-            raw_hist = redis_client.get(session_id)
-            init_history = pickle.loads(base64.b64decode(s=raw_hist)) if raw_hist else []
+        search_function: SearchFunction = search_vector_function
+        graph_search_function: GraphSearchFunction | None = None
+        if settings.graph_index_path is not None:
+            graph_search_function = GraphSearchFunction(
+                logger=Logger(name="graph_search_function"),
+                graph_index=resources.graph_index(),
+                max_hops=settings.graph_search_max_hops,
+                max_results=settings.graph_search_max_results,
+            )
+            # search the graph alongside the vector index
+            search_function = RetrievalOrchestrator(
+                logger=Logger(name="retrieval_orchestrator"),
+                search_vector_function=search_vector_function,
+                graph_index=resources.graph_index(),
+                max_graph_pages=settings.graph_retrieval_max_pages,
+                max_results=settings.retrieval_max_results,
+                rank_fusion_k=settings.rank_fusion_k,
+                executor=resources.graph_executor(),
+            )
+
         return Smart_Agent(
             logger=Logger(name="smart_agent"),
             client=client,
-            agent_configuration=agent_config,
-            search_vector_function = search_vector_function,
+            async_client=async_client,
+            agent_configuration=agent_config.agent_configuration,
+            functions_spec=agent_config.functions_spec,
+            search_vector_function=search_function,
             init_history=init_history,
+            max_question_to_keep=settings.smart_agent_max_question_to_keep,
             fs=fs,
             image_directory=settings.smart_agent_image_path,
+            tool_executor=resources.tool_executor(),
+            tool_timeout=settings.smart_agent_tool_timeout,
+            image_pipeline=resources.image_pipeline(),
+            context_builder=resources.context_builder(),
+            answer_cache=resources.answer_cache() if settings.smart_agent_answer_cache_enabled else None,
+            # the version changes whenever prompt.yaml does, which drops the answers of the previous prompt
+            answer_cache_version=agent_config.version,
+            answer_cache_namespace=agent_name,
+            graph_search_function=graph_search_function,
+            rate_limiter=resources.rate_limiter() if settings.openai_rate_limiter_enabled else None,
         )
+
     @staticmethod
-    def persist_history(smart_agent:Smart_Agent, session_id: str, settings: Settings) -> None:
-        redis_client: CacheProtocol[KeyT, ResponseT, EncodableT, ExpiryT, AbsExpiryT] = redis.Redis(
-            host=settings.azure_redis_endpoint,
-            port=6380,
-            ssl=True,
-            db=0,
-            password=settings.azure_redis_key,
-            decode_responses=True
-        )
-        history = smart_agent._conversation   
-        redis_client.set(name=session_id, value=base64.b64encode(pickle.dumps(history)))
-        redis_client.expire(name=session_id, time=3600)
\ No newline at end of file
+    def persist_history(
+            smart_agent:Smart_Agent,
+            session_id: str,
+            settings: Settings,
+            resources: ResourceRegistry | None = None) -> None:
+        """Append the turn the agent has just answered to the history of the session"""
+        resources = resources or ResourceRegistry.get_instance(settings=settings)
+        resources.history_store().append(session_id=session_id, turn=smart_agent.current_turn())
+
+    @staticmethod
+    async def apersist_history(
+            smart_agent:Smart_Agent,
+            session_id: str,
+            settings: Settings,
+            resources: ResourceRegistry | None = None) -> None:
+        """Append the turn the agent has just answered to the history of the session without blocking the event loop"""
+        resources = resources or ResourceRegistry.get_instance(settings=settings)
+        await resources.history_store().aappend(session_id=session_id, turn=smart_agent.current_turn())
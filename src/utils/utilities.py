@@ -5,6 +5,7 @@ import json
 import os
 import base64
 from openai import AzureOpenAI
+from models import Conversation
 import streamlit as st
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
@@ -22,6 +23,7 @@ import pandas as pd
 from dotenv import load_dotenv
 import inspect
 import openai
+from services import RateLimiter, estimate_tokens, is_retryable_openai_error
 env_path = Path('..') / '.env'
 load_dotenv(dotenv_path=env_path)
 MAX_ERROR_RUN = 3
@@ -37,7 +39,10 @@ client = AzureOpenAI(
     api_key=env.get("AZURE_OPENAI_API_KEY"),
     api_version=getenv("AZURE_OPENAI_API_VERSION"),
     azure_endpoint=env.get("AZURE_OPENAI_ENDPOINT"),
+    # rate_limiter retries the calls itself
+    max_retries=0,
 )
+rate_limiter = RateLimiter(retryable=is_retryable_openai_error)
 max_conversation_len = 5  # Set the desired value of k
 
 
@@ -57,22 +62,18 @@ search_client = SearchClient(
 # Function to generate embeddings for title and content fields, also used for query embeddings
 def get_embedding(text, model=emb_engine):
     text = text.replace("\n", " ")
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
+    return rate_limiter.call(
+        deployment=model,
+        request=lambda: client.embeddings.create(input=[text], model=model),
+        tokens=estimate_tokens(text=text)).data[0].embedding
 
 
 credential = AzureKeyCredential(key)
 
 
 def get_text_embedding(text, model=os.getenv("AZURE_OPENAI_EMB_DEPLOYMENT")):
-    text = text.replace("\n", " ")
-    while True:
-        try:
-            embedding_response = client.embeddings.create(
-                input=[text], model=model).data[0].embedding
-            return embedding_response
-        except openai.error.RateLimitError:
-            print("Rate limit exceeded. Retrying after 10 seconds...")
-            time.sleep(10)
+    # retried with backoff, after the delay the service asks for when it is rate limited
+    return get_embedding(text=text, model=model)
 
 
 today = pd.Timestamp.today()
@@ -318,33 +319,18 @@ def check_args(function, args):
 
 
 def clean_up_history(history, max_q_with_detail_hist=1, max_q_to_keep=2):
-    # start from end of history, count the messages with role user, if the count is more than max_q_with_detail_hist, remove messages from there with roles tool.
-    # if the count is more than max_q_hist_to_keep, remove all messages from there until message number 1
-    question_count = 0
-    removal_indices = []
-    for idx in range(len(history)-1, 0, -1):
-        message = dict(history[idx])
-        if message.get("role") == "user":
-            question_count += 1
-            # print("question_count added, it becomes: ", question_count)
-        if question_count >= max_q_with_detail_hist and question_count < max_q_to_keep:
-            if message.get("role") != "user" and message.get("role") != "assistant" and len(message.get("content")) == 0:
-                removal_indices.append(idx)
-        if question_count >= max_q_to_keep:
-            removal_indices.append(idx)
-
-    # remove items with indices in removal_indices
-    for index in removal_indices:
-        del history[index]
+    # keep the last max_q_to_keep - 1 questions, and the tool messages that returned nothing only for the last max_q_with_detail_hist
+    conversation = Conversation.from_messages(messages=history)
+    conversation.strip_detail(max_turns_with_detail=max_q_with_detail_hist)
+    conversation.trim(max_turns=max_q_to_keep - 1)
+    history[:] = conversation.messages()
 
 
 def reset_history_to_last_question(history):
     # pop messages from history from last item to the message with role user
-    for i in range(len(history)-1, -1, -1):
-        message = dict(history[i])
-        if message.get("role") == "user":
-            break
-        history.pop()
+    conversation = Conversation.from_messages(messages=history)
+    conversation.reset_to_last_question()
+    history[:] = conversation.messages()
     for session_item in st.session_state:
         if 'data_from_display' in session_item or 'comment_on_graph' in session_item:
             del st.session_state[session_item]
@@ -400,7 +386,7 @@ class Smart_Agent():
                 print(
                     f"resetting history due to too many errors ({execution_error_count} errors) in the code execution")
                 execution_error_count = 0
-            response = client.chat.completions.create(
+            response = rate_limiter.call(deployment=self.engine, request=lambda: client.chat.completions.create(
                 # The deployment name you chose when you deployed the GPT-35-turbo or GPT-4 model.
                 model=self.engine,
                 messages=self.conversation,
@@ -410,7 +396,7 @@ class Smart_Agent():
                 temperature=0.2,
 
 
-            )
+            ))
             run_count += 1
             response_message = response.choices[0].message
             if response_message.content is None:
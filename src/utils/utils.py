@@ -1,3 +1,5 @@
 """The main module for utils."""
 
 from smart_agent_factory import SmartAgentFactory
+from resource_registry import ResourceRegistry
+from agent_configuration_cache import AgentConfigurationCache, CachedAgentConfiguration, DEFAULT_AGENT_NAME
@@ -0,0 +1,58 @@
+"""Compares the payload size and encode/decode time of the history formats.
+
+Run with `python tests/benchmark_history_codec.py`.
+"""
+import base64
+import pickle
+import random
+import timeit
+from typing import Any, Callable, List, Tuple
+from openai.types.chat.chat_completion_message import ChatCompletionMessage
+from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+from services import HistoryCodec
+
+def conversation(questions: int, pages: int, image_size: int) -> List[Any]:
+    # compressed page images are close to random bytes
+    image: str = base64.b64encode(random.Random(0).randbytes(image_size)).decode()
+    messages: List[Any] = [{"role": "system", "content": "You are a helpful research assistant. " * 20}]
+    for question in range(questions):
+        messages.append({"role": "user", "content": f"Question {question} about the brand guidelines"})
+        messages.append(ChatCompletionMessage(
+            role="assistant",
+            content="",
+            tool_calls=[ChatCompletionMessageToolCall(
+                id=f"call_{question}",
+                type="function",
+                function=Function(name="search", arguments=f"{{\"search_query\": \"question {question}\"}}"))]))
+        content: List[dict] = []
+        for page in range(pages):
+            content.append({"type": "text", "text": f"file_name: images/file_{question}/page_{page}.png"})
+            content.append({"type": "image_url", "image_url": {
+                "url": "data:image/jpeg;base64," + image,
+                "detail": "high"}})
+            content.append({"type": "text", "text": "HINT: The following kind of content might be related " * 10})
+        messages.append({"tool_call_id": f"call_{question}", "role": "tool", "name": "search", "content": content})
+        messages.append({"role": "assistant", "content": "An answer that cites the pages. " * 30})
+    return messages
+
+def formats() -> List[Tuple[str, Callable[[List[Any]], bytes], Callable[[bytes], List[Any]]]]:
+    candidates: List[Tuple[str, Callable[[List[Any]], bytes], Callable[[bytes], List[Any]]]] = [
+        ("pickle+base64", lambda c: base64.b64encode(pickle.dumps(c)), lambda p: pickle.loads(base64.b64decode(p)))]
+    for compression in ["none", "zlib", "zstd"]:
+        codec = HistoryCodec(compression=compression)
+        candidates.append((f"json+{compression}", codec.encode, codec.decode))
+    return candidates
+
+def main() -> None:
+    for questions, pages, image_size in [(1, 1, 16 * 1024), (3, 3, 64 * 1024), (10, 3, 64 * 1024)]:
+        messages: List[Any] = conversation(questions=questions, pages=pages, image_size=image_size)
+        print(f"{questions} questions, {pages} pages of {image_size // 1024} KiB")
+        for name, encode, decode in formats():
+            payload: bytes = encode(messages)
+            number: int = 20
+            encode_time: float = timeit.timeit(lambda: encode(messages), number=number) / number
+            decode_time: float = timeit.timeit(lambda: decode(payload), number=number) / number
+            print(f"  {name:<14} {len(payload):>10} bytes  encode {encode_time * 1000:8.2f} ms  decode {decode_time * 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+from pathlib import Path
+import pytest
+from utils import AgentConfigurationCache, CachedAgentConfiguration
+
+PROMPT: str = """
+name: "{name}"
+model: "gpt-4o"
+initial_message: "Hi"
+persona: "You are a test agent"
+tools:
+    - name: "search"
+      description: "Semantic Search Engine to search for content"
+      type: "function"
+      parameters:
+        type: "object"
+        properties:
+        - search_query:
+            type: "string"
+            description: "Natural language query to search for content"
+      required:
+        - "search_query"
+"""
+
+@pytest.fixture
+def prompt_location(tmp_path: Path) -> str:
+    location: Path = tmp_path / "prompt.yaml"
+    location.write_text(data=PROMPT.format(name="SmartAgent"), encoding="utf-8")
+    return str(object=location)
+
+def test_configuration_is_parsed_once(prompt_location: str) -> None:
+    """Test that the parsed configuration and tool list are served from memory"""
+    cache = AgentConfigurationCache(refresh_interval=0)
+    cache.register(name="default", location=prompt_location)
+
+    entry: CachedAgentConfiguration = cache.get()
+
+    assert entry is cache.get(name="default")
+    assert entry.agent_configuration.name == "SmartAgent"
+    assert entry.functions_spec[0]["function"]["name"] == "search"
+
+def test_changed_configuration_is_reloaded(prompt_location: str) -> None:
+    """Test that a refresh picks up edits to the source file"""
+    cache = AgentConfigurationCache(refresh_interval=0)
+    cache.register(name="default", location=prompt_location)
+    cache.refresh()
+    unchanged: CachedAgentConfiguration = cache.get()
+
+    Path(prompt_location).write_text(data=PROMPT.format(name="EditedSmartAgent"), encoding="utf-8")
+    cache.refresh()
+
+    assert unchanged.agent_configuration.name == "SmartAgent"
+    assert cache.get().agent_configuration.name == "EditedSmartAgent"
+
+def test_named_configurations(prompt_location: str, tmp_path: Path) -> None:
+    """Test that several configurations are served side by side"""
+    other_location: Path = tmp_path / "other.yaml"
+    other_location.write_text(data=PROMPT.format(name="OtherAgent"), encoding="utf-8")
+    cache = AgentConfigurationCache(refresh_interval=0)
+    cache.register(name="default", location=prompt_location)
+    cache.register(name="other", location=str(object=other_location))
+
+    assert cache.get().agent_configuration.name == "SmartAgent"
+    assert cache.get(name="other").agent_configuration.name == "OtherAgent"
+    with pytest.raises(KeyError):
+        cache.get(name="missing")
@@ -0,0 +1,31 @@
+from agents import SemanticAnswerCache
+
+def test_similar_question_returns_the_cached_answer() -> None:
+    """Test that a question close enough to a cached one gets its answer, and a different one does not"""
+    answer_cache = SemanticAnswerCache(threshold=0.95)
+    answer_cache.store(namespace="default", version="1", question="question", embedding=[1.0, 0.0, 0.0], answer="answer")
+
+    assert answer_cache.lookup(namespace="default", version="1", embedding=[0.99, 0.05, 0.0]) == "answer"
+    assert answer_cache.lookup(namespace="default", version="1", embedding=[0.0, 1.0, 0.0]) is None
+    assert answer_cache.lookup(namespace="other", version="1", embedding=[1.0, 0.0, 0.0]) is None
+    assert answer_cache.stats == {"default": {"hits": 1, "misses": 1, "entries": 1}}
+
+def test_new_configuration_version_drops_the_cached_answers() -> None:
+    """Test that the answers of a previous version of the configuration are never returned"""
+    answer_cache = SemanticAnswerCache()
+    answer_cache.store(namespace="default", version="1", question="question", embedding=[1.0, 0.0], answer="answer")
+
+    assert answer_cache.lookup(namespace="default", version="2", embedding=[1.0, 0.0]) is None
+    assert answer_cache.lookup(namespace="default", version="1", embedding=[1.0, 0.0]) is None
+
+def test_expired_and_evicted_answers_are_not_returned() -> None:
+    """Test that answers expire after the TTL and that a full index reuses its oldest row"""
+    expired_cache = SemanticAnswerCache(ttl=-1)
+    expired_cache.store(namespace="default", version="1", question="question", embedding=[1.0, 0.0], answer="answer")
+    full_cache = SemanticAnswerCache(max_entries=2)
+    for index, embedding in enumerate([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]):
+        full_cache.store(namespace="default", version="1", question=str(index), embedding=embedding, answer=str(index))
+
+    assert expired_cache.lookup(namespace="default", version="1", embedding=[1.0, 0.0]) is None
+    assert full_cache.lookup(namespace="default", version="1", embedding=[1.0, 0.0, 0.0]) is None
+    assert full_cache.lookup(namespace="default", version="1", embedding=[0.0, 0.0, 1.0]) == "2"
@@ -0,0 +1,88 @@
+from typing import Any, List
+from agents import ContextBuilder, PromptCompaction, TokenCounter
+from models import Conversation
+
+def tool_output(call_id: str, pages: int) -> dict:
+    content: List[dict] = []
+    for page in range(pages):
+        content.append({"type": "text", "text": f"file_name: images/file/page_{page}.png"})
+        content.append({"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + "A" * 100000, "detail": "high"}})
+    return {"tool_call_id": call_id, "role": "tool", "name": "search", "content": content}
+
+def tool_request(call_id: str) -> dict:
+    return {"role": "assistant", "content": "", "tool_calls": [
+        {"id": call_id, "type": "function", "function": {"name": "search", "arguments": "{\"search_query\": \"query\"}"}}]}
+
+def turn(number: int, iterations: int = 1, answered: bool = True) -> List[Any]:
+    messages: List[Any] = [{"role": "user", "content": f"question {number}"}]
+    for iteration in range(iterations):
+        call_id: str = f"call_{number}_{iteration}"
+        messages += [tool_request(call_id=call_id), tool_output(call_id=call_id, pages=2)]
+    if answered:
+        messages.append({"role": "assistant", "content": f"answer {number}"})
+    return messages
+
+def conversation(*turns: List[Any]) -> Conversation:
+    return Conversation(preamble=[{"role": "system", "content": "persona"}], messages=[m for t in turns for m in t])
+
+def test_images_are_counted_by_detail_level() -> None:
+    """Test that an image costs the tokens of its detail level, not of its data URL"""
+    token_counter = TokenCounter()
+
+    assert token_counter.message(message=tool_output(call_id="call", pages=1)) < 900
+    assert token_counter.content(content=[
+        {"type": "image_ref", "image_ref": {"path": "file_1/page_1.png", "digest": "0" * 64, "detail": "low"}}]) == 85
+
+def test_conversation_within_budget_is_sent_unchanged() -> None:
+    """Test that nothing is removed while the prompt fits"""
+    history: Conversation = conversation(turn(number=0), turn(number=1, answered=False))
+
+    messages, tokens = ContextBuilder(max_prompt_tokens=100000, max_turns_with_images=None, deduplicate_images=False).build(conversation=history)
+
+    assert messages == history.messages()
+    assert tokens == TokenCounter().messages(messages=history.messages())
+
+def test_earlier_tool_outputs_are_removed_before_earlier_questions() -> None:
+    """Test that the outputs of earlier questions go first, keeping the questions and their answers"""
+    history: Conversation = conversation(turn(number=0), turn(number=1, answered=False))
+    budget: int = TokenCounter().messages(messages=history.messages()) - 100
+
+    messages, tokens = ContextBuilder(max_prompt_tokens=budget, max_turns_with_images=None, deduplicate_images=False).build(conversation=history)
+
+    assert tokens <= budget
+    assert {"role": "assistant", "content": "answer 0"} in messages
+    assert "removed" in messages[3]["content"]
+    assert messages[-1] == history[-1]
+    assert history[3]["content"] != messages[3]["content"]
+
+def test_current_question_keeps_its_latest_tool_outputs() -> None:
+    """Test that earlier questions are dropped, then earlier tool iterations, but never the latest outputs"""
+    history: Conversation = conversation(turn(number=0), turn(number=1, iterations=2, answered=False))
+    latest_outputs: dict = history[-1]
+
+    messages, tokens = ContextBuilder(max_prompt_tokens=2000, max_turns_with_images=None, deduplicate_images=False).build(conversation=history)
+
+    assert [message["content"] for message in messages if message["role"] == "user"] == ["question 1"]
+    assert messages[-1] == latest_outputs
+    assert all(part["type"] == "text" for part in messages[-3]["content"])
+    assert tokens <= 2000
+
+def test_images_are_only_sent_once_for_the_current_question() -> None:
+    """Test that earlier questions keep the file names of their pages and a page returned twice is sent once"""
+    history: Conversation = conversation(turn(number=0), turn(number=1, iterations=2, answered=False))
+    compaction = PromptCompaction()
+
+    messages, tokens = ContextBuilder().build(conversation=history, compaction=compaction)
+
+    images: List[List[str]] = [
+        [part["type"] for part in message["content"]] for message in messages if message["role"] == "tool"]
+    assert images == [
+        ["text", "text"],
+        ["text", "image_url", "text", "text"],
+        ["text", "text", "text", "text"],
+    ]
+    assert messages[3]["content"][0]["text"] == "file_name: images/file/page_0.png"
+    assert messages[-1]["content"][1]["text"] == "[this page is shown above]"
+    assert compaction.image_parts == 5
+    assert compaction.image_bytes == 5 * len("data:image/jpeg;base64,") + 5 * 100000
+    assert history.messages()[3]["content"][1]["type"] == "image_url"
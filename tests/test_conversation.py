@@ -0,0 +1,71 @@
+from typing import List
+from models import Conversation
+
+def question(number: int) -> List[dict]:
+    return [
+        {"role": "user", "content": f"question {number}"},
+        {"role": "assistant", "content": "", "tool_calls": []},
+        {"tool_call_id": f"call_{number}", "role": "tool", "name": "search", "content": []},
+        {"tool_call_id": f"call_{number}", "role": "tool", "name": "search", "content": [{"type": "text", "text": "page"}]},
+        {"role": "assistant", "content": f"answer {number}"},
+    ]
+
+def conversation(questions: int) -> Conversation:
+    return Conversation(
+        preamble=[{"role": "system", "content": "persona"}, {"role": "assistant", "content": "welcome"}],
+        messages=[message for number in range(questions) for message in question(number=number)])
+
+def test_messages_are_grouped_by_turn() -> None:
+    """Test that the flat view, indexing and length follow the messages in order"""
+    history: Conversation = conversation(questions=2)
+
+    assert len(history.turns) == 2
+    assert history.last_turn == question(number=1)
+    assert len(history) == 12
+    assert history[1] == {"role": "assistant", "content": "welcome"}
+    assert history[-1] == {"role": "assistant", "content": "answer 1"}
+    assert history[2:4] == question(number=0)[:2]
+    assert list(history) == history.messages()
+
+def test_old_turns_are_trimmed_and_stripped() -> None:
+    """Test that old turns are dropped whole and lose the tool messages that returned nothing"""
+    history: Conversation = conversation(questions=4)
+
+    history.strip_detail(max_turns_with_detail=1)
+    history.trim(max_turns=2)
+
+    assert history.preamble[0] == {"role": "system", "content": "persona"}
+    assert [turn.messages[0]["content"] for turn in history.turns] == ["question 2", "question 3"]
+    assert history.turns[0].messages == [message for index, message in enumerate(question(number=2)) if index != 2]
+    assert history.last_turn == question(number=3)
+    assert len(history) == len(history.messages())
+
+def test_messages_added_after_stripping_are_stripped() -> None:
+    """Test that the tool messages of the current turn are stripped when no turn keeps its detail"""
+    history: Conversation = conversation(questions=1)
+    history.append(message=question(number=1)[0])
+    history.strip_detail(max_turns_with_detail=0)
+
+    for message in question(number=1)[1:]:
+        history.append(message=message)
+    history.strip_detail(max_turns_with_detail=0)
+
+    assert history.last_turn == [message for index, message in enumerate(question(number=1)) if index != 2]
+    assert len(history) == len(history.messages())
+
+def test_reset_and_pop_follow_the_last_turn() -> None:
+    """Test that the last question can be retried and its last message removed"""
+    history: Conversation = conversation(questions=1)
+
+    assert history.pop() == {"role": "assistant", "content": "answer 0"}
+    history.reset_to_last_question()
+
+    assert history.last_turn == [{"role": "user", "content": "question 0"}]
+    assert len(history) == 3
+
+def test_flat_messages_are_grouped() -> None:
+    """Test that a persisted flat conversation keeps the messages before the first question as the preamble"""
+    history: Conversation = Conversation.from_messages(messages=conversation(questions=2).messages())
+
+    assert len(history.preamble) == 2
+    assert len(history.turns) == 2
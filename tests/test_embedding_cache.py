@@ -0,0 +1,45 @@
+from typing import Dict
+import pytest_mock
+from unittest.mock import Mock
+from functions import EmbeddingCache
+
+def setup_shared_cache(mocker: pytest_mock.MockerFixture) -> Mock:
+    store: Dict[str, bytes] = {}
+    return mocker.Mock(
+        get=mocker.Mock(side_effect=lambda name: store.get(name)),
+        set=mocker.Mock(side_effect=lambda name, value, ex=None: store.__setitem__(name, value)),
+    )
+
+def test_normalized_queries_share_an_entry() -> None:
+    """Test that queries differing only in case and whitespace hit the same entry"""
+    embedding_cache = EmbeddingCache()
+    embedding_cache.set(model="embedding", text="What is the slogan of NESCAFE?", embedding=[0.5, 0.25])
+
+    assert embedding_cache.get(model="embedding", text="  what is the slogan\nof nescafe?") == [0.5, 0.25]
+    assert embedding_cache.get(model="other-embedding", text="What is the slogan of NESCAFE?") is None
+    assert embedding_cache.stats["hits"] == 1
+    assert embedding_cache.stats["misses"] == 1
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    """Test that the in-process tier stays within its size limit"""
+    embedding_cache = EmbeddingCache(max_entries=2)
+    embedding_cache.set(model="embedding", text="first", embedding=[1.0])
+    embedding_cache.set(model="embedding", text="second", embedding=[2.0])
+    embedding_cache.get(model="embedding", text="first")
+    embedding_cache.set(model="embedding", text="third", embedding=[3.0])
+
+    assert embedding_cache.get(model="embedding", text="second") is None
+    assert embedding_cache.get(model="embedding", text="first") == [1.0]
+    assert embedding_cache.get(model="embedding", text="third") == [3.0]
+
+def test_shared_tier_stores_packed_float32(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that another worker is served from the shared tier"""
+    shared_cache: Mock = setup_shared_cache(mocker=mocker)
+    EmbeddingCache(cache=shared_cache).set(model="embedding", text="query", embedding=[0.5, -1.0, 2.0])
+    other_worker = EmbeddingCache(cache=shared_cache)
+
+    packed: bytes = shared_cache.set.call_args.kwargs["value"]
+
+    assert len(packed) == 3 * 4
+    assert other_worker.get(model="embedding", text="query") == [0.5, -1.0, 2.0]
+    assert other_worker.stats["shared_hits"] == 1
@@ -0,0 +1,70 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List
+import pytest_mock
+from functions import GraphIndex, GraphSearchFunction
+
+def graph() -> Dict[str, List[Dict[str, Any]]]:
+    return {
+        "nodes": [
+            {"id": "brand:contoso", "type": "Brand", "name": "Contoso"},
+            {"id": "product:cold-brew", "type": "Product", "name": "Cold Brew"},
+            {"id": "recipe:iced-latte", "type": "Recipe", "name": "Iced Latte"},
+            {"id": "guideline:logo", "type": "Guideline", "name": "Logo Usage"},
+            {"id": "Brand_Context/page_18.png", "type": "Page"},
+        ],
+        "edges": [
+            {"source": "brand:contoso", "target": "product:cold-brew", "relation": "has_product"},
+            {"source": "product:cold-brew", "target": "recipe:iced-latte", "relation": "includes_recipe"},
+            {"source": "brand:contoso", "target": "guideline:logo", "relation": "follows_guideline"},
+            {"source": "guideline:logo", "target": "Brand_Context/page_18.png", "relation": "mentioned_in"},
+        ],
+    }
+
+def test_neighborhood_is_expanded_breadth_first(tmp_path: Path) -> None:
+    """Test that expanding a node returns its neighbors, then theirs, each once with the edge that reached it"""
+    path: Path = tmp_path / "graph.json"
+    path.write_text(json.dumps(graph()))
+    graph_index: GraphIndex = GraphIndex.load(path=str(path))
+
+    expanded: List[Dict[str, Any]] = graph_index.expand(names=["contoso"], hops=2)
+
+    assert [(node["name"], node["relation"], node["hops"]) for node in expanded] == [
+        ("Cold Brew", "has_product", 1),
+        ("Logo Usage", "follows_guideline", 1),
+        ("Iced Latte", "includes_recipe", 2),
+        ("Brand_Context/page_18.png", "mentioned_in", 2),
+    ]
+    assert [node["name"] for node in graph_index.expand(names=["Contoso"], hops=2, relation="has_product")] == ["Cold Brew"]
+
+def test_page_is_found_by_its_path_and_edges_are_traversed_backwards() -> None:
+    """Test that a page given by its path under the image directory leads back to the entities mentioning it"""
+    graph_index: GraphIndex = GraphIndex.from_graph(**graph())
+
+    expanded: List[Dict[str, Any]] = graph_index.expand(names=["images/Brand_Context/page_18.png"])
+
+    assert [(node["id"], node["type"], node["source"], node["inverse"]) for node in expanded] == [
+        ("guideline:logo", "Guideline", "Brand_Context/page_18.png", True)]
+    assert GraphIndex.from_graph(directed=True, **graph()).expand(names=["Brand_Context/page_18.png"]) == []
+
+def test_graph_search_describes_the_related_entities_and_pages(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that the graph tool lists related entities and the file names of related pages"""
+    graph_search_function = GraphSearchFunction(
+        logger=mocker.Mock(), graph_index=GraphIndex.from_graph(**graph()), max_hops=2, max_results=3)
+
+    assert graph_search_function.search(entity="Logo Usage") == "\n".join([
+        "Logo Usage --mentioned_in--> file_name: Brand_Context/page_18.png",
+        "Logo Usage <--follows_guideline-- Contoso (Brand)",
+        "Contoso --has_product--> Cold Brew (Product)",
+    ])
+    assert graph_search_function.search(entity="Unknown") == "No entity or page named Unknown was found in the graph."
+
+def test_graph_search_keeps_the_direction_of_edges_walked_backwards(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that an edge reached from its target is shown with its relation pointing at that target"""
+    graph_search_function = GraphSearchFunction(
+        logger=mocker.Mock(), graph_index=GraphIndex.from_graph(**graph()), max_hops=1)
+
+    assert graph_search_function.search(entity="Cold Brew") == "\n".join([
+        "Cold Brew --includes_recipe--> Iced Latte (Recipe)",
+        "Cold Brew <--has_product-- Contoso (Brand)",
+    ])
@@ -0,0 +1,54 @@
+import base64
+import pickle
+import pytest
+from openai.types.chat.chat_completion_message import ChatCompletionMessage
+from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
+from services import HistoryCodec
+
+def conversation() -> list:
+    return [
+        {"role": "system", "content": "You are a helpful assistant"},
+        {"role": "user", "content": "What is the slogan?"},
+        ChatCompletionMessage(
+            role="assistant",
+            content="",
+            tool_calls=[ChatCompletionMessageToolCall(
+                id="call_0", type="function", function=Function(name="search", arguments="{\"search_query\": \"slogan\"}"))]),
+        {"tool_call_id": "call_0", "role": "tool", "name": "search", "content": [
+            {"type": "text", "text": "file_name: images/file_1/page_1.png"},
+            {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + "A" * 4096, "detail": "high"}}]},
+    ]
+
+@pytest.mark.parametrize("compression", ["none", "zlib", "zstd"])
+def test_conversation_round_trips_as_message_dicts(compression: str) -> None:
+    """Test that pydantic messages are stored as the dicts the chat API accepts"""
+    codec = HistoryCodec(compression=compression)
+
+    decoded: list = codec.decode(payload=codec.encode(conversation=conversation()))
+
+    assert decoded[2] == {
+        "role": "assistant",
+        "content": "",
+        "tool_calls": [{"id": "call_0", "type": "function", "function": {"name": "search", "arguments": "{\"search_query\": \"slogan\"}"}}]}
+    assert decoded[3] == conversation()[3]
+
+def test_large_conversation_is_compressed() -> None:
+    """Test that the payload is smaller than the pickled and base64 encoded conversation"""
+    payload: bytes = HistoryCodec(compression="zlib").encode(conversation=conversation())
+
+    assert len(payload) < len(base64.b64encode(pickle.dumps(conversation()))) / 4
+
+def test_legacy_pickle_is_only_read_when_allowed() -> None:
+    """Test that conversations in the former format are not unpickled by default"""
+    legacy: bytes = base64.b64encode(pickle.dumps([{"role": "user", "content": "Hello"}]))
+
+    assert HistoryCodec().decode(payload=legacy) == []
+    assert HistoryCodec(allow_legacy_pickle=True).decode(payload=legacy) == [{"role": "user", "content": "Hello"}]
+
+def test_newer_schema_version_is_rejected() -> None:
+    """Test that a conversation written by a newer schema is not misread"""
+    payload: bytes = bytearray(HistoryCodec().encode(conversation=[]))
+    payload[3] += 1
+
+    with pytest.raises(ValueError):
+        HistoryCodec().decode(payload=bytes(payload))
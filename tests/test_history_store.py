@@ -0,0 +1,87 @@
+import asyncio
+from typing import Any, Dict, List
+from services import HistoryStore
+
+class ListCache:
+    """In-memory stand-in for the Redis list commands the store uses"""
+
+    def __init__(self) -> None:
+        self.lists: Dict[str, List[bytes]] = {}
+        self.ttls: Dict[str, int] = {}
+        self.round_trips: int = 0
+
+    def lrange(self, name: str, start: int, end: int) -> List[bytes]:
+        self.round_trips += 1
+        values: List[bytes] = self.lists.get(name, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    def pipeline(self, transaction: bool = True) -> "ListPipeline":
+        return ListPipeline(cache=self)
+
+class ListPipeline:
+    def __init__(self, cache: ListCache) -> None:
+        self.__cache: ListCache = cache
+        self.__commands: List[Any] = []
+
+    def rpush(self, name: str, value: bytes) -> None:
+        self.__commands.append(lambda: self.__cache.lists.setdefault(name, []).append(value))
+
+    def ltrim(self, name: str, start: int, end: int) -> None:
+        self.__commands.append(lambda: self.__cache.lists.__setitem__(name, self.__cache.lists[name][start:]))
+
+    def expire(self, name: str, time: int) -> None:
+        self.__commands.append(lambda: self.__cache.ttls.__setitem__(name, time))
+
+    def delete(self, name: str) -> None:
+        self.__commands.append(lambda: self.__cache.lists.pop(name, None))
+
+    def execute(self) -> None:
+        self.__cache.round_trips += 1
+        for command in self.__commands:
+            command()
+
+class AsyncListCache:
+    def __init__(self, cache: ListCache) -> None:
+        self.__cache: ListCache = cache
+
+    async def lrange(self, name: str, start: int, end: int) -> List[bytes]:
+        return self.__cache.lrange(name=name, start=start, end=end)
+
+    def pipeline(self, transaction: bool = True) -> "AsyncListPipeline":
+        return AsyncListPipeline(pipeline=self.__cache.pipeline(transaction=transaction))
+
+class AsyncListPipeline:
+    def __init__(self, pipeline: ListPipeline) -> None:
+        self.__pipeline: ListPipeline = pipeline
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__pipeline, name)
+
+    async def execute(self) -> None:
+        self.__pipeline.execute()
+
+def turn(question: int) -> List[dict]:
+    return [{"role": "user", "content": f"question {question}"}, {"role": "assistant", "content": f"answer {question}"}]
+
+def test_turns_are_appended_in_one_round_trip() -> None:
+    """Test that persisting a turn appends it, refreshes the TTL and costs one round trip"""
+    cache = ListCache()
+    history_store = HistoryStore(cache=cache, ttl=60)
+
+    history_store.append(session_id="session", turn=turn(question=1))
+    history_store.append(session_id="session", turn=turn(question=2))
+
+    assert cache.round_trips == 2
+    assert cache.ttls == {"history:session": 60}
+    assert history_store.load(session_id="session") == turn(question=1) + turn(question=2)
+
+def test_only_retained_turns_are_kept_and_loaded() -> None:
+    """Test that the list is trimmed to the turns the agent keeps in its context"""
+    cache = ListCache()
+    history_store = HistoryStore(cache=cache, async_cache=AsyncListCache(cache=cache), max_turns=2)
+
+    for question in range(5):
+        asyncio.run(history_store.aappend(session_id="session", turn=turn(question=question)))
+
+    assert len(cache.lists["history:session"]) == 2
+    assert asyncio.run(history_store.aload(session_id="session")) == turn(question=3) + turn(question=4)
@@ -0,0 +1,52 @@
+import base64
+import io
+import pytest
+from agents import ImagePipeline, ImageVariant, PreparedImage
+
+# pillow is the optional images extra of the agents package
+Image = pytest.importorskip("PIL.Image")
+
+def render_page(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    Image.new(mode="RGBA", size=(width, height), color=(255, 255, 255, 255)).save(output, format="PNG")
+    return output.getvalue()
+
+def decode(prepared: PreparedImage) -> Image.Image:
+    return Image.open(io.BytesIO(base64.b64decode(prepared.url.split(",", 1)[1])))
+
+def test_large_page_is_downsized_and_recompressed() -> None:
+    """Test that a page larger than the maximum dimension is resized, re-encoded and sent in high detail"""
+    image_pipeline = ImagePipeline(variant=ImageVariant(max_dimension=1024, format="JPEG"))
+
+    prepared: PreparedImage = image_pipeline.prepare(path="file/page_1.png", data=render_page(width=2048, height=1536))
+
+    assert prepared.url.startswith("data:image/jpeg;base64,")
+    assert decode(prepared=prepared).size == (1024, 768)
+    assert prepared.to_image_url()["detail"] == "high"
+
+def test_small_page_is_sent_in_low_detail() -> None:
+    """Test that a page that fits the low detail level asks for it"""
+    image_pipeline = ImagePipeline(variant=ImageVariant(max_dimension=512))
+
+    prepared: PreparedImage = image_pipeline.prepare(path="file/page_1.png", data=render_page(width=800, height=400))
+
+    assert decode(prepared=prepared).size == (512, 256)
+    assert prepared.detail == "low"
+
+def test_data_url_is_memoized_until_the_page_changes() -> None:
+    """Test that a prepared page is reused by path and variant, and prepared again once its bytes change"""
+    image_pipeline = ImagePipeline(max_entries=1)
+    page: bytes = render_page(width=100, height=100)
+
+    first: PreparedImage = image_pipeline.prepare(path="file/page_1.png", data=page)
+    second: PreparedImage = image_pipeline.prepare(path="file/page_1.png", data=memoryview(page))
+    image_pipeline.prepare(path="file/page_1.png", data=render_page(width=100, height=50))
+
+    assert second is first
+    assert image_pipeline.stats == {"hits": 1, "misses": 2, "entries": 1}
+
+def test_undecodable_image_is_sent_unchanged() -> None:
+    """Test that an image the pipeline cannot decode is still sent"""
+    prepared: PreparedImage = ImagePipeline().prepare(path="file/page_1.png", data=b"image")
+
+    assert prepared.url == "data:image/png;base64,aW1hZ2U="
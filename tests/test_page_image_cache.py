@@ -0,0 +1,55 @@
+import os
+from pathlib import Path
+from functions import PageImageCache, PageImageEntry
+
+def test_stored_image_is_served_from_disk(tmp_path: Path) -> None:
+    """Test that a stored image is linked to its local path and served without a request"""
+    page_image_cache = PageImageCache(directory=str(object=tmp_path))
+    local_path: str = str(object=tmp_path / "file" / "page_1.png")
+
+    page_image_cache.store(blob_name="file/page_1.png", local_path=local_path, data=b"image", etag="etag-1")
+    os.remove(local_path)
+    entry: PageImageEntry | None = page_image_cache.lookup(blob_name="file/page_1.png", local_path=local_path)
+
+    assert entry is not None
+    assert Path(local_path).read_bytes() == b"image"
+    assert page_image_cache.stats["hits"] == 1
+    assert page_image_cache.stats["bytes_saved"] == len(b"image")
+    assert not [name for _, _, files in os.walk(tmp_path) for name in files if name.startswith(".")]
+
+def test_stale_image_is_revalidated_by_etag(tmp_path: Path) -> None:
+    """Test that an expired entry asks for a conditional request instead of a download"""
+    page_image_cache = PageImageCache(directory=str(object=tmp_path), max_age=0)
+    local_path: str = str(object=tmp_path / "file" / "page_1.png")
+    page_image_cache.store(blob_name="file/page_1.png", local_path=local_path, data=b"image", etag="etag-1")
+
+    assert page_image_cache.lookup(blob_name="file/page_1.png", local_path=local_path) is None
+    assert page_image_cache.etag(blob_name="file/page_1.png") == "etag-1"
+    assert page_image_cache.revalidate(blob_name="file/page_1.png", local_path=local_path) is not None
+    assert page_image_cache.stats["revalidations"] == 1
+
+def test_identical_pages_are_stored_once(tmp_path: Path) -> None:
+    """Test that the cache is content addressed"""
+    page_image_cache = PageImageCache(directory=str(object=tmp_path))
+
+    first: PageImageEntry = page_image_cache.store(
+        blob_name="a/page_1.png", local_path=str(object=tmp_path / "a" / "page_1.png"), data=b"image", etag=None)
+    second: PageImageEntry = page_image_cache.store(
+        blob_name="b/page_1.png", local_path=str(object=tmp_path / "b" / "page_1.png"), data=b"image", etag=None)
+
+    assert first.digest == second.digest
+    assert page_image_cache.stats["bytes"] == len(b"image")
+
+def test_least_recently_used_image_is_evicted(tmp_path: Path) -> None:
+    """Test that the cache stays within its byte budget"""
+    page_image_cache = PageImageCache(directory=str(object=tmp_path), max_bytes=10)
+    first_path: str = str(object=tmp_path / "file" / "page_1.png")
+    second_path: str = str(object=tmp_path / "file" / "page_2.png")
+
+    page_image_cache.store(blob_name="file/page_1.png", local_path=first_path, data=b"first", etag=None)
+    page_image_cache.store(blob_name="file/page_2.png", local_path=second_path, data=b"second page", etag=None)
+
+    assert not os.path.exists(first_path)
+    assert page_image_cache.etag(blob_name="file/page_1.png") is None
+    assert Path(second_path).read_bytes() == b"second page"
+    assert page_image_cache.stats["evictions"] == 1
@@ -0,0 +1,101 @@
+import asyncio
+from typing import Any, Dict, List
+import pytest
+import pytest_mock
+from unittest.mock import Mock
+import httpx
+import openai
+from services import AdaptiveConcurrencyLimit, RateLimiter, TokenBucket, is_retryable_openai_error
+
+class StatusError(Exception):
+    def __init__(self, status_code: int, headers: Dict[str, str] | None = None) -> None:
+        super().__init__(f"status {status_code}")
+        self.status_code: int = status_code
+        self.response: Any = type("Response", (), {"headers": headers or {}})()
+
+def failing(errors: List[Exception], result: Any) -> Mock:
+    """A request that raises `errors` in turn, then returns `result`"""
+    return Mock(side_effect=errors + [result])
+
+def test_token_bucket_waits_for_the_budget_to_refill() -> None:
+    """Test that requests and tokens are taken until the minute budget is spent"""
+    bucket = TokenBucket(requests=2, tokens=100, updated_at=0.0)
+
+    assert bucket.take(now=0.0, requests_per_minute=2, tokens_per_minute=100, tokens=40) == 0.0
+    assert bucket.take(now=0.0, requests_per_minute=2, tokens_per_minute=100, tokens=80) == pytest.approx(12.0)
+    assert bucket.take(now=12.0, requests_per_minute=2, tokens_per_minute=100, tokens=80) == 0.0
+    assert bucket.take(now=12.0, requests_per_minute=2, tokens_per_minute=100, tokens=0) == pytest.approx(18.0)
+
+def test_concurrency_limit_halves_once_per_burst() -> None:
+    """Test that a burst of 429s halves the limit once and that successes raise it again"""
+    concurrency = AdaptiveConcurrencyLimit(maximum=8)
+    started_at: List[float] = [concurrency.acquire() for _ in range(3)]
+    for started in started_at:
+        concurrency.release(started_at=started, rate_limited=True)
+
+    assert concurrency.limit == 4
+    for _ in range(5):
+        concurrency.release(started_at=concurrency.acquire())
+    assert concurrency.limit == 5
+    assert concurrency.in_flight == 0
+
+def test_rate_limited_calls_are_retried_after_the_requested_delay() -> None:
+    """Test that a 429 is retried after its retry-after and pauses the deployment"""
+    rate_limiter = RateLimiter(max_concurrency=4, logger=Mock())
+    request: Mock = failing(errors=[StatusError(status_code=429, headers={"retry-after-ms": "10"})], result="answer")
+
+    assert rate_limiter.call(deployment="gpt-4o", request=request, tokens=10) == "answer"
+    assert request.call_count == 2
+    assert rate_limiter.stats["retries"] == 1
+    assert rate_limiter.stats["rate_limited"] == 1
+    assert rate_limiter.stats["concurrency"]["gpt-4o"] == 2
+
+def test_other_errors_are_raised() -> None:
+    """Test that errors that are not retryable, and the last retryable one, reach the caller"""
+    rate_limiter = RateLimiter(max_retries=1, base_delay=0.001, logger=Mock())
+
+    with pytest.raises(StatusError):
+        rate_limiter.call(deployment="gpt-4o", request=failing(errors=[StatusError(status_code=400)], result=None))
+    request: Mock = failing(errors=[StatusError(status_code=503), StatusError(status_code=503)], result=None)
+    with pytest.raises(StatusError):
+        rate_limiter.call(deployment="gpt-4o", request=request)
+    assert request.call_count == 2
+
+def test_openai_connection_errors_are_retryable() -> None:
+    """Test that the errors the OpenAI client retries itself, connection errors included, are retried"""
+    assert is_retryable_openai_error(error=openai.APIConnectionError(request=httpx.Request("POST", "https://openai")))
+    assert is_retryable_openai_error(error=StatusError(status_code=429))
+    assert not is_retryable_openai_error(error=StatusError(status_code=400))
+    assert not is_retryable_openai_error(error=ConnectionError())
+
+def test_budgets_are_shared_through_redis(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that the budget is taken by the script and that a 429 pauses every worker"""
+    script: Mock = mocker.Mock(side_effect=["0.01", "0", "0"])
+    cache: Mock = mocker.Mock(register_script=mocker.Mock(return_value=script))
+    rate_limiter = RateLimiter(
+        requests_per_minute={"embedding": 600}, tokens_per_minute={"embedding": 1000}, cache=cache, logger=mocker.Mock())
+    request: Mock = failing(errors=[StatusError(status_code=429, headers={"retry-after": "0.01"})], result="embedding")
+
+    assert rate_limiter.call(deployment="embedding", request=request, tokens=20) == "embedding"
+    script.assert_called_with(keys=["rate_limit:{embedding}", "rate_limit:{embedding}:pause"], args=(600, 1000, 20))
+    assert script.call_count == 3
+    cache.set.assert_called_once_with(name="rate_limit:{embedding}:pause", value=1, px=10)
+    assert rate_limiter.stats["throttled_seconds"] == pytest.approx(0.01)
+
+def test_asynchronous_calls_are_retried() -> None:
+    """Test that acall waits without blocking the event loop and retries a throttled call"""
+    rate_limiter = RateLimiter(base_delay=0.001, logger=Mock())
+    calls: List[str] = []
+
+    async def request() -> str:
+        calls.append("call")
+        if len(calls) == 1:
+            raise StatusError(status_code=429)
+        return "answer"
+
+    async def call_concurrently() -> List[str]:
+        return await asyncio.gather(
+            rate_limiter.acall(deployment="gpt-4o", request=request), asyncio.sleep(0, result="other"))
+
+    assert asyncio.run(call_concurrently()) == ["answer", "other"]
+    assert calls == ["call", "call"]
@@ -0,0 +1,58 @@
+import pytest
+import pytest_mock
+from models import Settings
+from utils import ResourceRegistry
+
+@pytest.fixture
+def settings() -> Settings:
+    return Settings(
+        AZURE_OPENAI_ENDPOINT="https://openai.example.com",
+        AZURE_OPENAI_API_KEY="key",
+        AZURE_OPENAI_EMB_DEPLOYMENT="embedding",
+        AZURE_OPENAI_CHAT_DEPLOYMENT="chat",
+        AZURE_OPENAI_API_VERSION="2024-02-01",
+        AZURE_SEARCH_ENDPOINT="https://search.example.com",
+        AZURE_SEARCH_KEY="key",
+        AZURE_SEARCH_INDEX_NAME="index",
+        AZURE_AI_VISION_API_KEY="key",
+        AZURE_AI_VISION_ENDPOINT="https://vision.example.com",
+        SMART_AGENT_PROMPT_LOCATION="prompt.yaml",
+        IMAGE_PATH="images",
+        AZURE_REDIS_ENDPOINT="localhost",
+        AZURE_REDIS_KEY="key",
+        AZURE_STORAGE_ACCOUNT_KEY="a2V5",
+        AZURE_STORAGE_ACCOUNT_NAME="account",
+        AZURE_CONTAINER_NAME="container",
+    )  # type: ignore
+
+def test_clients_are_shared(settings: Settings) -> None:
+    """Test that every call hands out the same pooled clients"""
+    resources = ResourceRegistry(settings=settings)
+
+    assert resources.openai_client() is resources.openai_client()
+    assert resources.search_client() is resources.search_client()
+    assert resources.redis_client().connection_pool is resources.redis_client().connection_pool
+    assert resources.container_client().container_name == settings.azure_container_name
+
+    resources.close()
+
+def test_closed_registry_refuses_new_resources(settings: Settings) -> None:
+    """Test that a closed registry does not silently reopen connections"""
+    resources = ResourceRegistry(settings=settings)
+    resources.openai_client()
+    resources.close()
+
+    with pytest.raises(RuntimeError):
+        resources.openai_client()
+
+def test_instance_is_per_process(settings: Settings, mocker: pytest_mock.MockerFixture) -> None:
+    """Test that the worker registry is reused until the process changes"""
+    ResourceRegistry.close_instance()
+    instance: ResourceRegistry = ResourceRegistry.get_instance(settings=settings)
+
+    assert ResourceRegistry.get_instance(settings=settings) is instance
+
+    mocker.patch("os.getpid", return_value=-1)
+    assert ResourceRegistry.get_instance(settings=settings) is not instance
+
+    ResourceRegistry.close_instance()
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from typing import Any, Dict, List
+import pytest_mock
+from functions import GraphIndex, RetrievalOrchestrator, reciprocal_rank_fusion
+
+def graph_index() -> GraphIndex:
+    return GraphIndex.from_graph(
+        nodes=[
+            {"id": "product:cold-brew", "type": "Product", "name": "Cold Brew"},
+            {"id": "guideline:logo", "type": "Guideline", "name": "Logo Usage"},
+            {"id": "Brand_Context/page_1.png", "type": "Page"},
+            {"id": "Brand_Context/page_2.png", "type": "Page"},
+        ],
+        edges=[
+            {"source": "product:cold-brew", "target": "Brand_Context/page_1.png", "relation": "mentioned_in"},
+            {"source": "product:cold-brew", "target": "Brand_Context/page_2.png", "relation": "mentioned_in"},
+            {"source": "guideline:logo", "target": "Brand_Context/page_2.png", "relation": "mentioned_in"},
+        ])
+
+def vector_result(page: int) -> Dict[str, Any]:
+    return {'id': None, 'image_path': f"Brand_Context/page_{page}.png", 'related_content': f"page {page}",
+            'image_bytes': f"image {page}".encode()}
+
+def test_rankings_are_fused_by_reciprocal_rank() -> None:
+    """Test that an item ranked by both rankings comes before items ranked by one"""
+    assert reciprocal_rank_fusion(rankings=[["a", "b", "c"], ["c", "d"]]) == ["c", "a", "b", "d"]
+    assert reciprocal_rank_fusion(rankings=[["a", "b"], ["b", "a"]]) == ["a", "b"]
+
+def test_graph_pages_are_merged_with_the_vector_results(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that pages found by both legs are returned once and ahead, with the description of the vector search"""
+    search_vector_function = mocker.Mock()
+    search_vector_function.search.return_value = [vector_result(page=3), vector_result(page=2)]
+    search_vector_function.page_images.side_effect = lambda page_image_names: {
+        page_image_name: b"graph image" for page_image_name in page_image_names}
+    orchestrator = RetrievalOrchestrator(
+        logger=mocker.Mock(), search_vector_function=search_vector_function, graph_index=graph_index())
+
+    output: List[Dict[str, Any]] = orchestrator.search(search_query="How is cold brew served?")
+
+    assert [item['image_path'] for item in output] == [
+        "Brand_Context/page_2.png", "Brand_Context/page_3.png", "Brand_Context/page_1.png"]
+    assert output[0]['related_content'] == "page 2"
+    assert output[2]['related_content'] == "Cold Brew (mentioned_in)"
+    assert bytes(output[2]['image_bytes']) == b"graph image"
+    search_vector_function.page_images.assert_called_once_with(
+        page_image_names=["Brand_Context/page_1.png", "Brand_Context/page_2.png"])
+
+def test_graph_leg_runs_while_the_vector_search_runs(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that the pages of the graph are downloaded while the vector search is still waiting"""
+    downloading = threading.Event()
+    search_vector_function = mocker.Mock()
+    search_vector_function.search.side_effect = lambda search_query: [vector_result(page=3)] if downloading.wait(timeout=5) else []
+    search_vector_function.page_images.side_effect = lambda page_image_names: downloading.set() or {}
+    orchestrator = RetrievalOrchestrator(
+        logger=mocker.Mock(), search_vector_function=search_vector_function, graph_index=graph_index())
+
+    output: List[Dict[str, Any]] = orchestrator.search(search_query="logo usage")
+
+    # the graph page could not be downloaded, so only the vector result is left
+    assert [item['image_path'] for item in output] == ["Brand_Context/page_3.png"]
+
+def test_a_page_is_returned_for_the_first_query_only(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that several queries do not return the same page twice"""
+    search_vector_function = mocker.Mock()
+    search_vector_function.asearch_many = mocker.AsyncMock(return_value=[[vector_result(page=1)], [vector_result(page=1)]])
+    search_vector_function.apage_images = mocker.AsyncMock(side_effect=lambda page_image_names: {
+        page_image_name: b"graph image" for page_image_name in page_image_names})
+    orchestrator = RetrievalOrchestrator(
+        logger=mocker.Mock(), search_vector_function=search_vector_function, graph_index=graph_index())
+
+    outputs: List[list] = asyncio.run(orchestrator.asearch_many(queries=["What is new?", "Logo usage"]))
+
+    assert [[item['image_path'] for item in output] for output in outputs] == [
+        ["Brand_Context/page_1.png"], ["Brand_Context/page_2.png"]]
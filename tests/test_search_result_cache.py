@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+import pytest_mock
+from unittest.mock import Mock
+from functions import SearchResultCache
+
+RESULT: Dict[str, Any] = {
+    "topic": "topic", "file_name": "file", "page_number": 1, "related_content": "content", "@search.score": 0.5}
+
+def setup_shared_cache(mocker: pytest_mock.MockerFixture) -> Mock:
+    store: Dict[str, bytes] = {}
+    return mocker.Mock(
+        get=mocker.Mock(side_effect=lambda name: store.get(name)),
+        set=mocker.Mock(side_effect=lambda name, value, ex=None: store.__setitem__(name, value)),
+    )
+
+def test_cached_results_hold_the_selected_fields(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that a query searched once is served from the cache, with only the selected fields"""
+    search_result_cache = SearchResultCache(cache=setup_shared_cache(mocker=mocker))
+    search: Mock = mocker.Mock(return_value=[RESULT])
+
+    search_result_cache.get_or_search(index_name="index", query="Brand  colors", k=3, search=search)
+    results: List[Dict[str, Any]] = search_result_cache.get_or_search(
+        index_name="index", query="brand colors", k=3, search=search)
+
+    search.assert_called_once()
+    assert results == [{"topic": "topic", "file_name": "file", "page_number": 1, "related_content": "content"}]
+    assert search_result_cache.get(index_name="index", query="brand colors", k=5) is None
+
+def test_concurrent_misses_search_once(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that concurrent misses for the same query wait for a single search"""
+    search_result_cache = SearchResultCache(cache=setup_shared_cache(mocker=mocker))
+    searching: threading.Event = threading.Event()
+    release: threading.Event = threading.Event()
+
+    def search() -> List[Dict[str, Any]]:
+        searching.set()
+        release.wait(timeout=5)
+        return [RESULT]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(
+            search_result_cache.get_or_search, index_name="index", query="query", k=3, search=search)
+        searching.wait(timeout=5)
+        follower = executor.submit(
+            search_result_cache.get_or_search, index_name="index", query="query", k=3, search=search)
+        while search_result_cache.stats["shared_searches"] == 0:
+            pass
+        release.set()
+
+    assert leader.result() == follower.result()
+    assert search_result_cache.stats["shared_searches"] == 1
+
+def test_invalidated_index_is_searched_again(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that results cached before an invalidation are not returned, also by other workers"""
+    shared_cache: Mock = setup_shared_cache(mocker=mocker)
+    search_result_cache = SearchResultCache(cache=shared_cache)
+    other_worker = SearchResultCache(cache=shared_cache, generation_refresh_interval=0)
+    search_result_cache.get_or_search(index_name="index", query="query", k=3, search=lambda: [RESULT])
+
+    search_result_cache.invalidate(index_name="index")
+
+    assert search_result_cache.get(index_name="index", query="query", k=3) is None
+    assert other_worker.get(index_name="index", query="query", k=3) is None
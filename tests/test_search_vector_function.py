@@ -1,3 +1,6 @@
+import os
+import threading
+from pathlib import Path
 from unittest.mock import Mock, MagicMock
 import pytest_mock
 from typing import Any, List, Union
@@ -5,12 +8,14 @@ from openai import AzureOpenAI
 from openai.types.create_embedding_response import CreateEmbeddingResponse, Usage
 from openai.types.embedding import Embedding
 from azure.search.documents import (SearchItemPaged, SearchClient)
-from functions import SearchVectorFunction
+from azure.storage.blob import ContainerClient
+from functions import SearchVectorFunction, SearchResultCache
 
 def setup(mocker: pytest_mock.MockerFixture,
           input: Union[str, List[str], List[int], List[List[int]]],
           image_directory: str,
-          documents: list[dict[str, Any]]) -> SearchVectorFunction:
+          documents: list[dict[str, Any]],
+          **kwargs: Any) -> SearchVectorFunction:
     mockAzureOpenAI: Mock | Mock = mocker.Mock(target=AzureOpenAI, embeddings=mocker.Mock(create=mocker.Mock()))
     mockSearchClient: Mock | Mock = mocker.Mock(target=SearchClient, search=mocker.Mock(search=mocker.Mock()))
     mock_search_item_paged = MagicMock(spec=SearchItemPaged)
@@ -35,18 +40,22 @@ def setup(mocker: pytest_mock.MockerFixture,
     )
 
     mockSearchClient.search.return_value = mock_search_item_paged
+    mockContainerClient: Mock = mocker.Mock(target=ContainerClient)
+    mockContainerClient.get_blob_client.return_value.download_blob.return_value.readall.return_value = b"image"
 
     return SearchVectorFunction(
         logger=mocker.Mock(),
         search_client=mockSearchClient,
         client=mockAzureOpenAI,
         model="gpt-4",
-        image_directory=image_directory
+        image_directory=image_directory,
+        container_client=mockContainerClient,
+        **kwargs
     )
 
-def test_valid_search_return(mocker: pytest_mock.MockerFixture,):
+def test_valid_search_return(mocker: pytest_mock.MockerFixture, tmp_path: Path):
     """Test for a valid search return"""
-    image_directory: str = "images"
+    image_directory: str = str(object=tmp_path)
     file_name: str = "page_1.png"
     related_content: str = "Hello World"
     page_number: int = 1
@@ -71,12 +80,12 @@ def test_valid_search_return(mocker: pytest_mock.MockerFixture,):
     search_vector_response: list[Any] = search_vector_function.search(search_query="search query")
 
     for t in search_vector_response:
-        assert t['image_path'] == f"{image_directory}/{file_name}/page_{page_number}.png"
+        assert t['image_path'] == f"{file_name}/page_{page_number}.png"
         assert t['related_content'] == related_content
 
-def test_muliple_document_return(mocker: pytest_mock.MockerFixture):
+def test_muliple_document_return(mocker: pytest_mock.MockerFixture, tmp_path: Path):
     """Test for multiple document return"""
-    image_directory: str = "images"
+    image_directory: str = str(object=tmp_path)
     documents:list[dict[str, Any]] = [
         {
             'id': '1',
@@ -109,5 +118,181 @@ def test_muliple_document_return(mocker: pytest_mock.MockerFixture):
         file_name= document["file_name"]
         page_number= document["page_number"]
 
-        assert search_document['image_path'] == f"{image_directory}/{file_name}/page_{page_number}.png"
-        assert search_document['related_content'] == document["related_content"]
\ No newline at end of file
+        assert search_document['image_path'] == f"{file_name}/page_{page_number}.png"
+        assert search_document['related_content'] == document["related_content"]
+
+def test_search_many_deduplicates_pages(mocker: pytest_mock.MockerFixture, tmp_path: Path):
+    """Test that a batched search embeds once and returns and downloads each page once"""
+    documents:list[dict[str, Any]] = [
+        {
+            'id': '1',
+            'topic': 'test',
+            'related_content': "Hello World",
+            'page_number': 1,
+            'file_name': "file_1"
+        }
+    ]
+    queries: list[str] = ["first query", "second query"]
+
+    search_vector_function: SearchVectorFunction = setup(
+        mocker=mocker,
+        input=queries,
+        image_directory=str(object=tmp_path),
+        documents=documents
+    )
+    search_client: Mock = search_vector_function._SearchVectorFunction__retriever._AzureSearchRetriever__search_client
+    search_client.search.side_effect = lambda **kwargs: iter(documents)
+    client: Mock = search_vector_function._SearchVectorFunction__client
+
+    search_vector_response: list[list[Any]] = search_vector_function.search_many(queries=queries)
+
+    client.embeddings.create.assert_called_once()
+    assert client.embeddings.create.call_args.kwargs["input"] == queries
+    assert search_client.search.call_count == 2
+    assert [[t['image_path'] for t in response] for response in search_vector_response] == [["file_1/page_1.png"], []]
+    assert (tmp_path / "file_1" / "page_1.png").read_bytes() == b"image"
+
+def test_search_downloads_pages_concurrently(mocker: pytest_mock.MockerFixture, tmp_path: Path):
+    """Test that the page images of one search are downloaded concurrently"""
+    documents:list[dict[str, Any]] = [
+        {
+            'id': str(page_number),
+            'topic': 'test',
+            'related_content': "Hello World",
+            'page_number': page_number,
+            'file_name': "file_1"
+        } for page_number in [1, 2]
+    ]
+
+    search_vector_function: SearchVectorFunction = setup(
+        mocker=mocker,
+        input="search query",
+        image_directory=str(object=tmp_path),
+        documents=documents
+    )
+    # each download only completes once both have started
+    barrier = threading.Barrier(parties=2, timeout=5)
+
+    def readall() -> bytes:
+        barrier.wait()
+        return b"image"
+
+    container_client: Mock = search_vector_function._SearchVectorFunction__container_client
+    container_client.get_blob_client.return_value.download_blob.return_value.readall.side_effect = readall
+
+    search_vector_response: list[Any] = search_vector_function.search(search_query="search query")
+
+    assert [t['image_path'] for t in search_vector_response] == ["file_1/page_1.png", "file_1/page_2.png"]
+    assert (tmp_path / "file_1" / "page_2.png").read_bytes() == b"image"
+
+def test_search_returns_image_bytes_without_persisting(mocker: pytest_mock.MockerFixture, tmp_path: Path):
+    """Test that the page image bytes can be handed over without writing them to the image directory"""
+    documents:list[dict[str, Any]] = [
+        {
+            'id': '1',
+            'topic': 'test',
+            'related_content': "Hello World",
+            'page_number': 1,
+            'file_name': "file_1"
+        }
+    ]
+
+    search_vector_function: SearchVectorFunction = setup(
+        mocker=mocker,
+        input="search query",
+        image_directory=str(object=tmp_path),
+        documents=documents,
+        return_image_bytes=True,
+        persist_images=False
+    )
+
+    search_vector_response: list[Any] = search_vector_function.search(search_query="search query")
+
+    assert search_vector_response[0]['image_path'] == "file_1/page_1.png"
+    assert bytes(search_vector_response[0]['image_bytes']) == b"image"
+    assert not (tmp_path / "file_1").exists()
+
+def test_search_results_are_served_from_the_result_cache(mocker: pytest_mock.MockerFixture, tmp_path: Path):
+    """Test that a repeated query neither embeds nor searches again, but still returns the page images"""
+    store: dict = {}
+    search_result_cache = SearchResultCache(cache=mocker.Mock(
+        get=mocker.Mock(side_effect=lambda name: store.get(name)),
+        set=mocker.Mock(side_effect=lambda name, value, ex=None: store.__setitem__(name, value))))
+    documents: list[dict[str, Any]] = [
+        {'topic': 'test', 'related_content': 'Hello World', 'page_number': 1, 'file_name': 'file'}]
+    search_vector_function: SearchVectorFunction = setup(
+        mocker=mocker,
+        input="search query",
+        image_directory=str(object=tmp_path),
+        documents=documents,
+        search_result_cache=search_result_cache,
+        return_image_bytes=True,
+        persist_images=False,
+    )
+
+    first: list[Any] = search_vector_function.search(search_query="search query")
+    second: list[Any] = search_vector_function.search_many(queries=["Search  query"])[0]
+
+    assert [(item['image_path'], bytes(item['image_bytes'])) for item in second] == [("file/page_1.png", b"image")]
+    assert [item['related_content'] for item in first] == [item['related_content'] for item in second]
+    assert search_result_cache.stats["hits"] == 1
+
+def test_search_many_reads_the_result_cache_once_per_query(mocker: pytest_mock.MockerFixture, tmp_path: Path):
+    """Test that the queries a batched search missed in the result cache are searched without reading it again"""
+    store: dict = {}
+    shared_cache: Mock = mocker.Mock(
+        get=mocker.Mock(side_effect=lambda name: store.get(name)),
+        set=mocker.Mock(side_effect=lambda name, value, ex=None: store.__setitem__(name, value)))
+    search_result_cache = SearchResultCache(cache=shared_cache)
+    documents: list[dict[str, Any]] = [
+        {'topic': 'test', 'related_content': 'Hello World', 'page_number': 1, 'file_name': 'file'}]
+    queries: list[str] = ["first query", "second query"]
+    search_vector_function: SearchVectorFunction = setup(
+        mocker=mocker,
+        input=queries,
+        image_directory=str(object=tmp_path),
+        documents=documents,
+        search_result_cache=search_result_cache,
+    )
+    search_client: Mock = search_vector_function._SearchVectorFunction__retriever._AzureSearchRetriever__search_client
+    search_client.search.side_effect = lambda **kwargs: iter(documents)
+
+    search_vector_function.search_many(queries=queries)
+
+    result_reads: list[str] = [
+        call.kwargs["name"] for call in shared_cache.get.call_args_list if not call.kwargs["name"].endswith(":generation")]
+    assert len(result_reads) == 2
+    assert search_client.search.call_count == 2
+    assert search_result_cache.stats["misses"] == 2
+    assert len(store) == 2
+
+def test_page_directories_are_created_by_the_downloads(mocker: pytest_mock.MockerFixture, tmp_path: Path):
+    """Test that the directory of a page is created once, by its download, and not for every result"""
+    documents:list[dict[str, Any]] = [
+        {
+            'id': '1',
+            'topic': 'test',
+            'related_content': "Hello World",
+            'page_number': 1,
+            'file_name': "file_1"
+        }
+    ]
+    queries: list[str] = ["first query", "second query"]
+
+    search_vector_function: SearchVectorFunction = setup(
+        mocker=mocker,
+        input=queries,
+        image_directory=str(object=tmp_path),
+        documents=documents
+    )
+    search_client: Mock = search_vector_function._SearchVectorFunction__retriever._AzureSearchRetriever__search_client
+    search_client.search.side_effect = lambda **kwargs: iter(documents)
+    threads: list[int] = []
+    makedirs = os.makedirs
+    mocker.patch(
+        "os.makedirs", side_effect=lambda *args, **kwargs: threads.append(threading.get_ident()) or makedirs(*args, **kwargs))
+
+    search_vector_function.search_many(queries=queries)
+
+    assert len(threads) == 1 and threads[0] != threading.get_ident()
+    assert (tmp_path / "file_1" / "page_1.png").read_bytes() == b"image"
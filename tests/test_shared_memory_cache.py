@@ -0,0 +1,98 @@
+import asyncio
+import os
+import threading
+import time
+from typing import List
+import pytest
+from distributedcache import SharedMemoryCache, TieredCache
+
+def test_workers_see_each_others_values(tmp_path) -> None:
+    """Test that two mappings of the same file share their values"""
+    path: str = os.path.join(tmp_path, "cache")
+    worker = SharedMemoryCache(path=path, size=1 << 20, max_entries=64)
+    other_worker = SharedMemoryCache(path=path, size=1 << 20, max_entries=64)
+
+    worker.set_many(mapping={"page:a": b"image a", "embedding:b": b"\x00\x01"})
+
+    assert other_worker.get(name="page:a") == b"image a"
+    assert other_worker.get_many(names=["embedding:b", "page:c"]) == [b"\x00\x01", None]
+    assert other_worker.delete("page:a") == 1
+    assert worker.get(name="page:a") is None
+    worker.close()
+    other_worker.close()
+
+def test_files_in_use_are_never_reinitialized(tmp_path) -> None:
+    """Test that a worker with another layout maps its own file and that an unknown file is refused"""
+    path: str = os.path.join(tmp_path, "cache")
+    worker = SharedMemoryCache(path=path, size=1 << 20, max_entries=64)
+    worker.set(name="page:a", value=b"image a")
+    other_layout = SharedMemoryCache(path=path, size=1 << 20, max_entries=128)
+
+    assert other_layout.get(name="page:a") is None
+    assert worker.get(name="page:a") == b"image a"
+    with open(f"{path}.{1 << 20}.64", "r+b") as cache_file:
+        cache_file.write(b"XXXX")
+    with pytest.raises(ValueError):
+        SharedMemoryCache(path=path, size=1 << 20, max_entries=64)
+    worker.close()
+    other_layout.close()
+
+def test_oldest_values_are_overwritten(tmp_path) -> None:
+    """Test that the ring evicts in insertion order and that expired values are not served"""
+    memory_cache = SharedMemoryCache(path=os.path.join(tmp_path, "cache"), size=4096, max_entries=16)
+    for index in range(8):
+        memory_cache.set(name=f"page:{index}", value=bytes([index]) * 1000)
+
+    assert memory_cache.get(name="page:0") is None
+    assert memory_cache.get(name="page:7") == bytes([7]) * 1000
+    assert memory_cache.set(name="page:large", value=b"x" * 8192) is False
+
+    memory_cache.set(name="page:expired", value=b"x", ex=0.01)
+    time.sleep(0.02)
+    assert memory_cache.get(name="page:expired") is None
+    memory_cache.close()
+
+def test_tiered_cache_is_filled_from_the_host_tier(tmp_path) -> None:
+    """Test that a value one worker process stored is served to another by the host tier"""
+    path: str = os.path.join(tmp_path, "cache")
+    TieredCache(host=SharedMemoryCache(path=path, size=1 << 20, max_entries=64)).set(name="embedding:a", value=b"a")
+    other_worker = TieredCache(host=SharedMemoryCache(path=path, size=1 << 20, max_entries=64))
+
+    assert other_worker.get(name="embedding:a") == b"a"
+    assert other_worker.get(name="embedding:a") == b"a"
+    assert other_worker.stats["embedding"]["host_hits"] == 1
+    assert other_worker.stats["embedding"]["local_hits"] == 1
+
+class ThreadRecordingCache(SharedMemoryCache):
+    """Host tier that records the threads it is read and written from"""
+    threads: List[int] = []
+
+    def get_many(self, names):
+        self.threads.append(threading.get_ident())
+        return super().get_many(names=names)
+
+    def set_many(self, mapping, ex=None):
+        self.threads.append(threading.get_ident())
+        return super().set_many(mapping=mapping, ex=ex)
+
+    def delete(self, *names):
+        self.threads.append(threading.get_ident())
+        return super().delete(*names)
+
+def test_asynchronous_calls_reach_the_host_tier_off_the_event_loop(tmp_path) -> None:
+    """Test that the file locks of the host tier are not taken on the thread of the event loop"""
+    path: str = os.path.join(tmp_path, "cache")
+    ThreadRecordingCache.threads = []
+
+    async def use_cache() -> List[bytes | None]:
+        TieredCache(host=ThreadRecordingCache(path=path, size=1 << 20, max_entries=64)).set(name="page:a", value=b"a")
+        other_worker = TieredCache(host=ThreadRecordingCache(path=path, size=1 << 20, max_entries=64))
+        ThreadRecordingCache.threads = []
+        await other_worker.aset(name="page:b", value=b"b")
+        values: List[bytes | None] = [await other_worker.aget(name="page:a"), await other_worker.aget(name="page:a")]
+        await other_worker.adelete("page:b")
+        return values
+
+    assert asyncio.run(use_cache()) == [b"a", b"a"]
+    assert len(ThreadRecordingCache.threads) == 3
+    assert threading.get_ident() not in ThreadRecordingCache.threads
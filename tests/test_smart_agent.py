@@ -1,4 +1,9 @@
-from typing import List
+import base64
+import hashlib
+import json
+import threading
+import asyncio
+from typing import Any, List
 import pytest_mock
 from typing_extensions import Literal
 from datetime import datetime
@@ -7,7 +12,9 @@ from openai import AzureOpenAI
 from openai.types.chat.chat_completion import ChatCompletion, Choice
 from openai.types.chat.chat_completion_message import ChatCompletionMessage
 from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function
-from agents import Smart_Agent
+from openai.types.chat.chat_completion_chunk import ChatCompletionChunk, Choice as ChunkChoice, ChoiceDelta, ChoiceDeltaToolCall, ChoiceDeltaToolCallFunction
+from agents import ContextBuilder, ImagePipeline, Smart_Agent, SemanticAnswerCache
+from functions import GraphIndex, GraphSearchFunction, RetrievalOrchestrator
 from agent import AgentResponse
 
 def setup_mock_azure_openai_with_side_effects(
@@ -77,7 +84,7 @@ def setup(
         agent_configuration= mocker.Mock(tools=[]),
         search_vector_function= mocker.Mock(search=mocker.Mock(return_value=[])),
         fs= mocker.Mock(),
-        history= mocker.Mock()
+        init_history= []
     )
 
 def test_for_valid_response(mocker: pytest_mock.MockerFixture) -> None:
@@ -182,4 +189,494 @@ def test_for_tool_calls(mocker: pytest_mock.MockerFixture) -> None:
     smart_agent_response: AgentResponse = smart_agent.run(user_input="Hello World")
 
     assert smart_agent_response.response == chat_completion_response
-    assert tool_message in smart_agent_response.conversation
\ No newline at end of file
+    assert tool_message in smart_agent_response.conversation
+
+def test_for_valid_async_response(mocker: pytest_mock.MockerFixture) -> None:
+    """Test for a valid response from the asynchronous agent loop"""
+    chat_completion_response: str = "Assistant Response"
+    mockAzureOpenAI = setup_mock_azure_openai(mocker=mocker, chat_completion_response=chat_completion_response)
+    mockAsyncAzureOpenAI: Mock = mocker.Mock(
+        chat=mocker.Mock(completions=mocker.Mock(create=mocker.AsyncMock(
+            return_value=mockAzureOpenAI.chat.completions.create.return_value))))
+    smart_agent = Smart_Agent(
+        logger=mocker.Mock(),
+        client=mockAzureOpenAI,
+        async_client=mockAsyncAzureOpenAI,
+        agent_configuration=mocker.Mock(tools=[]),
+        search_vector_function=mocker.Mock(),
+        fs=mocker.Mock(),
+        init_history=[]
+    )
+
+    smart_agent_response: AgentResponse = asyncio.run(smart_agent.arun(user_input="Hello World"))
+
+    assert smart_agent_response.response == chat_completion_response
+    mockAsyncAzureOpenAI.chat.completions.create.assert_awaited_once()
+    mockAzureOpenAI.chat.completions.create.assert_not_called()
+
+def test_for_concurrent_tool_calls(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that tool calls of one message run concurrently, keep their order and fail independently"""
+    chat_completion_response: str = "Assistant Response"
+    chat_completion_tools: List[ChatCompletionMessageToolCall] = [
+        ChatCompletionMessageToolCall(
+            id=f"call_{index}",
+            type="function",
+            function=Function(name="search", arguments=json.dumps({"search_query": search_query}))
+        ) for index, search_query in enumerate(["slow", "failing", "fast"])
+    ]
+    final_completion = setup_mock_azure_openai(
+        mocker=mocker, chat_completion_response=chat_completion_response).chat.completions.create.return_value
+    mockAzureOpenAI = setup_mock_azure_openai_with_side_effects(
+        mocker=mocker,
+        chat_completion_response="",
+        chat_completion_finish_reason="tool_calls",
+        chat_completion_tool_calls=chat_completion_tools,
+        chat_completion_side_effect=[final_completion]
+    )
+    all_started = threading.Barrier(parties=2, timeout=5)
+
+    def search(search_query: str) -> list:
+        if search_query == "failing":
+            raise RuntimeError("search backend unavailable")
+        # the slow search only completes if the fast one runs at the same time
+        all_started.wait()
+        return []
+
+    smart_agent = Smart_Agent(
+        logger=mocker.Mock(),
+        client=mockAzureOpenAI,
+        agent_configuration=mocker.Mock(tools=[]),
+        search_vector_function=mocker.Mock(search=search),
+        fs=mocker.Mock(),
+        init_history=[],
+        batch_search=False
+    )
+
+    smart_agent_response: AgentResponse = smart_agent.run(user_input="Hello World")
+    tool_messages: List[dict] = [
+        message for message in smart_agent_response.conversation if isinstance(message, dict) and message.get("role") == "tool"]
+
+    assert smart_agent_response.response == chat_completion_response
+    assert [message["tool_call_id"] for message in tool_messages] == ["call_0", "call_1", "call_2"]
+    assert tool_messages[0]["content"] == []
+    assert "failed" in tool_messages[1]["content"]
+    assert tool_messages[2]["content"] == []
+
+
+def test_for_batched_search_calls(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that several search calls of one message are served by a single batched search"""
+    chat_completion_response: str = "Assistant Response"
+    search_queries: List[str] = ["first query", "second query"]
+    chat_completion_tools: List[ChatCompletionMessageToolCall] = [
+        ChatCompletionMessageToolCall(
+            id=f"call_{index}",
+            type="function",
+            function=Function(name="search", arguments=json.dumps({"search_query": search_query}))
+        ) for index, search_query in enumerate(search_queries)
+    ]
+    final_completion = setup_mock_azure_openai(
+        mocker=mocker, chat_completion_response=chat_completion_response).chat.completions.create.return_value
+    mockAzureOpenAI = setup_mock_azure_openai_with_side_effects(
+        mocker=mocker,
+        chat_completion_response="",
+        chat_completion_finish_reason="tool_calls",
+        chat_completion_tool_calls=chat_completion_tools,
+        chat_completion_side_effect=[final_completion]
+    )
+    search: Mock = mocker.Mock(return_value=[])
+    search_vector_function: Mock = mocker.Mock(
+        search=lambda search_query: search(search_query=search_query),
+        search_many=mocker.Mock(return_value=[[], []]))
+    smart_agent = Smart_Agent(
+        logger=mocker.Mock(),
+        client=mockAzureOpenAI,
+        agent_configuration=mocker.Mock(tools=[]),
+        search_vector_function=search_vector_function,
+        fs=mocker.Mock(),
+        init_history=[]
+    )
+
+    smart_agent_response: AgentResponse = smart_agent.run(user_input="Hello World")
+    tool_messages: List[dict] = [
+        message for message in smart_agent_response.conversation if isinstance(message, dict) and message.get("role") == "tool"]
+
+    search_vector_function.search_many.assert_called_once_with(queries=search_queries)
+    search.assert_not_called()
+    assert [message["tool_call_id"] for message in tool_messages] == ["call_0", "call_1"]
+
+def test_for_failed_batched_search_calls(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that the calls of a failed batched search are run one by one, so one bad query fails alone"""
+    chat_completion_tools: List[ChatCompletionMessageToolCall] = [
+        ChatCompletionMessageToolCall(
+            id=f"call_{index}",
+            type="function",
+            function=Function(name="search", arguments=json.dumps({"search_query": search_query}))
+        ) for index, search_query in enumerate(["first query", "failing", "second query"])
+    ]
+    final_completion = setup_mock_azure_openai(
+        mocker=mocker, chat_completion_response="Assistant Response").chat.completions.create.return_value
+
+    def search(search_query: str) -> list:
+        if search_query == "failing":
+            raise RuntimeError("search backend unavailable")
+        return []
+
+    async def asearch(search_query: str) -> list:
+        return search(search_query=search_query)
+
+    search_vector_function: Mock = mocker.Mock(
+        search=search,
+        asearch=asearch,
+        search_many=mocker.Mock(side_effect=RuntimeError("search backend unavailable")),
+        asearch_many=mocker.AsyncMock(side_effect=RuntimeError("search backend unavailable")))
+    for asynchronous in [False, True]:
+        mockAzureOpenAI = setup_mock_azure_openai_with_side_effects(
+            mocker=mocker,
+            chat_completion_response="",
+            chat_completion_finish_reason="tool_calls",
+            chat_completion_tool_calls=chat_completion_tools,
+            chat_completion_side_effect=[final_completion]
+        )
+        smart_agent = Smart_Agent(
+            logger=mocker.Mock(),
+            client=mockAzureOpenAI,
+            async_client=mocker.Mock(chat=mocker.Mock(completions=mocker.Mock(
+                create=mocker.AsyncMock(side_effect=mockAzureOpenAI.chat.completions.create.side_effect)))),
+            agent_configuration=mocker.Mock(tools=[]),
+            search_vector_function=search_vector_function,
+            fs=mocker.Mock(),
+            init_history=[]
+        )
+
+        smart_agent_response: AgentResponse = asyncio.run(
+            smart_agent.arun(user_input="Hello World")) if asynchronous else smart_agent.run(user_input="Hello World")
+        tool_messages: List[dict] = [
+            message for message in smart_agent_response.conversation
+            if isinstance(message, dict) and message.get("role") == "tool"]
+
+        assert smart_agent_response.response == "Assistant Response"
+        assert [message["content"] for message in tool_messages] == [
+            [], "The search function failed and returned no results.", []]
+    search_vector_function.search_many.assert_called_once()
+    search_vector_function.asearch_many.assert_awaited_once()
+
+def test_for_in_memory_search_images(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that images handed over by the search are not read back from the file system"""
+    chat_completion_tools: List[ChatCompletionMessageToolCall] = [
+        ChatCompletionMessageToolCall(
+            id="call_0",
+            type="function",
+            function=Function(name="search", arguments=json.dumps({"search_query": "query"}))
+        )
+    ]
+    final_completion = setup_mock_azure_openai(
+        mocker=mocker, chat_completion_response="Assistant Response").chat.completions.create.return_value
+    mockAzureOpenAI = setup_mock_azure_openai_with_side_effects(
+        mocker=mocker,
+        chat_completion_response="",
+        chat_completion_finish_reason="tool_calls",
+        chat_completion_tool_calls=chat_completion_tools,
+        chat_completion_side_effect=[final_completion]
+    )
+
+    def search(search_query: str) -> list:
+        return [{'id': '1', 'image_path': "file_1/page_1.png", 'related_content': "Hello World",
+                 'image_bytes': memoryview(b"image")}]
+
+    fs: Mock = mocker.Mock()
+    smart_agent = Smart_Agent(
+        logger=mocker.Mock(),
+        client=mockAzureOpenAI,
+        agent_configuration=mocker.Mock(tools=[]),
+        search_vector_function=mocker.Mock(search=search),
+        fs=fs,
+        init_history=[]
+    )
+
+    smart_agent_response: AgentResponse = smart_agent.run(user_input="Hello World")
+    tool_message: dict = next(
+        message for message in smart_agent_response.conversation if isinstance(message, dict) and message.get("role") == "tool")
+
+    sent_tool_message: dict = next(
+        message for message in mockAzureOpenAI.chat.completions.create.call_args.kwargs["messages"]
+        if isinstance(message, dict) and message.get("role") == "tool")
+    fs.read_bytes.assert_not_called()
+    assert tool_message["content"][1]["image_ref"] == {
+        "path": "file_1/page_1.png", "digest": hashlib.sha256(b"image").hexdigest(), "detail": "auto",
+        "size": len("data:image/png;base64,aW1hZ2U=")}
+    assert sent_tool_message["content"][1]["image_url"]["url"] == "data:image/png;base64,aW1hZ2U="
+
+def test_for_history_images_rehydrated_when_sent(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that the image references of the history are read, or downloaded, only to send them"""
+    def tool_message(page: int, data: bytes) -> dict:
+        return {"tool_call_id": f"call_{page}", "role": "tool", "name": "search", "content": [
+            {"type": "text", "text": f"file_name: images/file_1/page_{page}.png"},
+            {"type": "image_ref", "image_ref": {
+                "path": f"file_1/page_{page}.png", "digest": hashlib.sha256(data).hexdigest(), "detail": "low"}}]}
+
+    history: List[Any] = [
+        {"role": "user", "content": "First question"},
+        ChatCompletionMessage(role="assistant", content="", tool_calls=[
+            ChatCompletionMessageToolCall(id=f"call_{page}", type="function", function=Function(
+                name="search", arguments=json.dumps({"search_query": "query"}))) for page in [1, 2]]),
+        tool_message(page=1, data=b"first page"),
+        tool_message(page=2, data=b"second page"),
+        {"role": "assistant", "content": "First answer"},
+    ]
+    mockAzureOpenAI = setup_mock_azure_openai(mocker=mocker, chat_completion_response="Assistant Response")
+    def read_bytes(path: str) -> bytes:
+        # the second page was rendered on another worker
+        if path != "images/file_1/page_1.png":
+            raise FileNotFoundError(path)
+        return b"first page"
+
+    fs: Mock = mocker.Mock(read_bytes=mocker.Mock(side_effect=read_bytes))
+    search_vector_function: Mock = mocker.Mock()
+    search_vector_function.page_images.return_value = {"file_1/page_2.png": b"second page"}
+    smart_agent = Smart_Agent(
+        logger=mocker.Mock(),
+        client=mockAzureOpenAI,
+        agent_configuration=mocker.Mock(tools=[]),
+        search_vector_function=search_vector_function,
+        fs=fs,
+        init_history=history,
+        image_pipeline=ImagePipeline(),
+        context_builder=ContextBuilder(max_turns_with_images=2),
+    )
+
+    smart_agent_response: AgentResponse = smart_agent.run(user_input="Second question")
+
+    sent_images: List[dict] = [
+        part["image_url"] for message in mockAzureOpenAI.chat.completions.create.call_args.kwargs["messages"]
+        if isinstance(message, dict) and message.get("role") == "tool" for part in message["content"]
+        if part["type"] == "image_url"]
+    assert [image["url"] for image in sent_images] == [
+        "data:image/png;base64," + base64.b64encode(data).decode() for data in [b"first page", b"second page"]]
+    search_vector_function.page_images.assert_called_once_with(page_image_names=["file_1/page_2.png"])
+    assert any(message is history[2] for message in smart_agent_response.conversation)
+
+def test_for_history_images_rehydrated_through_the_retrieval_orchestrator(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that an agent searching with the orchestrator downloads missing history images through it"""
+    history: List[Any] = [
+        {"role": "user", "content": "First question"},
+        ChatCompletionMessage(role="assistant", content="", tool_calls=[
+            ChatCompletionMessageToolCall(id="call_1", type="function", function=Function(
+                name="search", arguments=json.dumps({"search_query": "query"})))]),
+        {"tool_call_id": "call_1", "role": "tool", "name": "search", "content": [
+            {"type": "text", "text": "file_name: images/file_1/page_1.png"},
+            {"type": "image_ref", "image_ref": {
+                "path": "file_1/page_1.png", "digest": hashlib.sha256(b"page").hexdigest(), "detail": "low"}}]},
+        {"role": "assistant", "content": "First answer"},
+    ]
+    mockAzureOpenAI = setup_mock_azure_openai(mocker=mocker, chat_completion_response="Assistant Response")
+    search_vector_function: Mock = mocker.Mock()
+    search_vector_function.page_images.return_value = {"file_1/page_1.png": b"page"}
+    smart_agent = Smart_Agent(
+        logger=mocker.Mock(),
+        client=mockAzureOpenAI,
+        agent_configuration=mocker.Mock(tools=[]),
+        search_vector_function=RetrievalOrchestrator(
+            logger=mocker.Mock(), search_vector_function=search_vector_function,
+            graph_index=GraphIndex.from_graph(nodes=[], edges=[])),
+        fs=mocker.Mock(read_bytes=mocker.Mock(side_effect=FileNotFoundError)),
+        init_history=history,
+        image_pipeline=ImagePipeline(),
+        context_builder=ContextBuilder(max_turns_with_images=2),
+    )
+
+    smart_agent.run(user_input="Second question")
+
+    sent_images: List[str] = [
+        part["image_url"]["url"] for message in mockAzureOpenAI.chat.completions.create.call_args.kwargs["messages"]
+        if isinstance(message, dict) and message.get("role") == "tool" for part in message["content"]
+        if part["type"] == "image_url"]
+    assert sent_images == ["data:image/png;base64," + base64.b64encode(b"page").decode()]
+    search_vector_function.page_images.assert_called_once_with(page_image_names=["file_1/page_1.png"])
+
+def chat_completion_chunk(
+        delta: ChoiceDelta, finish_reason: Literal["stop", "tool_calls"] | None = None) -> ChatCompletionChunk:
+    return ChatCompletionChunk(
+        id="foo",
+        model="gpt-4",
+        object="chat.completion.chunk",
+        choices=[ChunkChoice(index=0, delta=delta, finish_reason=finish_reason)],
+        created=int(datetime.now().timestamp())
+    )
+
+def test_for_streamed_response(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that a tool iteration is reported as progress and the answer is streamed token by token"""
+    tool_call_chunks: List[ChatCompletionChunk] = [
+        chat_completion_chunk(delta=ChoiceDelta(tool_calls=[ChoiceDeltaToolCall(
+            index=0, id="call_0", function=ChoiceDeltaToolCallFunction(name="search", arguments="{\"search_query\""))])),
+        chat_completion_chunk(delta=ChoiceDelta(tool_calls=[ChoiceDeltaToolCall(
+            index=0, function=ChoiceDeltaToolCallFunction(arguments=": \"query\"}"))])),
+    ]
+    answer_chunks: List[ChatCompletionChunk] = [
+        chat_completion_chunk(delta=ChoiceDelta(content=content)) for content in ["Assistant", " Response"]]
+    mockAzureOpenAI: Mock = mocker.Mock(target=AzureOpenAI)
+    mockAzureOpenAI.chat.completions.create.side_effect = [iter(tool_call_chunks), iter(answer_chunks)]
+    search: Mock = mocker.Mock(return_value=[])
+    smart_agent = Smart_Agent(
+        logger=mocker.Mock(),
+        client=mockAzureOpenAI,
+        agent_configuration=mocker.Mock(tools=[]),
+        search_vector_function=mocker.Mock(search=lambda search_query: search(search_query=search_query)),
+        fs=mocker.Mock(),
+        init_history=[]
+    )
+
+    events: List[dict] = list(smart_agent.stream(user_input="Hello World"))
+
+    assert events == [
+        {"type": "progress", "iteration": 1, "tool_calls": [{"name": "search", "arguments": "{\"search_query\": \"query\"}"}]},
+        {"type": "token", "content": "Assistant"},
+        {"type": "token", "content": " Response"},
+    ]
+    search.assert_called_once_with(search_query="query")
+    assert mockAzureOpenAI.chat.completions.create.call_args.kwargs["stream"] is True
+
+def test_for_streamed_preamble_before_tool_call(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that text the model streams before calling a tool is not sent as part of the answer"""
+    tool_call_chunks: List[ChatCompletionChunk] = [
+        chat_completion_chunk(delta=ChoiceDelta(content="Let me search")),
+        chat_completion_chunk(delta=ChoiceDelta(tool_calls=[ChoiceDeltaToolCall(
+            index=0, id="call_0", function=ChoiceDeltaToolCallFunction(name="search", arguments="{\"search_query\": \"query\"}"))])),
+        chat_completion_chunk(delta=ChoiceDelta(), finish_reason="tool_calls"),
+    ]
+    answer_chunks: List[ChatCompletionChunk] = [
+        chat_completion_chunk(delta=ChoiceDelta(content="Assistant")),
+        chat_completion_chunk(delta=ChoiceDelta(content=" Response"), finish_reason="stop"),
+    ]
+    mockAzureOpenAI: Mock = mocker.Mock(target=AzureOpenAI)
+    mockAzureOpenAI.chat.completions.create.side_effect = [iter(tool_call_chunks), iter(answer_chunks)]
+    smart_agent = Smart_Agent(
+        logger=mocker.Mock(),
+        client=mockAzureOpenAI,
+        agent_configuration=mocker.Mock(tools=[]),
+        functions_spec=[{"type": "function", "function": {"name": "search", "parameters": {}}}],
+        search_vector_function=mocker.Mock(search=mocker.Mock(return_value=[])),
+        fs=mocker.Mock(),
+        init_history=[]
+    )
+
+    events: List[dict] = list(smart_agent.stream(user_input="Hello World"))
+
+    assert [event["content"] for event in events if event["type"] == "token"] == ["Assistant", " Response"]
+    assert events[0]["type"] == "progress"
+    assert smart_agent.current_turn()[-1] == {"role": "assistant", "content": "Assistant Response"}
+
+def test_for_current_turn(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that the agent continues the persisted turns and reports the turn it answered"""
+    previous_turn: List[dict] = [
+        {"role": "user", "content": "Previous question"}, {"role": "assistant", "content": "Previous answer"}]
+    mockAzureOpenAI = setup_mock_azure_openai(mocker=mocker, chat_completion_response="Assistant Response")
+    smart_agent = Smart_Agent(
+        logger=mocker.Mock(),
+        client=mockAzureOpenAI,
+        agent_configuration=mocker.Mock(tools=[], persona="Persona", initial_message=None),
+        search_vector_function=mocker.Mock(),
+        fs=mocker.Mock(),
+        init_history=list(previous_turn)
+    )
+
+    assert smart_agent.current_turn() == []
+    smart_agent_response: AgentResponse = smart_agent.run(user_input="Hello World")
+
+    assert smart_agent_response.conversation[0] == {"role": "system", "content": "Persona"}
+    assert smart_agent_response.conversation[1:3] == previous_turn
+    assert smart_agent.current_turn() == [
+        {"role": "user", "content": "Hello World"}, {"role": "assistant", "content": "Assistant Response"}]
+
+def test_for_cached_answer(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that a first question already answered is served from the answer cache without a completion"""
+    answer_cache = SemanticAnswerCache()
+    search_vector_function = mocker.Mock(embed=mocker.Mock(return_value=[1.0, 0.0]))
+    agent_configuration = mocker.Mock(tools=[], persona="Persona", initial_message=None)
+    answers: List[AgentResponse] = []
+    for _ in range(2):
+        mockAzureOpenAI = setup_mock_azure_openai(mocker=mocker, chat_completion_response="Assistant Response")
+        smart_agent = Smart_Agent(
+            logger=mocker.Mock(),
+            client=mockAzureOpenAI,
+            agent_configuration=agent_configuration,
+            search_vector_function=search_vector_function,
+            fs=mocker.Mock(),
+            init_history=[],
+            answer_cache=answer_cache,
+            answer_cache_version="1",
+        )
+        answers.append(smart_agent.run(user_input="Hello World"))
+
+    assert [answer.response for answer in answers] == ["Assistant Response", "Assistant Response"]
+    mockAzureOpenAI.chat.completions.create.assert_not_called()
+    assert smart_agent.current_turn() == [
+        {"role": "user", "content": "Hello World"}, {"role": "assistant", "content": "Assistant Response"}]
+
+def test_for_answers_cached_per_registered_configuration(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that two configurations with the same yaml name do not serve each other's answers"""
+    answer_cache = SemanticAnswerCache()
+    search_vector_function = mocker.Mock(embed=mocker.Mock(return_value=[1.0, 0.0]))
+    agent_configuration = mocker.Mock(tools=[], persona="Persona", initial_message=None)
+    agent_configuration.name = "assistant"
+    answers: List[str] = []
+    for agent_name, response in [("sales", "Sales Answer"), ("support", "Support Answer"), ("sales", "Other Answer")]:
+        smart_agent = Smart_Agent(
+            logger=mocker.Mock(),
+            client=setup_mock_azure_openai(mocker=mocker, chat_completion_response=response),
+            agent_configuration=agent_configuration,
+            search_vector_function=search_vector_function,
+            fs=mocker.Mock(),
+            init_history=[],
+            answer_cache=answer_cache,
+            answer_cache_version="1",
+            answer_cache_namespace=agent_name,
+        )
+        answers.append(smart_agent.run(user_input="Hello World").response)
+
+    assert answers == ["Sales Answer", "Support Answer", "Sales Answer"]
+    assert answer_cache.stats == {
+        "sales": {"hits": 1, "misses": 0, "entries": 1}, "support": {"hits": 0, "misses": 0, "entries": 1}}
+
+def test_for_graph_search_tool(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that the graph tool is offered and called only when the agent has a graph"""
+    tool_calls: List[ChatCompletionMessageToolCall] = [ChatCompletionMessageToolCall(
+        id="graph", type="function", function=Function(name="graph_search", arguments="{\"entity\": \"Contoso\"}"))]
+    mockAzureOpenAI = setup_mock_azure_openai_with_side_effects(
+        mocker=mocker,
+        chat_completion_response="",
+        chat_completion_finish_reason="tool_calls",
+        chat_completion_tool_calls=tool_calls,
+        chat_completion_side_effect=[ChatCompletion(
+            id="answer", model="gpt-4", object="chat.completion", created=int(datetime.now().timestamp()),
+            choices=[Choice(finish_reason="stop", index=0, message=ChatCompletionMessage(content="Answer", role="assistant"))])])
+    functions_spec: List[dict] = [
+        {"type": "function", "function": {"name": name, "parameters": {}}} for name in ["search", "graph_search"]]
+    graph_search_function = GraphSearchFunction(logger=mocker.Mock(), graph_index=GraphIndex.from_graph(
+        nodes=[{"id": "contoso", "type": "Brand", "name": "Contoso"}, {"id": "cold-brew", "type": "Product", "name": "Cold Brew"}],
+        edges=[{"source": "contoso", "target": "cold-brew", "relation": "has_product"}]))
+    smart_agent = Smart_Agent(
+        logger=mocker.Mock(),
+        client=mockAzureOpenAI,
+        agent_configuration=mocker.Mock(tools=[], persona="Persona", initial_message=None),
+        search_vector_function=mocker.Mock(),
+        fs=mocker.Mock(),
+        init_history=[],
+        functions_spec=functions_spec,
+        graph_search_function=graph_search_function,
+    )
+    without_graph = Smart_Agent(
+        logger=mocker.Mock(),
+        client=mockAzureOpenAI,
+        agent_configuration=mocker.Mock(tools=[], persona="Persona", initial_message=None),
+        search_vector_function=mocker.Mock(),
+        fs=mocker.Mock(),
+        init_history=[],
+        functions_spec=functions_spec,
+    )
+
+    smart_agent_response: AgentResponse = smart_agent.run(user_input="Hello World")
+
+    assert smart_agent_response.conversation[-2]["content"] == "Contoso --has_product--> Cold Brew (Product)"
+    assert [tool["function"]["name"] for tool in mockAzureOpenAI.chat.completions.create.call_args.kwargs["tools"]] == [
+        "search", "graph_search"]
+    assert [tool["function"]["name"] for tool in without_graph._Smart_Agent__functions_spec] == ["search"]
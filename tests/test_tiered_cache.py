@@ -0,0 +1,93 @@
+import asyncio
+from typing import Any, Dict, List
+import pytest_mock
+from unittest.mock import Mock
+from distributedcache import LocalCache, RedisCache, TieredCache
+
+def setup_shared_cache(mocker: pytest_mock.MockerFixture) -> Mock:
+    store: Dict[str, Any] = {}
+
+    def pipeline(transaction: bool = True) -> Mock:
+        commands: List[Any] = []
+        return mocker.Mock(
+            get=mocker.Mock(side_effect=lambda name: commands.append(lambda: store.get(name))),
+            set=mocker.Mock(side_effect=lambda name, value, ex=None: commands.append(lambda: store.__setitem__(name, value))),
+            execute=mocker.Mock(side_effect=lambda: [command() for command in commands]),
+        )
+
+    return mocker.Mock(
+        get=mocker.Mock(side_effect=lambda name: store.get(name)),
+        set=mocker.Mock(side_effect=lambda name, value, ex=None: store.__setitem__(name, value)),
+        delete=mocker.Mock(side_effect=lambda *names: sum(store.pop(name, None) is not None for name in names)),
+        pipeline=mocker.Mock(side_effect=pipeline),
+    )
+
+def test_local_cache_evicts_and_expires() -> None:
+    """Test that the in-process cache keeps its most recently used entries until they expire"""
+    local_cache = LocalCache(max_entries=2)
+    local_cache.set(name="first", value=b"1")
+    local_cache.set(name="second", value=b"2")
+    local_cache.get(name="first")
+    local_cache.set(name="third", value=b"3")
+
+    assert local_cache.get_many(names=["first", "second", "third"]) == [b"1", None, b"3"]
+    assert local_cache.set(name="first", value=b"5", nx=True) is None
+    assert local_cache.set(name="second", value=b"6", xx=True) is None
+    assert local_cache.get(name="first") == b"1"
+    local_cache.set(name="first", value=b"7", ex=0)
+    assert local_cache.get(name="first") is None
+
+def test_other_worker_is_served_from_the_shared_tier_in_one_round_trip(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that batches go through one pipeline and shared hits fill the in-process tier"""
+    shared_cache: Mock = setup_shared_cache(mocker=mocker)
+    TieredCache(shared=RedisCache(client=shared_cache)).set_many(mapping={"embedding:a": b"a", "embedding:b": b"b"})
+    other_worker = TieredCache(shared=RedisCache(client=shared_cache))
+
+    assert other_worker.get_many(names=["embedding:a", "embedding:b", "search:c"]) == [b"a", b"b", None]
+    assert other_worker.get_many(names=["embedding:a", "embedding:b"]) == [b"a", b"b"]
+    assert shared_cache.pipeline.call_count == 2
+    shared_cache.get.assert_not_called()
+    assert other_worker.stats["embedding"]["shared_hits"] == 2
+    assert other_worker.stats["embedding"]["local_hits"] == 2
+    assert other_worker.stats["search"]["misses"] == 1
+
+def test_missing_values_are_loaded_once(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that a key the loader cannot find is not loaded again while it is remembered as missing"""
+    tiered_cache = TieredCache(shared=RedisCache(client=setup_shared_cache(mocker=mocker)))
+    load: Mock = mocker.Mock(return_value=None)
+
+    assert tiered_cache.get_or_load(name="page:missing", load=load) is None
+    assert tiered_cache.get_or_load(name="page:missing", load=load) is None
+    assert tiered_cache.get(name="page:missing") is None
+
+    load.assert_called_once()
+    assert tiered_cache.stats["page"]["negative_hits"] == 2
+
+def test_concurrent_loads_share_one_call() -> None:
+    """Test that concurrent misses for the same key wait for a single load"""
+    tiered_cache = TieredCache()
+    calls: List[str] = []
+
+    async def load() -> bytes:
+        calls.append("load")
+        await asyncio.sleep(0.01)
+        return b"value"
+
+    async def load_concurrently() -> List[Any]:
+        return await asyncio.gather(*[tiered_cache.aget_or_load(name="search:key", load=load) for _ in range(5)])
+
+    assert asyncio.run(load_concurrently()) == [b"value"] * 5
+    assert calls == ["load"]
+    assert tiered_cache.stats["search"]["shared_loads"] == 4
+
+def test_shared_tier_errors_count_as_misses(mocker: pytest_mock.MockerFixture) -> None:
+    """Test that an unreachable Redis degrades to the in-process tier"""
+    shared_cache: Mock = mocker.Mock(get=mocker.Mock(side_effect=ConnectionError("down")),
+                                     set=mocker.Mock(side_effect=ConnectionError("down")))
+    tiered_cache = TieredCache(shared=RedisCache(client=shared_cache), logger=mocker.Mock())
+
+    assert tiered_cache.get(name="history:session") is None
+    tiered_cache.set(name="history:session", value=b"turn")
+
+    assert tiered_cache.get(name="history:session") == b"turn"
+    assert tiered_cache.stats["history"]["errors"] == 2
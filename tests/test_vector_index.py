@@ -0,0 +1,70 @@
+from pathlib import Path
+from typing import Any, Dict, List
+import numpy as np
+import pytest
+import pytest_mock
+from functions import SearchVectorFunction, VectorIndex
+
+def documents() -> List[Dict[str, Any]]:
+    return [
+        {"topic": "brand", "file_name": "Brand_Context", "page_number": page, "related_content": f"page {page}",
+         "contentVector": vector}
+        for page, vector in enumerate([[1.0, 0.0, 0.0], [0.6, 0.8, 0.0], [0.0, 0.0, 2.0], [0.8, 0.6, 0.0]])]
+
+def test_top_k_pages_are_returned_most_similar_first() -> None:
+    """Test that the k most similar pages are returned in order, shaped like search results"""
+    vector_index: VectorIndex = VectorIndex.from_documents(documents=documents())
+
+    results: List[Dict[str, Any]] = vector_index.search(vector=[2.0, 0.0, 0.0], k=3)
+
+    assert [result["page_number"] for result in results] == [0, 3, 1]
+    assert results[0] == {
+        "topic": "brand", "file_name": "Brand_Context", "page_number": 0, "related_content": "page 0",
+        "@search.score": 1.0}
+    assert [result["page_number"] for result in vector_index.search(vector=[0.0, 0.0, 1.0], k=10)][0] == 2
+
+def test_embeddings_given_to_the_constructor_are_normalized() -> None:
+    """Test that an index built from raw vectors ranks by cosine similarity, not by dot product"""
+    vector_index = VectorIndex(
+        embeddings=np.array([[10.0, 10.0], [1.0, 0.0], [0.0, 0.0]]),
+        metadata={"page_number": np.array([0, 1, 2])})
+
+    results: List[Dict[str, Any]] = vector_index.search(vector=[1.0, 0.0], k=3)
+
+    assert [result["page_number"] for result in results] == [1, 0, 2]
+    assert [result["@search.score"] for result in results] == pytest.approx([1.0, 2 ** -0.5, 0.0])
+
+def test_saved_index_is_memory_mapped_on_load(tmp_path: Path) -> None:
+    """Test that a saved index loads with mapped embeddings and returns the same results"""
+    vector_index: VectorIndex = VectorIndex.from_documents(documents=documents(), index_name="pages")
+    vector_index.save(directory=str(tmp_path))
+
+    loaded: VectorIndex = VectorIndex.load(directory=str(tmp_path))
+
+    assert isinstance(np.load(tmp_path / "embeddings.npy", mmap_mode="r"), np.memmap)
+    # the saved embeddings are already normalized, so they are not copied out of the mapping
+    assert isinstance(loaded._VectorIndex__embeddings.base, np.memmap)
+    assert loaded.index_name == "pages"
+    assert len(loaded) == 4
+    assert loaded.search(vector=[0.0, 1.0, 0.0], k=2) == vector_index.search(vector=[0.0, 1.0, 0.0], k=2)
+
+def test_search_vector_function_searches_the_local_index(mocker: pytest_mock.MockerFixture, tmp_path: Path) -> None:
+    """Test that the agent's search returns the usual output from a local index, without Azure AI Search"""
+    client = mocker.Mock(embeddings=mocker.Mock(create=mocker.Mock(return_value=mocker.Mock(
+        data=[mocker.Mock(index=0, embedding=[0.0, 0.0, 1.0])]))))
+    container_client = mocker.Mock()
+    container_client.get_blob_client.return_value.download_blob.return_value.readall.return_value = b"image"
+    search_vector_function = SearchVectorFunction(
+        logger=mocker.Mock(),
+        search_client=None,
+        client=client,
+        model="embedding",
+        image_directory=str(tmp_path),
+        container_client=container_client,
+        retriever=VectorIndex.from_documents(documents=documents()),
+    )
+
+    output: List[Dict[str, Any]] = search_vector_function.search(search_query="query")
+
+    assert output[0] == {"id": None, "image_path": "Brand_Context/page_2.png", "related_content": "page 2"}
+    assert len(output) == 3